@@ -0,0 +1,83 @@
+"""Benchmarks the comparison of many titulos over the full date range, against
+reading the history of each titulo in turn.
+
+The id lists are synthetic: random samples of the ids in the database, so the
+categories repeat as they do in real comparisons. Requires a populated database
+(see start-db.sh).
+"""
+
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.services import TituloTesouroCRUD
+
+try:
+    from timing import measure
+except ImportError:
+    from benchmarks.timing import measure
+
+
+def sample_ids(crud, size, seed):
+    with crud.pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT id FROM tesouro_direto_series ORDER BY id')
+        ids = [res[0] for res in cur.fetchall()]
+
+    assert len(ids) >= size, 'The database has only {} ids.'.format(len(ids))
+    return random.Random(seed).sample(ids, size)
+
+
+def benchmark(sizes, iterations, group_by, seed):
+    crud = TituloTesouroCRUD()
+    params = {'group_by': 'true' if group_by else 'false'}
+
+    results = list()
+
+    for size in sizes:
+        ids = [str(_id) for _id in sample_ids(crud, size, seed)]
+
+        def run_compare():
+            crud.compare(dict(params, ids=ids))
+
+        def run_one_by_one():
+            for _id in ids:
+                crud.read_history(_id, params)
+
+        run_compare()
+
+        results.append({
+            'ids': size,
+            'periods': len(crud.compare(dict(params, ids=ids))),
+            'compare': measure(run_compare, iterations),
+            'one_by_one': measure(run_one_by_one, iterations)
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='2,10,100,500,1000', help='comma separated sizes of the id lists.')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--group-by', action='store_true', help='compares the sums by year.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = benchmark(sizes, args.iterations, args.group_by, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print('{:>8}{:>10}{:>16}{:>16}{:>16}'.format('ids', 'periods', 'compare (ms)', 'p95 (ms)',
+                                                     'one by one (ms)'))
+        for result in results:
+            print('{:>8}{:>10}{:>16.3f}{:>16.3f}{:>16.3f}'.format(
+                result['ids'], result['periods'], result['compare']['mean_ms'], result['compare']['p95_ms'],
+                result['one_by_one']['mean_ms']))
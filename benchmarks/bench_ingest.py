@@ -0,0 +1,144 @@
+"""Compares the readers of the input data on the same rows: "stream_xlsx" (the
+worksheet in read-only mode) and "stream_csv" (the worksheet saved as CSV,
+memory-mapped and parsed in chunks).
+
+A workbook and a CSV file are written with the layout of the input data and
+"--months" months of every series, from 2002-01 on, and each reader parses them
+"--runs" times. With "--load", the rows read are also copied into the database
+(dropped and created again before each run), timing the whole ingest.
+"""
+
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import openpyxl
+
+from src.basics import RESOURCES_PATH, TITULO_TESOURO_CATEGORIES
+from src.system_loader import drop_database, create_database, stream_xlsx, stream_csv
+from src.system_loader import copy_into_database
+
+
+LABELS = ['Nome da série:\xa0{} - Tesouro Direto - {}'.format(action, category)
+          for action in ['Vendas', 'Resgates'] for category in TITULO_TESOURO_CATEGORIES]
+
+
+def table(months, seed):
+    """Yields the rows of the worksheet of the input data, with "months" months.
+    """
+    rand = random.Random(seed)
+
+    for _ in range(6):
+        yield [None] * (len(LABELS) + 2)
+    yield ['Nº', 'Período'] + LABELS
+    yield [None, None] + ['Periodicidade:\xa0Mensal'] * len(LABELS)
+    yield [None, None] + ['Fonte:\xa0Tesouro Nacional'] * len(LABELS)
+    yield [None, None] + ['Unidade:\xa0R$ (milhões)'] * len(LABELS)
+    yield [None, None] + ['Data de atualização:\xa002/09/2011'] * len(LABELS)
+
+    for i in range(months):
+        date = datetime.datetime(2002 + i // 12, i % 12 + 1, 1)
+        yield [i + 1, date] + [round(rand.uniform(0, 1000), 2) for _ in LABELS]
+
+
+def write_files(directory, months, seed):
+    xlsx_path = os.path.join(directory, 'bench-ingest.xlsx')
+    csv_path = os.path.join(directory, 'bench-ingest.csv')
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Planilha1')
+    for row in table(months, seed):
+        worksheet.append(row)
+    workbook.save(xlsx_path)
+
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for row in table(months, seed):
+            writer.writerow(['' if value is None else value.strftime('%Y-%m-%d') if isinstance(value, datetime.datetime)
+                             else value for value in row])
+
+    # the readers take paths relative to the resources directory
+    return (os.path.relpath(xlsx_path, RESOURCES_PATH), os.path.relpath(csv_path, RESOURCES_PATH))
+
+
+def bench_reader(name, stream, size, runs, load):
+    timings = list()
+    for _ in range(runs):
+        if load:
+            drop_database(verbose=False)
+            create_database(verbose=False)
+
+        start = time.perf_counter()
+        if load:
+            rows = copy_into_database(stream(), verbose=False)
+        else:
+            rows = sum([1 for _ in stream()])
+        timings.append(time.perf_counter() - start)
+
+    seconds = statistics.median(timings)
+    return {
+        'name': name,
+        'bytes': size,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds
+    }
+
+
+def benchmark(months, seed, runs, load, chunk_mb):
+    with tempfile.TemporaryDirectory() as directory:
+        (xlsx_filename, csv_filename) = write_files(directory, months, seed)
+        xlsx_size = os.path.getsize(os.path.join(RESOURCES_PATH, xlsx_filename))
+        csv_size = os.path.getsize(os.path.join(RESOURCES_PATH, csv_filename))
+
+        rows = list(stream_xlsx(xlsx_filename, verbose=False))
+        assert rows == list(stream_csv(csv_filename, verbose=False)), 'The readers do not give the same rows.'
+
+        readers = [
+            ('stream_xlsx', lambda: stream_xlsx(xlsx_filename, verbose=False), xlsx_size),
+            ('stream_csv', lambda: stream_csv(csv_filename, chunk_mb * 1024 * 1024, verbose=False), csv_size)
+        ]
+
+        return {
+            'months': months,
+            'load': load,
+            'readers': [bench_reader(name, stream, size, runs, load) for (name, stream, size) in readers]
+        }
+
+
+def print_results(results):
+    print('{} months of {} series{}.'.format(results['months'], len(LABELS),
+                                             ', copied into the database' if results['load'] else ''))
+    print('\n{:<24}{:>12}{:>12}{:>12}{:>14}'.format('reader', 'MB', 'rows', 'seconds', 'rows/s'))
+    for result in results['readers']:
+        print('{:<24}{:>12.1f}{:>12}{:>12.3f}{:>14.0f}'.format(result['name'], result['bytes'] / 1024 / 1024,
+                                                              result['rows'], result['seconds'],
+                                                              result['rows_per_second']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--months', type=int, default=6000, help='months in the files (at most 95976).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--runs', type=int, default=3, help='runs per reader (the median is reported).')
+    parser.add_argument('--chunk-mb', type=int, default=16, help='megabytes per chunk of the CSV reader.')
+    parser.add_argument('--load', action='store_true', help='also copies the rows into the database.')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    results = benchmark(args.months, args.seed, args.runs, args.load, args.chunk_mb)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
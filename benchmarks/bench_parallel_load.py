@@ -0,0 +1,79 @@
+"""Measures the bulk load of the archive loader ("load_rows" in module
+"archive_loader") by 1, 2, 4, ... concurrent connections, against a single
+"copy_into_database", on the same "--rows" synthetic rows (every category and
+action, from 2100 on). The database is dropped and created again before each
+run, so run it against a database that is not serving requests.
+
+The speedup is bound by the cores available to PostgreSQL: the connections
+only write at the same time if the server has a core for each.
+"""
+
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.archive_loader import load_rows
+from src.system_loader import drop_database, create_database, copy_into_database
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_services import synthetic_rows
+
+
+def bench_load(name, load, rows, runs):
+    timings = list()
+    for _ in range(runs):
+        drop_database(verbose=False)
+        create_database(verbose=False)
+
+        start = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - start)
+
+    seconds = statistics.median(timings)
+    return {'name': name, 'seconds': seconds, 'rows_per_second': len(rows) / seconds}
+
+
+def benchmark(count, seed, connections, runs):
+    rows = list(synthetic_rows(count, seed))
+
+    results = [bench_load('copy_into_database', lambda: copy_into_database(rows, verbose=False), rows, runs)]
+    for n in connections:
+        results.append(bench_load('load_rows, {} connections'.format(n), lambda: load_rows(rows, n), rows, runs))
+
+    for result in results:
+        result['speedup'] = results[0]['seconds'] / result['seconds']
+
+    return {'rows': len(rows), 'cpus': os.cpu_count(), 'loads': results}
+
+
+def print_results(results):
+    print('{} rows, {} CPUs.'.format(results['rows'], results['cpus']))
+    print('\n{:<32}{:>12}{:>14}{:>10}'.format('load', 'seconds', 'rows/s', 'speedup'))
+    for result in results['loads']:
+        print('{:<32}{:>12.2f}{:>14.0f}{:>9.2f}x'.format(result['name'], result['seconds'],
+                                                       result['rows_per_second'], result['speedup']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--connections', default='1,2,4,8', help='comma separated numbers of connections.')
+    parser.add_argument('--runs', type=int, default=3, help='runs per load (the median is reported).')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    connections = [int(n) for n in args.connections.split(',') if n]
+    results = benchmark(args.rows, args.seed, connections, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
@@ -0,0 +1,164 @@
+"""Compares the layouts of "tesouro_direto_series" (see module "partitions") on a
+large history: for each one, the database is created with it and seeded with
+the input data plus "--synthetic-rows" rows from 2100 on, timing the load, and
+then the queries on the series are executed prepared over a window of
+"--window-years" years, reporting their timings and how many tables (partitions)
+each one scans after pruning.
+
+The database is dropped and created again for each layout, so run it against a
+database that is not serving requests; it is left with the last layout.
+"""
+
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import psycopg2
+
+from src.basics import DATABASE_PARAMS, TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS, to_period
+from src.database import PreparedStatementConnection
+from src.partitions import PartitionLayout
+from src.queries import load_queries
+from src.system_loader import drop_database, create_database, stream_xlsx, copy_into_database
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_services import synthetic_rows
+from timing import measure
+
+
+LAYOUTS = ['none', 'category', 'period', 'category,period']
+
+QUERIES = ['read-history', 'read-by-action', 'compare', 'get-category', 'get-period']
+
+
+def last_year(synthetic):
+    # the year of the last synthetic row, so none of them goes to the default
+    # partition
+    months = synthetic // (len(TITULO_TESOURO_CATEGORIES) * len(TITULO_TESOURO_ACTIONS)) + 1
+    return 2100 + months // 12
+
+
+def seed(layout, filename, synthetic, seed):
+    drop_database(verbose=False)
+    create_database(verbose=False, layout=layout)
+
+    start = time.perf_counter()
+    rows = copy_into_database(itertools.chain(stream_xlsx(filename, verbose=False), synthetic_rows(synthetic, seed)),
+                              verbose=False, layout=layout)
+    seconds = time.perf_counter() - start
+
+    return {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds}
+
+
+def query_params(cur, start_year, window_years):
+    cur.execute("SELECT min(id) FROM tesouro_direto_series WHERE category = 'NTN-B'")
+    titulo_id = cur.fetchall()[0][0]
+    cur.execute('SELECT min(id) FROM tesouro_direto_series GROUP BY category ORDER BY category')
+    compare_ids = [res[0] for res in cur.fetchall()]
+
+    start_period = to_period(start_year, 1)
+    end_period = to_period(start_year + window_years - 1, 12)
+
+    return {
+        'read-history': ('NTN-B', start_period, end_period, None),
+        'read-by-action': ('VENDA', 'NTN-B', start_period, end_period, None),
+        'compare': (compare_ids, start_period, end_period),
+        'get-category': (titulo_id,),
+        'get-period': (titulo_id,)
+    }
+
+
+def scanned_tables(plan):
+    """Returns the tables scanned by the plan (as by "EXPLAIN (FORMAT JSON)"),
+    the partitions pruned at planning or at execution start left out.
+    """
+    tables = set([plan['Relation Name']]) if 'Relation Name' in plan else set()
+    for subplan in plan.get('Plans', []):
+        tables |= scanned_tables(subplan)
+
+    return tables
+
+
+def bench_queries(start_year, window_years, iterations):
+    queries = load_queries(QUERIES)
+
+    conn = psycopg2.connect(connection_factory=PreparedStatementConnection, **DATABASE_PARAMS)
+    cur = conn.cursor()
+    params = query_params(cur, start_year, window_years)
+
+    results = list()
+    for name in QUERIES:
+        def run():
+            conn.execute_prepared(cur, name, queries[name], params[name])
+            cur.fetchall()
+
+        run()
+        rows = cur.rowcount
+
+        # warmed up, so the plan is the one the service uses
+        placeholders = ', '.join(['%s'] * len(params[name]))
+        cur.execute('EXPLAIN (FORMAT JSON) EXECUTE "{}" ({})'.format(name, placeholders), params[name])
+        tables = scanned_tables(cur.fetchall()[0][0][0]['Plan'])
+
+        results.append(dict(name=name, rows=rows, tables=len(tables), **measure(run, iterations, unit='us')))
+
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+    return results
+
+
+def benchmark(filename, synthetic, seed_value, years, start_year, window_years, iterations):
+    results = list()
+    for partitioning in LAYOUTS:
+        layout = PartitionLayout('' if partitioning == 'none' else partitioning, years, last_year(synthetic))
+        results.append({
+            'layout': partitioning,
+            'partitions': len(list(layout.partitions())),
+            'load': seed(layout, filename, synthetic, seed_value),
+            'queries': bench_queries(start_year, window_years, iterations)
+        })
+
+    return results
+
+
+def print_results(results):
+    for result in results:
+        load = result['load']
+        print('\nlayout "{}" ({} partitions): {} rows loaded in {:.2f} s ({:.0f} rows/s)'.format(
+            result['layout'], result['partitions'], load['rows'], load['seconds'], load['rows_per_second']))
+
+        print('{:<24}{:>10}{:>10}{:>14}{:>14}{:>14}'.format('query', 'rows', 'tables', 'mean (us)', 'p50 (us)',
+                                                            'p95 (us)'))
+        for query in result['queries']:
+            print('{:<24}{:>10}{:>10}{:>14.2f}{:>14.2f}{:>14.2f}'.format(
+                query['name'], query['rows'], query['tables'], query['mean_us'], query['p50_us'], query['p95_us']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--filename', default='input-data.xlsx', help='xlsx file seeded, relative to resources.')
+    parser.add_argument('--synthetic-rows', type=int, default=1000000, help='rows seeded besides the input data.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--partition-years', type=int, default=10, help='years per partition by period.')
+    parser.add_argument('--start-year', type=int, default=2005, help='first year of the window read.')
+    parser.add_argument('--window-years', type=int, default=10, help='years in the window read.')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per query.')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    results = benchmark(args.filename, args.synthetic_rows, args.seed, args.partition_years, args.start_year,
+                        args.window_years, args.iterations)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
@@ -0,0 +1,110 @@
+"""Benchmarks the read queries executed as literal SQL, parsed and planned on
+every call (as the former str.format templates were), against server-side
+prepared statements.
+
+Requires a populated database (see start-db.sh).
+"""
+
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import psycopg2
+
+from src.basics import DATABASE_PARAMS, to_period
+from src.database import PreparedStatementConnection
+from src.services import TituloTesouroCRUD
+
+try:
+    from timing import measure
+except ImportError:
+    from benchmarks.timing import measure
+
+
+START_PERIOD = 0
+END_PERIOD = to_period(2017, 12)
+
+READ_QUERIES = [
+    ('get-category', (1488,)),
+    ('read-history', ('NTN-F', START_PERIOD, END_PERIOD, None)),
+    ('read-history-grouped', ('NTN-F', START_PERIOD, END_PERIOD, None)),
+    ('read-by-action', ('VENDA', 'LTN', START_PERIOD, END_PERIOD, None)),
+    ('read-by-action-grouped', ('VENDA', 'LTN', START_PERIOD, END_PERIOD, None))
+]
+
+
+def literal_sql(cur, sql, params):
+    """Fills the placeholders client-side, producing a distinct statement text
+    for each combination of parameters.
+    """
+    sql = re.sub(r'\$(\d+)', lambda match: '%({})s'.format(match.group(1)), sql.replace('%', '%%'))
+    return cur.mogrify(sql, {str(i + 1): param for (i, param) in enumerate(params)}).decode('utf8')
+
+
+def planning_time(cur, sql):
+    cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) {}'.format(sql))
+    return cur.fetchall()[0][0][0]['Planning Time']
+
+
+def benchmark(iterations):
+    queries = TituloTesouroCRUD().queries
+
+    conn = psycopg2.connect(connection_factory=PreparedStatementConnection, **DATABASE_PARAMS)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    results = list()
+
+    for (name, params) in READ_QUERIES:
+        sql = queries[name]
+        literal = literal_sql(cur, sql, params).strip().rstrip(';')
+
+        def run_literal():
+            cur.execute(literal)
+            cur.fetchall()
+
+        def run_prepared():
+            conn.execute_prepared(cur, name, sql, params)
+            cur.fetchall()
+
+        run_prepared()
+        execute = cur.mogrify('EXECUTE "{}" ({})'.format(name, ', '.join(['%s'] * len(params))),
+                              params).decode('utf8')
+
+        results.append({
+            'query': name,
+            'literal': measure(run_literal, iterations),
+            'prepared': measure(run_prepared, iterations),
+            'literal_planning_ms': statistics.mean([planning_time(cur, literal) for _ in range(iterations)]),
+            'prepared_planning_ms': statistics.mean([planning_time(cur, execute) for _ in range(iterations)])
+        })
+
+    cur.close()
+    conn.close()
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    results = benchmark(args.iterations)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print('{:<24}{:>16}{:>16}{:>16}{:>16}'.format('query', 'literal (ms)', 'prepared (ms)',
+                                                      'plan lit. (ms)', 'plan prep. (ms)'))
+        for result in results:
+            print('{:<24}{:>16.3f}{:>16.3f}{:>16.3f}{:>16.3f}'.format(
+                result['query'], result['literal']['mean_ms'], result['prepared']['mean_ms'],
+                result['literal_planning_ms'], result['prepared_planning_ms']))
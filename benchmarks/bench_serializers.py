@@ -0,0 +1,84 @@
+"""Benchmarks the JSON serializers installed over representative response bodies:
+the full monthly and yearly history of every category, and a comparison of
+many ids.
+
+Requires a populated database (see start-db.sh).
+"""
+
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.basics import TITULO_TESOURO_CATEGORIES
+from src.serializers import available_serializers
+from src.services import TituloTesouroCRUD
+
+try:
+    from timing import measure
+except ImportError:
+    from benchmarks.timing import measure
+
+
+def responses(crud, compare_size):
+    """Response bodies as built by the request handlers, by name.
+    """
+    with crud.pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT category::text, min(id) FROM tesouro_direto_series GROUP BY category')
+        ids = dict(cur.fetchall())
+        cur.execute('SELECT id FROM tesouro_direto_series ORDER BY id LIMIT %s', (compare_size,))
+        compare_ids = [str(res[0]) for res in cur.fetchall()]
+
+    bodies = dict()
+    for category in TITULO_TESOURO_CATEGORIES:
+        if category not in ids:
+            continue
+
+        bodies['history {}'.format(category)] = {'success': crud.read_history(str(ids[category]), dict())}
+        bodies['history {} (by year)'.format(category)] = {
+            'success': crud.read_history(str(ids[category]), {'group_by': 'true'})
+        }
+
+    bodies['compare {} ids'.format(len(compare_ids))] = {'success': crud.compare({'ids': compare_ids})}
+
+    return bodies
+
+
+def benchmark(iterations, compare_size):
+    bodies = responses(TituloTesouroCRUD(), compare_size)
+    serializers = available_serializers()
+
+    results = list()
+    for (name, body) in bodies.items():
+        result = {
+            'response': name,
+            'bytes': len(serializers[-1].dumps(body))
+        }
+        for serializer in serializers:
+            result[serializer.name] = measure(lambda: serializer.dumps(body), iterations, unit='us')
+
+        results.append(result)
+
+    return ([serializer.name for serializer in serializers], results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--compare-size', type=int, default=100, help='number of ids in the comparison.')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    (names, results) = benchmark(args.iterations, args.compare_size)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(('{:<36}{:>12}' + '{:>16}' * len(names)).format('response', 'bytes',
+                                                              *['{} (us)'.format(name) for name in names]))
+        for result in results:
+            print(('{:<36}{:>12}' + '{:>16.1f}' * len(names)).format(
+                result['response'], result['bytes'], *[result[name]['mean_us'] for name in names]))
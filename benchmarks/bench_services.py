@@ -0,0 +1,285 @@
+"""Benchmarks the pieces of TituloTesouroCRUD in process, without HTTP: the
+validation helpers, the parsing of dates, the shaping of result rows with each
+amount format, every query in TituloTesouroCRUD.queries, and a breakdown of the
+public read methods into validation, fetching and shaping.
+
+By default the database is seeded with the input data (as by start-db.sh) plus
+"--synthetic-rows" rows in far future dates, so the queries can be measured on
+larger tables; use "--no-seed" to keep the database as it is. Writes run in
+transactions that are rolled back.
+"""
+
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import psycopg2
+
+from src.basics import DATABASE_PARAMS, TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS, to_period
+from src.database import PreparedStatementConnection
+from src.services import TituloTesouroCRUD
+from src.system_loader import drop_database, create_database, stream_xlsx, copy_into_database
+
+try:
+    from timing import measure
+except ImportError:
+    from benchmarks.timing import measure
+
+
+START_PERIOD = 0
+END_PERIOD = to_period(9999, 12)
+
+INTERVAL = {'data_inicio': '2005-03', 'data_fim': '2016-10'}
+
+
+def synthetic_rows(count, seed):
+    """Rows of every category and action for each month from 2100 on, after the
+    input data and the records of the tests.
+    """
+    rand = random.Random(seed)
+    keys = ((year, month, category, action) for year in itertools.count(2100) for month in range(1, 13)
+            for category in TITULO_TESOURO_CATEGORIES for action in TITULO_TESOURO_ACTIONS)
+
+    for (year, month, category, action) in itertools.islice(keys, count):
+        yield (category, action, to_period(year, month), round(rand.uniform(1, 100000), 2))
+
+
+def seed_database(filename, synthetic, seed):
+    drop_database(verbose=False)
+    create_database(verbose=False)
+    copy_into_database(itertools.chain(stream_xlsx(filename, verbose=False), synthetic_rows(synthetic, seed)),
+                       verbose=False)
+
+
+def sample_data(crud):
+    with crud.pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT count(*) FROM tesouro_direto_series')
+        rows = cur.fetchall()[0][0]
+        cur.execute("SELECT min(id) FROM tesouro_direto_series WHERE category = 'NTN-B'")
+        titulo_id = cur.fetchall()[0][0]
+        cur.execute('SELECT category::text, min(id) FROM tesouro_direto_series GROUP BY category ORDER BY category')
+        compare_ids = [str(res[1]) for res in cur.fetchall()]
+
+    assert titulo_id is not None, 'The database has no record of NTN-B.'
+    return (rows, str(titulo_id), compare_ids)
+
+
+def bench_validation(crud, iterations):
+    calls = [
+        ('_validate_category', lambda: crud._validate_category('NTN-B')),
+        ('_validate_month', lambda: crud._validate_month(6)),
+        ('_validate_year', lambda: crud._validate_year(2010)),
+        ('_validate_action', lambda: crud._validate_action('venda')),
+        ('_validate_amount', lambda: crud._validate_amount(1234.56)),
+        ('_validate_titulo_id', lambda: crud._validate_titulo_id('1234')),
+        ('_period', lambda: crud._period('2010-06'))
+    ]
+
+    return [dict(name=name, **measure(run, iterations, unit='us')) for (name, run) in calls]
+
+
+def bench_parsing(crud, titulo_id, iterations):
+    calls = [
+        ('_interval (default)', lambda: crud._interval(dict())),
+        ('_interval (dates)', lambda: crud._interval(INTERVAL)),
+        ('_read_aux (default)', lambda: crud._read_aux(titulo_id, dict())),
+        ('_read_aux (dates, group_by)', lambda: crud._read_aux(titulo_id, dict(INTERVAL, group_by='true'))),
+        ('_create_aux', lambda: crud._create_aux('NTN-B', 6, 2010, 'venda', 1234.56)),
+        ('_update_aux', lambda: crud._update_aux({'mês': 6, 'ano': 2010, 'ação': 'venda', 'valor': 1234.56}))
+    ]
+
+    return [dict(name=name, **measure(run, iterations, unit='us')) for (name, run) in calls]
+
+
+def bench_shaping(crud, titulo_id, iterations):
+    """Shapes the monthly history of "titulo_id" as "read_history" does, with
+    each amount format.
+    """
+    rows = list(crud._history_rows(titulo_id, START_PERIOD, END_PERIOD, False))[1 :]
+
+    # babel is only loaded by the first use of the formatter
+    crud.currency._setup()
+
+    formats = [
+        ('BRLFormatter (cached)', crud.currency.format),
+        ('BRLFormatter (uncached)', crud.currency._uncached),
+        ('babel format_currency', crud.currency._babel),
+        ('float (formato=numerico)', float)
+    ]
+
+    results = list()
+    for (name, amount_format) in formats:
+        (shape, _) = crud._history_shape(False, amount_format)
+        results.append(dict(name='{} rows, {}'.format(len(rows), name),
+                            **measure(lambda: [shape(res) for res in rows], iterations, unit='us')))
+
+    return results
+
+
+def query_params(titulo_id, compare_ids):
+    """Parameters of each query, as passed by the CRUD.
+    """
+    titulo_id = int(titulo_id)
+    compare_ids = [int(_id) for _id in compare_ids]
+    period = to_period(2099, 12)
+
+    return {
+        'insert-tesouro-direto': ('NTN-B', 'VENDA', period, 1234.56),
+        'insert-many-tesouro-direto': (['NTN-B', 'NTN-B'], ['VENDA', 'RESGATE'], [period, period],
+                                       [1234.56, 6543.21]),
+        'delete-tesouro-direto': (titulo_id,),
+        'delete-many-tesouro-direto': (compare_ids,),
+        'delete-by-interval-tesouro-direto': ('NTN-B', to_period(2010, 1), to_period(2010, 12), None),
+        'get-period': (titulo_id,),
+        'update-tesouro-direto': (titulo_id, None, 1234.56, period),
+        'update-many-tesouro-direto': (compare_ids[: 2], [None, None], ['1234.56', '6543.21'], [None, None],
+                                       [None, None]),
+        'read-history': ('NTN-B', START_PERIOD, END_PERIOD, None),
+        'read-history-grouped': ('NTN-B', START_PERIOD, END_PERIOD, None),
+        'get-category': (titulo_id,),
+        'count-registers': (compare_ids,),
+        'read-by-action': ('VENDA', 'NTN-B', START_PERIOD, END_PERIOD, None),
+        'read-by-action-grouped': ('VENDA', 'NTN-B', START_PERIOD, END_PERIOD, None),
+        'compare': (compare_ids, START_PERIOD, END_PERIOD),
+        'compare-grouped': (compare_ids, START_PERIOD, END_PERIOD),
+        'get-version': (),
+        'load-series': ()
+    }
+
+
+def bench_queries(crud, titulo_id, compare_ids, iterations):
+    """Executes each query prepared, fetching its rows, in a transaction rolled
+    back after each call.
+    """
+    params = query_params(titulo_id, compare_ids)
+    missing = set(crud.queries) - set(params)
+    assert not missing, 'No parameters for queries {}.'.format(sorted(missing))
+
+    conn = psycopg2.connect(connection_factory=PreparedStatementConnection, **DATABASE_PARAMS)
+    cur = conn.cursor()
+
+    results = list()
+    for (name, sql) in sorted(crud.queries.items()):
+        def run():
+            conn.execute_prepared(cur, name, sql, params[name])
+            if cur.description is not None:
+                cur.fetchall()
+            conn.rollback()
+
+        run()
+        results.append(dict(name=name, rows=cur.rowcount, **measure(run, iterations, unit='us')))
+
+    cur.close()
+    conn.close()
+
+    return results
+
+
+def bench_breakdown(crud, titulo_id, compare_ids, iterations):
+    """Splits each public read into validation ("_read_aux" and
+    "_amount_format"), fetching ("_history_rows", "_by_action_rows" and
+    "_fetch_compare") and the rest (shaping the rows), which is the total minus
+    the other two.
+    """
+    cases = list()
+    for group_by in ['false', 'true']:
+        params = dict(INTERVAL, group_by=group_by)
+        (start_date, end_date, group_by_year) = crud._read_aux(titulo_id, params)
+
+        cases.append(('read_history (group_by={})'.format(group_by),
+                      lambda params=params: (crud._read_aux(titulo_id, params), crud._amount_format(params)),
+                      lambda args=(start_date, end_date, group_by_year): list(crud._history_rows(titulo_id, *args)),
+                      lambda params=params: crud.read_history(titulo_id, params)))
+        cases.append(('read_by_action (group_by={})'.format(group_by),
+                      lambda params=params: (crud._read_aux(titulo_id, params), crud._amount_format(params)),
+                      lambda args=(start_date, end_date, group_by_year): list(crud._by_action_rows(
+                          titulo_id, 'VENDA', *args)),
+                      lambda params=params: crud.read_by_action(titulo_id, 'venda', params)))
+
+        ids = [int(_id) for _id in compare_ids]
+        compare_params = dict(params, ids=compare_ids)
+        cases.append(('compare {} ids (group_by={})'.format(len(ids), group_by),
+                      lambda params=compare_params: (crud._read_aux(compare_ids, params),
+                                                     crud._amount_format(params)),
+                      lambda args=(start_date, end_date, group_by_year): crud._fetch_compare(ids, *args),
+                      lambda params=compare_params: crud.compare(params)))
+
+    results = list()
+    for (name, validate, fetch, total) in cases:
+        total()
+
+        result = {
+            'name': name,
+            'validation': measure(validate, iterations, unit='us'),
+            'fetch': measure(fetch, iterations, unit='us'),
+            'total': measure(total, iterations, unit='us')
+        }
+        result['shaping_us'] = max(result['total']['mean_us'] - result['validation']['mean_us'] -
+                                   result['fetch']['mean_us'], 0.0)
+
+        results.append(result)
+
+    return results
+
+
+def benchmark(iterations, columnar_engine):
+    crud = TituloTesouroCRUD(columnar_engine=columnar_engine)
+    crud.warmup()
+    (rows, titulo_id, compare_ids) = sample_data(crud)
+
+    return {
+        'rows': rows,
+        'columnar_engine': columnar_engine,
+        'validation': bench_validation(crud, iterations * 10),
+        'parsing': bench_parsing(crud, titulo_id, iterations * 10),
+        'shaping': bench_shaping(crud, titulo_id, iterations),
+        'queries': bench_queries(crud, titulo_id, compare_ids, iterations),
+        'breakdown': bench_breakdown(crud, titulo_id, compare_ids, iterations)
+    }
+
+
+def print_results(results):
+    print('{} rows in the database, columnar engine {}.'.format(
+        results['rows'], 'enabled' if results['columnar_engine'] else 'disabled'))
+
+    for section in ['validation', 'parsing', 'shaping', 'queries']:
+        print('\n{:<48}{:>14}{:>14}{:>14}'.format(section, 'mean (us)', 'p50 (us)', 'p95 (us)'))
+        for result in results[section]:
+            print('{:<48}{:>14.2f}{:>14.2f}{:>14.2f}'.format(result['name'], result['mean_us'], result['p50_us'],
+                                                              result['p95_us']))
+
+    print('\n{:<48}{:>14}{:>14}{:>14}{:>14}'.format('breakdown', 'total (us)', 'validation', 'fetch', 'shaping'))
+    for result in results['breakdown']:
+        total = result['total']['mean_us']
+        print('{:<48}{:>14.2f}{:>13.1f}%{:>13.1f}%{:>13.1f}%'.format(
+            result['name'], total, 100 * result['validation']['mean_us'] / total,
+            100 * result['fetch']['mean_us'] / total, 100 * result['shaping_us'] / total))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='calls per query and read (ten times as many per helper).')
+    parser.add_argument('--no-seed', action='store_true', help='uses the database as it is.')
+    parser.add_argument('--filename', default='input-data.xlsx', help='xlsx file seeded, relative to resources.')
+    parser.add_argument('--synthetic-rows', type=int, default=0, help='rows seeded besides the input data.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--columnar', action='store_true', help='answers the reads with the columnar engine.')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed_database(args.filename, args.synthetic_rows, args.seed)
+
+    results = benchmark(args.iterations, args.columnar)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
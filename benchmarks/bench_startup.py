@@ -0,0 +1,126 @@
+"""Measures the cold start of the web service: the time to import "src.main" (as
+gunicorn does, including the warmup) in a new interpreter, and where it goes,
+from the output of "python -X importtime" summed by package.
+
+Fails (exit code 1) when the median import takes longer than "--budget-ms", or
+when any of the "--deferred" modules, which must only be imported by the first
+request that needs them, is imported at startup.
+"""
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+CODE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {deferred!r} if name in sys.modules]}}))
+'''
+
+
+def parse_importtime(stderr, module):
+    """Returns the self time, in microseconds, of each module imported by
+    "module" (itself included), from the lines "import time: self | cumulative |
+    name" of "-X importtime". Each import is printed after the ones it caused,
+    indented one level deeper.
+    """
+    lines = list()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        (self_us, _, name) = line[len('import time:') :].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        lines.append((int(self_us), depth, name.strip()))
+
+    end = max([i for (i, (_, depth, name)) in enumerate(lines) if depth == 0 and name == module])
+    start = end
+    while start > 0 and lines[start - 1][1] > 0:
+        start -= 1
+
+    return {name: self_us for (self_us, _, name) in lines[start : end + 1]}
+
+
+def package(name):
+    # the modules of the service are reported one by one
+    return name if name.startswith('src.') else name.split('.')[0]
+
+
+def run(module, deferred):
+    env = dict(os.environ, PROJECT_ROOT_PATH=os.environ.get('PROJECT_ROOT_PATH', os.getcwd()))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE.format(module=module, deferred=deferred)],
+                             cwd=env['PROJECT_ROOT_PATH'], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+
+    by_package = dict()
+    for (name, self_us) in parse_importtime(process.stderr, module).items():
+        by_package[package(name)] = by_package.get(package(name), 0) + self_us
+    result['packages_ms'] = {name: self_us / 1000 for (name, self_us) in by_package.items()}
+
+    return result
+
+
+def benchmark(module, deferred, runs):
+    results = [run(module, deferred) for _ in range(runs)]
+
+    timings = sorted([result['seconds'] * 1000 for result in results])
+    packages = set().union(*[result['packages_ms'] for result in results])
+    packages_ms = {name: statistics.median([result['packages_ms'].get(name, 0) for result in results])
+                   for name in packages}
+
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': statistics.median(timings),
+        'min_ms': timings[0],
+        'max_ms': timings[-1],
+        'packages_ms': dict(sorted(packages_ms.items(), key=lambda item: -item[1])),
+        'deferred_loaded': sorted(set().union(*[result['loaded'] for result in results]))
+    }
+
+
+def print_results(results, top):
+    print('import {}: median {:.1f} ms (min {:.1f}, max {:.1f}) over {} runs'.format(
+        results['module'], results['median_ms'], results['min_ms'], results['max_ms'], results['runs']))
+    print()
+    print('{:<40} {:>10}'.format('package (self time)', 'ms'))
+    for (name, ms) in list(results['packages_ms'].items())[: top]:
+        print('{:<40} {:>10.1f}'.format(name, ms))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='src.main', help='module imported at startup.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help='most milliseconds the median import may take.')
+    parser.add_argument('--deferred', default='babel,src.profiling',
+                        help='comma separated modules that must not be imported at startup.')
+    parser.add_argument('--top', type=int, default=15, help='packages printed.')
+    parser.add_argument('--json', action='store_true', help='prints the raw results as JSON.')
+    args = parser.parse_args()
+
+    deferred = [name for name in args.deferred.split(',') if name]
+    results = benchmark(args.module, deferred, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results, args.top)
+
+    failed = False
+    if results['deferred_loaded']:
+        print('DEFERRED MODULES IMPORTED AT STARTUP: {}'.format(', '.join(results['deferred_loaded'])))
+        failed = True
+    if args.budget_ms is not None and results['median_ms'] > args.budget_ms:
+        print('OVER BUDGET: {:.1f} ms > {:.1f} ms'.format(results['median_ms'], args.budget_ms))
+        failed = True
+
+    sys.exit(1 if failed else 0)
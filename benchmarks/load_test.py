@@ -0,0 +1,314 @@
+"""Load tests the web service over HTTP: drives a mix of requests at fixed
+concurrency levels and reports throughput and p50/p95/p99 latency, optionally
+saving them as a baseline or comparing them against one.
+
+By default the database is seeded with the input data (as by start-db.sh) and
+Gunicorn is started as by start-app.sh on a separate port; use "--url" to target
+a service already running instead.
+"""
+
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import psycopg2
+
+from src.basics import DATABASE_PARAMS, PROJECT_ROOT_PATH, TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS
+from src.system_loader import drop_database, create_database, stream_xlsx, copy_into_database
+
+
+DEFAULT_MIX = 'history=30,history_grouped=15,venda=15,resgate=10,comparar=10,post=10,put=6,delete=4'
+
+OPERATIONS = ['history', 'history_grouped', 'venda', 'resgate', 'comparar', 'post', 'put', 'delete']
+
+
+def parse_mix(mix):
+    weights = dict()
+    for item in mix.split(','):
+        (operation, weight) = item.split('=')
+        assert operation in OPERATIONS, 'Operation must be one of {}.'.format(OPERATIONS)
+        weights[operation] = float(weight)
+
+    return weights
+
+
+def percentile(timings, fraction):
+    if not timings:
+        return None
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+class Client(object):
+    """Issues the requests of one thread, over a keep-alive connection.
+    """
+
+    def __init__(self, url, ids, created, created_lock):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.ids = ids
+        self.created = created
+        self.created_lock = created_lock
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.rand = random.Random()
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else dict()
+        data = json.dumps(body) if body is not None else None
+
+        try:
+            self.conn.request(method, path, body=data, headers=headers)
+            resp = self.conn.getresponse()
+            content = resp.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            return (0, None)
+
+        return (resp.status, content)
+
+    def _created_id(self, remove):
+        with self.created_lock:
+            if not self.created:
+                return None
+            if remove:
+                return self.created.pop(self.rand.randrange(len(self.created)))
+            return self.rand.choice(self.created)
+
+    def run(self, operation):
+        """Runs "operation", returning its name (writes fall back to reads
+        when there is no record created to change) and the status.
+        """
+        titulo_id = self.rand.choice(self.ids)
+
+        if operation == 'history':
+            return (operation, self.request('GET', '/titulo_tesouro/{}'.format(titulo_id))[0])
+        if operation == 'history_grouped':
+            return (operation, self.request('GET', '/titulo_tesouro/{}?group_by=true'.format(titulo_id))[0])
+        if operation in ('venda', 'resgate'):
+            path = '/titulo_tesouro/{}/{}?data_inicio=2010-01&data_fim=2016-12'.format(operation, titulo_id)
+            return (operation, self.request('GET', path)[0])
+        if operation == 'comparar':
+            query = '&'.join(['ids={}'.format(_id) for _id in self.rand.sample(self.ids, 5)])
+            return (operation, self.request('GET', '/titulo_tesouro/comparar?{}'.format(query))[0])
+
+        if operation == 'post':
+            # far future dates, so the records created do not collide with the input data
+            (status, content) = self.request('POST', '/titulo_tesouro', {
+                'categoria_titulo': self.rand.choice(TITULO_TESOURO_CATEGORIES),
+                'mês': self.rand.randint(1, 12),
+                'ano': self.rand.randint(2100, 9999),
+                'ação': self.rand.choice(TITULO_TESOURO_ACTIONS),
+                'valor': round(self.rand.uniform(1, 100000), 2)
+            })
+            if status == 201:
+                with self.created_lock:
+                    self.created.append(json.loads(content.decode('utf8'))['success']['id'])
+            return (operation, status)
+
+        created_id = self._created_id(remove=(operation == 'delete'))
+        if created_id is None:
+            return self.run('history')
+
+        if operation == 'put':
+            body = {'valor': round(self.rand.uniform(1, 100000), 2)}
+            return (operation, self.request('PUT', '/titulo_tesouro/{}'.format(created_id), body)[0])
+        return (operation, self.request('DELETE', '/titulo_tesouro/{}'.format(created_id))[0])
+
+
+def run_level(url, ids, weights, concurrency, duration):
+    """Runs "concurrency" clients for "duration" seconds, returning the
+    throughput and the latencies overall and per operation.
+    """
+    operations = list(weights.keys())
+    cumulative = [sum(list(weights.values())[: i + 1]) for i in range(len(operations))]
+
+    samples = list()
+    samples_lock = threading.Lock()
+    created = list()
+    created_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def work():
+        client = Client(url, ids, created, created_lock)
+        local = list()
+
+        while time.perf_counter() < deadline:
+            operation = client.rand.choices(operations, cum_weights=cumulative)[0]
+            start = time.perf_counter()
+            (operation, status) = client.run(operation)
+            local.append((operation, status, (time.perf_counter() - start) * 1000))
+
+        with samples_lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def summary(selected):
+        timings = sorted([sample[2] for sample in selected])
+        return {
+            'requests': len(selected),
+            'errors': len([sample for sample in selected if sample[1] == 0 or sample[1] >= 500]),
+            'throughput': len(selected) / elapsed,
+            'p50_ms': percentile(timings, 0.50),
+            'p95_ms': percentile(timings, 0.95),
+            'p99_ms': percentile(timings, 0.99)
+        }
+
+    result = summary(samples)
+    result['concurrency'] = concurrency
+    result['operations'] = {operation: summary([sample for sample in samples if sample[0] == operation])
+                            for operation in sorted(set([sample[0] for sample in samples]))}
+
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Returns the regressions of "results" against "baseline": throughput
+    lower or p95/p99 higher than the baseline by more than "threshold".
+    """
+    regressions = list()
+    previous = {level['concurrency']: level for level in baseline['levels']}
+
+    for level in results['levels']:
+        before = previous.get(level['concurrency'])
+        if before is None:
+            continue
+
+        pairs = [('all', level, before)]
+        pairs.extend([(operation, summary, before['operations'][operation])
+                      for (operation, summary) in level['operations'].items() if operation in before['operations']])
+
+        for (operation, now, then) in pairs:
+            if then['throughput'] and now['throughput'] < then['throughput'] * (1 - threshold):
+                regressions.append((level['concurrency'], operation, 'throughput', then['throughput'],
+                                    now['throughput']))
+            for key in ['p95_ms', 'p99_ms']:
+                if then[key] and now[key] and now[key] > then[key] * (1 + threshold):
+                    regressions.append((level['concurrency'], operation, key, then[key], now[key]))
+
+    return regressions
+
+
+def seed_database(filename):
+    drop_database(verbose=False)
+    create_database(verbose=False)
+    copy_into_database(stream_xlsx(filename, verbose=False), verbose=False)
+
+
+def read_ids():
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM tesouro_direto_series ORDER BY id')
+    ids = [res[0] for res in cur.fetchall()]
+    cur.close()
+    conn.close()
+
+    assert ids, 'The database is empty.'
+    return ids
+
+
+def start_gunicorn(port, workers):
+    """Starts Gunicorn as start-app.sh does, with its configuration module. The
+    bind and the workers are passed through the environment, so the settings
+    derived from them there (e.g. the directory of the metrics) follow.
+    """
+    env = dict(os.environ, GUNICORN_BIND='127.0.0.1:{}'.format(port), GUNICORN_WORKERS=str(workers))
+    process = subprocess.Popen(['gunicorn', '-c', 'src/gunicorn_config.py', 'src.main'], cwd=PROJECT_ROOT_PATH,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError('Gunicorn did not start on port {}.'.format(port))
+
+
+def print_results(results):
+    print('{:>6}{:>18}{:>10}{:>8}{:>12}{:>10}{:>10}{:>10}'.format(
+        'conc.', 'operation', 'requests', 'errors', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+
+    for level in results['levels']:
+        rows = [('all', level)] + sorted(level['operations'].items())
+        for (operation, summary) in rows:
+            print('{:>6}{:>18}{:>10}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+                level['concurrency'], operation, summary['requests'], summary['errors'], summary['throughput'],
+                summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help='service to test; if absent, Gunicorn is started as by start-app.sh.')
+    parser.add_argument('--port', type=int, default=8100, help='port of the Gunicorn started.')
+    parser.add_argument('--workers', type=int, default=2, help='workers of the Gunicorn started.')
+    parser.add_argument('--no-seed', action='store_true', help='uses the database as it is.')
+    parser.add_argument('--filename', default='input-data.xlsx', help='xlsx file seeded, relative to resources.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weights of the operations, among {}.'.format(OPERATIONS))
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated concurrency levels.')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level.')
+    parser.add_argument('--save-baseline', help='writes the results to this JSON file.')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change flagged as regression (default 0.2).')
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed_database(args.filename)
+    ids = read_ids()
+
+    process = None
+    url = args.url
+    if url is None:
+        process = start_gunicorn(args.port, args.workers)
+        url = 'http://127.0.0.1:{}'.format(args.port)
+
+    try:
+        weights = parse_mix(args.mix)
+        results = {
+            'mix': weights,
+            'duration': args.duration,
+            'levels': [run_level(url, ids, weights, int(concurrency), args.duration)
+                       for concurrency in args.concurrency.split(',')]
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for (concurrency, operation, key, before, now) in regressions:
+            print('REGRESSION concurrency {} {} {}: {:.2f} -> {:.2f}'.format(concurrency, operation, key, before, now))
+        if regressions:
+            sys.exit(1)
+        print('No regressions against "{}".'.format(args.baseline))
@@ -0,0 +1,33 @@
+"""Timing of the benchmarks, shared by them.
+"""
+
+
+import statistics
+import time
+
+
+UNITS = {
+    'ms': 1000,
+    'us': 1000000
+}
+
+
+def measure(run, iterations, unit='ms'):
+    """Calls "run" "iterations" times, returning the mean, median and 95th
+    percentile of its duration, in "unit" ("ms" or "us"), as "mean_<unit>",
+    "p50_<unit>" and "p95_<unit>".
+    """
+    scale = UNITS[unit]
+
+    timings = list()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * scale)
+
+    timings.sort()
+    return {
+        'mean_{}'.format(unit): statistics.mean(timings),
+        'p50_{}'.format(unit): timings[len(timings) // 2],
+        'p95_{}'.format(unit): timings[int(len(timings) * 0.95)]
+    }
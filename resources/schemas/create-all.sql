@@ -22,16 +22,110 @@ BEGIN
 END$$;
 
 
+-- records are keyed by period, the number of months since 2002-01 (INITIAL_DATE
+-- in module "basics")
+CREATE OR REPLACE FUNCTION period_year(period INTEGER) RETURNS INTEGER AS $$
+    SELECT 2002 + period / 12
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION year_period(year INTEGER) RETURNS INTEGER AS $$
+    SELECT (year - 2002) * 12
+$$ LANGUAGE SQL IMMUTABLE;
+
+
 CREATE TABLE IF NOT EXISTS tesouro_direto_series (
     id              SERIAL                          NOT NULL,
     category        category_type                   NOT NULL,
     action          action_type                     NOT NULL,
-    expire_at       TIMESTAMP WITHOUT TIME ZONE     NOT NULL,
+    period          INTEGER                         NOT NULL,
     amount          DECIMAL                         NOT NULL,
 
+    {keys},
+    CHECK (period >= 0)
+){partition_by};
+
+{partitions}
+
+
+CREATE TABLE IF NOT EXISTS tesouro_direto_version (
+    id              BOOLEAN                         NOT NULL DEFAULT TRUE,
+    version         BIGINT                          NOT NULL,
+    updated_at      TIMESTAMP WITH TIME ZONE        NOT NULL,
+
     PRIMARY KEY (id),
-    UNIQUE (category, action, expire_at)
+    CHECK (id)
 );
 
+-- starts from the creation time, so versions are not repeated if the schema is recreated
+INSERT INTO tesouro_direto_version (id, version, updated_at)
+VALUES (TRUE, (extract(epoch FROM clock_timestamp()) * 1000000)::bigint, now())
+ON CONFLICT DO NOTHING;
+
+-- bulk loads running in parallel set "easynvest.skip_version_bump", so they do
+-- not wait on each other for the row of the version, and bump it once at the end
+CREATE OR REPLACE FUNCTION bump_tesouro_direto_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('easynvest.skip_version_bump', TRUE) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE tesouro_direto_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tesouro_direto_series_version ON tesouro_direto_series;
+CREATE TRIGGER tesouro_direto_series_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tesouro_direto_series
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_tesouro_direto_version();
+
+
+CREATE TABLE IF NOT EXISTS tesouro_direto_yearly (
+    category        category_type                   NOT NULL,
+    action          action_type                     NOT NULL,
+    year            INTEGER                         NOT NULL,
+    amount          DECIMAL                         NOT NULL,
+    months          INTEGER                         NOT NULL,
+
+    PRIMARY KEY (category, action, year)
+);
+
+CREATE OR REPLACE FUNCTION update_tesouro_direto_yearly() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE tesouro_direto_yearly
+        SET amount = amount - OLD.amount, months = months - 1
+        WHERE category = OLD.category AND action = OLD.action AND year = period_year(OLD.period);
+
+        DELETE FROM tesouro_direto_yearly
+        WHERE category = OLD.category AND action = OLD.action AND year = period_year(OLD.period)
+            AND months = 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO tesouro_direto_yearly (category, action, year, amount, months)
+        VALUES (NEW.category, NEW.action, period_year(NEW.period), NEW.amount, 1)
+        ON CONFLICT (category, action, year) DO UPDATE
+        SET amount = tesouro_direto_yearly.amount + EXCLUDED.amount, months = tesouro_direto_yearly.months + 1;
+    END IF;
+
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION truncate_tesouro_direto_yearly() RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE tesouro_direto_yearly;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tesouro_direto_series_yearly ON tesouro_direto_series;
+CREATE TRIGGER tesouro_direto_series_yearly
+    AFTER INSERT OR UPDATE OR DELETE ON tesouro_direto_series
+    FOR EACH ROW EXECUTE PROCEDURE update_tesouro_direto_yearly();
+
+DROP TRIGGER IF EXISTS tesouro_direto_series_yearly_truncate ON tesouro_direto_series;
+CREATE TRIGGER tesouro_direto_series_yearly_truncate
+    AFTER TRUNCATE ON tesouro_direto_series
+    FOR EACH STATEMENT EXECUTE PROCEDURE truncate_tesouro_direto_yearly();
+
 
 COMMIT;
\ No newline at end of file
@@ -0,0 +1 @@
+CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} {bounds}{partition_by};
\ No newline at end of file
@@ -2,6 +2,13 @@ BEGIN;
 
 
 DROP TABLE IF EXISTS tesouro_direto_series;
+DROP TABLE IF EXISTS tesouro_direto_version;
+DROP TABLE IF EXISTS tesouro_direto_yearly;
+DROP FUNCTION IF EXISTS bump_tesouro_direto_version();
+DROP FUNCTION IF EXISTS update_tesouro_direto_yearly();
+DROP FUNCTION IF EXISTS truncate_tesouro_direto_yearly();
+DROP FUNCTION IF EXISTS period_year(INTEGER);
+DROP FUNCTION IF EXISTS year_period(INTEGER);
 
 DO $$
 BEGIN
@@ -0,0 +1 @@
+ANALYZE tesouro_direto_series, tesouro_direto_yearly;
\ No newline at end of file
@@ -0,0 +1 @@
+UPDATE tesouro_direto_version SET version = version + 1, updated_at = now();
\ No newline at end of file
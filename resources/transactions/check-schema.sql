@@ -0,0 +1 @@
+SELECT to_regclass('tesouro_direto_series') IS NOT NULL;
\ No newline at end of file
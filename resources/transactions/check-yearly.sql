@@ -0,0 +1,36 @@
+SELECT
+    coalesce(R.category, Y.category)::text AS category,
+    coalesce(R.action, Y.action)::text AS action,
+    coalesce(R.year, Y.year) AS year,
+    R.amount AS raw_amount,
+    Y.amount AS rollup_amount,
+    R.months AS raw_months,
+    Y.months AS rollup_months
+FROM
+(
+    SELECT
+        category,
+        action,
+        period_year(period) AS year,
+        sum(amount) AS amount,
+        count(*) AS months
+    FROM
+        tesouro_direto_series
+    GROUP BY
+        category,
+        action,
+        year
+) R
+FULL OUTER JOIN
+    tesouro_direto_yearly Y
+ON
+    R.category = Y.category
+    AND R.action = Y.action
+    AND R.year = Y.year
+WHERE
+    R.amount IS DISTINCT FROM Y.amount
+    OR R.months IS DISTINCT FROM Y.months
+ORDER BY
+    category,
+    action,
+    year;
\ No newline at end of file
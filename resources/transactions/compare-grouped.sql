@@ -0,0 +1,70 @@
+WITH titulos AS (
+    SELECT
+        category,
+        array_agg(id ORDER BY id) AS ids
+    FROM
+        tesouro_direto_series
+    WHERE
+        id = ANY($1::integer[])
+    GROUP BY
+        category
+)
+SELECT
+    T.category::text,
+    T.ids,
+    S.year,
+    S.valor_venda,
+    S.valor_resgate
+FROM
+    titulos T
+LEFT JOIN
+    (
+        SELECT
+            category,
+            year,
+            sum(amount) FILTER (WHERE action = 'VENDA') AS valor_venda,
+            sum(amount) FILTER (WHERE action = 'RESGATE') AS valor_resgate
+        FROM
+        (
+            SELECT
+                category,
+                year,
+                action,
+                amount
+            FROM
+                tesouro_direto_yearly
+            WHERE
+                category IN (SELECT category FROM titulos)
+                AND year_period(year) >= $2
+                AND year_period(year) + 11 <= $3
+
+            UNION ALL
+
+            SELECT
+                category,
+                period_year(period) AS year,
+                action,
+                amount
+            FROM
+                tesouro_direto_series
+            WHERE
+                category IN (SELECT category FROM titulos)
+                AND period >= $2
+                AND period <= $3
+                AND NOT (
+                    period - period % 12 >= $2
+                    AND period - period % 12 + 11 <= $3
+                )
+        ) A
+        GROUP BY
+            category,
+            year
+        HAVING
+            bool_or(action = 'VENDA')
+            AND bool_or(action = 'RESGATE')
+    ) S
+ON
+    S.category = T.category
+ORDER BY
+    S.year,
+    T.category;
\ No newline at end of file
@@ -1,13 +1,44 @@
+WITH titulos AS (
+    SELECT
+        category,
+        array_agg(id ORDER BY id) AS ids
+    FROM
+        tesouro_direto_series
+    WHERE
+        id = ANY($1::integer[])
+    GROUP BY
+        category
+)
 SELECT
-    to_char(expire_at, 'YYYY') AS year,
-    to_char(expire_at, 'MM') AS month,
-    id,
-    category,
-    action,
-    amount
+    T.category::text,
+    T.ids,
+    S.period,
+    S.valor_venda,
+    S.valor_resgate
 FROM
-    tesouro_direto_series
-WHERE
-    expire_at >= '{}'
-    AND expire_at <= '{}'
-    AND id IN ({});
\ No newline at end of file
+    titulos T
+LEFT JOIN
+    (
+        SELECT
+            category,
+            period,
+            sum(amount) FILTER (WHERE action = 'VENDA') AS valor_venda,
+            sum(amount) FILTER (WHERE action = 'RESGATE') AS valor_resgate
+        FROM
+            tesouro_direto_series
+        WHERE
+            category IN (SELECT category FROM titulos)
+            AND period >= $2
+            AND period <= $3
+        GROUP BY
+            category,
+            period
+        HAVING
+            bool_or(action = 'VENDA')
+            AND bool_or(action = 'RESGATE')
+    ) S
+ON
+    S.category = T.category
+ORDER BY
+    S.period,
+    T.category;
\ No newline at end of file
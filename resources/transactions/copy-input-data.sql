@@ -0,0 +1 @@
+COPY {} (category, action, period, amount) FROM STDIN;
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT count(*) FROM tesouro_direto_series WHERE id = ANY($1::integer[]);
\ No newline at end of file
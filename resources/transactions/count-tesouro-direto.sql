@@ -1 +0,0 @@
-SELECT count(*) FROM tesouro_direto_series WHERE id = {};
\ No newline at end of file
@@ -0,0 +1,9 @@
+DELETE FROM
+    tesouro_direto_series
+WHERE
+    category = $1::text::category_type
+    AND period >= $2
+    AND period <= $3
+    AND ($4::text IS NULL OR action = $4::text::action_type)
+RETURNING
+    id;
\ No newline at end of file
@@ -0,0 +1 @@
+DELETE FROM tesouro_direto_series WHERE id = ANY($1::integer[]) RETURNING id;
\ No newline at end of file
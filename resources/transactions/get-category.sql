@@ -1 +1 @@
-SELECT category FROM tesouro_direto_series WHERE id = {};
\ No newline at end of file
+SELECT category::text FROM tesouro_direto_series WHERE id = $1;
\ No newline at end of file
@@ -1 +0,0 @@
-SELECT to_char(expire_at, 'YYYY'), to_char(expire_at, 'MM') FROM tesouro_direto_series WHERE id = {};
\ No newline at end of file
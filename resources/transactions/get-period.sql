@@ -0,0 +1 @@
+SELECT period FROM tesouro_direto_series WHERE id = $1;
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT version, updated_at AT TIME ZONE 'UTC' FROM tesouro_direto_version;
\ No newline at end of file
@@ -0,0 +1,14 @@
+INSERT INTO tesouro_direto_series (category, action, period, amount)
+SELECT
+    category::category_type,
+    action::action_type,
+    period,
+    amount
+FROM
+    unnest($1::text[], $2::text[], $3::integer[], $4::decimal[]) AS A (category, action, period, amount)
+ON CONFLICT DO NOTHING
+RETURNING
+    id,
+    category::text,
+    action::text,
+    period;
\ No newline at end of file
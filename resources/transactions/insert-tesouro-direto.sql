@@ -0,0 +1,3 @@
+INSERT INTO tesouro_direto_series (category, action, period, amount)
+VALUES ($1::text::category_type, $2::text::action_type, $3, $4)
+RETURNING id;
\ No newline at end of file
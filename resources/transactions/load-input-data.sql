@@ -1,7 +1,7 @@
 BEGIN;
 
 
-INSERT INTO tesouro_direto_series (category, action, expire_at, amount)
+INSERT INTO tesouro_direto_series (category, action, period, amount)
 VALUES
     {};
 
@@ -0,0 +1,8 @@
+SELECT
+    id,
+    category::text,
+    action::text,
+    period,
+    amount::double precision
+FROM
+    tesouro_direto_series;
\ No newline at end of file
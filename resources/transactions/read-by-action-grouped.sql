@@ -1,14 +1,39 @@
 SELECT
-    to_char(expire_at, 'YYYY') AS year,
+    year,
     sum(amount)
 FROM
-    tesouro_direto_series
-WHERE
-    action = '{}'
-    AND category = '{}'
-    AND expire_at >= '{}'
-    AND expire_at <= '{}'
+(
+    SELECT
+        year,
+        amount
+    FROM
+        tesouro_direto_yearly
+    WHERE
+        action = $1::text::action_type
+        AND category = $2::text::category_type
+        AND year_period(year) >= $3
+        AND year_period(year) + 11 <= $4
+
+    UNION ALL
+
+    SELECT
+        period_year(period) AS year,
+        amount
+    FROM
+        tesouro_direto_series
+    WHERE
+        action = $1::text::action_type
+        AND category = $2::text::category_type
+        AND period >= $3
+        AND period <= $4
+        AND NOT (
+            period - period % 12 >= $3
+            AND period - period % 12 + 11 <= $4
+        )
+) A
 GROUP BY
     year
 ORDER BY
-    year;
\ No newline at end of file
+    year
+LIMIT
+    $5;
\ No newline at end of file
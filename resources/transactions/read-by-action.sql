@@ -1,14 +1,14 @@
 SELECT
-    to_char(expire_at, 'YYYY') AS year,
-    to_char(expire_at, 'MM') AS month,
+    period,
     amount
 FROM
     tesouro_direto_series
 WHERE
-    action = '{}'
-    AND category = '{}'
-    AND expire_at >= '{}'
-    AND expire_at <= '{}'
+    action = $1::text::action_type
+    AND category = $2::text::category_type
+    AND period >= $3
+    AND period <= $4
 ORDER BY
-    year,
-    month;
\ No newline at end of file
+    period
+LIMIT
+    $5;
\ No newline at end of file
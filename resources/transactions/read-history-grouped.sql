@@ -1,40 +1,43 @@
 SELECT
-    A.year,
-    A.valor_venda,
-    B.valor_resgate
+    year,
+    sum(amount) FILTER (WHERE action = 'VENDA') AS valor_venda,
+    sum(amount) FILTER (WHERE action = 'RESGATE') AS valor_resgate
 FROM
 (
     SELECT
-        to_char(expire_at, 'YYYY') AS year,
-        sum(amount) AS valor_venda
+        year,
+        action,
+        amount
+    FROM
+        tesouro_direto_yearly
+    WHERE
+        category = $1::text::category_type
+        AND year_period(year) >= $2
+        AND year_period(year) + 11 <= $3
+
+    UNION ALL
+
+    SELECT
+        period_year(period) AS year,
+        action,
+        amount
     FROM
         tesouro_direto_series
     WHERE
-        category = '{0}'
-        AND expire_at >= '{1}'
-        AND expire_at <= '{2}'
-        AND action = 'VENDA'
-    GROUP BY
-        year
-    ORDER BY
-        year
+        category = $1::text::category_type
+        AND period >= $2
+        AND period <= $3
+        AND NOT (
+            period - period % 12 >= $2
+            AND period - period % 12 + 11 <= $3
+        )
 ) A
-JOIN
-    (
-        SELECT
-            to_char(expire_at, 'YYYY') AS year,
-            sum(amount) AS valor_resgate
-        FROM
-            tesouro_direto_series
-        WHERE
-            category = '{0}'
-            AND expire_at >= '{1}'
-            AND expire_at <= '{2}'
-            AND action = 'RESGATE'
-        GROUP BY
-            year
-        ORDER BY
-            year
-    ) B
-ON
-    A.year = B.year;
\ No newline at end of file
+GROUP BY
+    year
+HAVING
+    bool_or(action = 'VENDA')
+    AND bool_or(action = 'RESGATE')
+ORDER BY
+    year
+LIMIT
+    $4;
\ No newline at end of file
@@ -0,0 +1,7 @@
+SELECT
+    category::text,
+    action::text,
+    period,
+    amount
+FROM
+    tesouro_direto_series;
\ No newline at end of file
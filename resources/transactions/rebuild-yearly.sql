@@ -0,0 +1,23 @@
+BEGIN;
+
+
+LOCK TABLE tesouro_direto_series IN SHARE MODE;
+
+DELETE FROM tesouro_direto_yearly;
+
+INSERT INTO tesouro_direto_yearly (category, action, year, amount, months)
+SELECT
+    category,
+    action,
+    period_year(period) AS year,
+    sum(amount),
+    count(*)
+FROM
+    tesouro_direto_series
+GROUP BY
+    category,
+    action,
+    year;
+
+
+COMMIT;
\ No newline at end of file
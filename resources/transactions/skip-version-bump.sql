@@ -0,0 +1 @@
+SET LOCAL easynvest.skip_version_bump = on;
\ No newline at end of file
@@ -0,0 +1,17 @@
+UPDATE
+    tesouro_direto_series T
+SET
+    action = COALESCE(U.action::action_type, T.action),
+    amount = COALESCE(U.amount::decimal, T.amount),
+    period = year_period(COALESCE(U.year::integer, period_year(T.period)))
+        + COALESCE(U.month::integer, T.period % 12 + 1) - 1
+FROM
+    unnest($1::integer[], $2::text[], $3::text[], $4::text[], $5::text[]) AS U (id, action, amount, year, month)
+WHERE
+    T.id = U.id
+RETURNING
+    T.id,
+    T.category::text,
+    T.action::text,
+    T.period,
+    T.amount::double precision;
\ No newline at end of file
@@ -1,7 +1,8 @@
-BEGIN;
-
-
-UPDATE tesouro_direto_series SET {} WHERE id = {};
-
-
-COMMIT;
\ No newline at end of file
+UPDATE
+    tesouro_direto_series
+SET
+    action = COALESCE($2::text::action_type, action),
+    amount = COALESCE($3, amount),
+    period = $4
+WHERE
+    id = $1;
\ No newline at end of file
@@ -0,0 +1,13 @@
+INSERT INTO tesouro_direto_series (category, action, period, amount)
+SELECT
+    category::category_type,
+    action::action_type,
+    period,
+    amount
+FROM
+    unnest(%s::text[], %s::text[], %s::integer[], %s::decimal[]) AS A (category, action, period, amount)
+ON CONFLICT ({}) DO UPDATE
+SET
+    amount = EXCLUDED.amount
+WHERE
+    tesouro_direto_series.amount IS DISTINCT FROM EXCLUDED.amount;
\ No newline at end of file
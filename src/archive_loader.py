@@ -0,0 +1,167 @@
+"""Loads archives of monthly reports: every workbook in a directory (or matching
+a glob) laid out as the input data, wherever its series, units and dates are
+(see "stream_worksheet" in module "system_loader").
+
+The workbooks are parsed in parallel, by a pool of processes, and merged: when
+several of them hold the same (category, action, month), the value of the last
+one, in the order of their paths, is kept. The rows merged are then loaded by
+concurrent connections, each one copying the series of some (category, action)
+pairs, so no two of them update the same rows of the yearly rollup, and the
+version of the data is moved once, after all of them. Run as a script:
+
+    python src/archive_loader.py 'resources/archive/*.xlsx'
+"""
+
+
+import argparse
+import concurrent.futures
+import glob
+import logging
+import os
+import time
+
+import openpyxl
+import psycopg2
+
+try:
+    from basics import DATABASE_PARAMS
+    from system_loader import drop_database, create_database, create_database_if_missing, stream_worksheet
+    from system_loader import copy_into_database, upsert_into_database, analyze_database, bump_version
+except ImportError:
+    from src.basics import DATABASE_PARAMS
+    from src.system_loader import drop_database, create_database, create_database_if_missing, stream_worksheet
+    from src.system_loader import copy_into_database, upsert_into_database, analyze_database, bump_version
+
+
+def find_workbooks(pattern):
+    """Returns the paths of the workbooks in the directory "pattern", or matching
+    the glob "pattern", sorted.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.xlsx')
+
+    return sorted(glob.glob(pattern))
+
+
+def parse_workbook(path):
+    """Returns the rows (category, action, period, amount) of every worksheet of
+    the workbook. Runs in the processes of the pool.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [row for worksheet in workbook.worksheets for row in stream_worksheet(worksheet)]
+    finally:
+        workbook.close()
+
+
+def parse_workbooks(paths, processes=None):
+    """Parses the workbooks in a pool of "processes" processes (by default, one
+    per CPU), returning the rows merged, by (category, action, period), in the
+    order of "paths".
+    """
+    merged = dict()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        # map returns the results in the order of the paths, so the last value wins
+        for (path, rows) in zip(paths, executor.map(parse_workbook, paths)):
+            logging.info('{} rows read from "{}".'.format(len(rows), path))
+            for (category, action, period, amount) in rows:
+                merged[(category, action, period)] = amount
+
+    return [key + (amount,) for (key, amount) in merged.items()]
+
+
+def shard(rows, shards):
+    """Splits the rows in at most "shards" lists, each one with all rows of its
+    (category, action) pairs.
+    """
+    pairs = sorted(set([(category, action) for (category, action, _, _) in rows]))
+    shard_of = {pair: i % shards for (i, pair) in enumerate(pairs)}
+
+    sharded = [list() for _ in range(min(shards, len(pairs)))]
+    for row in rows:
+        sharded[shard_of[row[0 : 2]]].append(row)
+
+    return sharded
+
+
+def load_rows(rows, connections, chunk_size=10000):
+    """Copies the rows by "connections" concurrent connections, each in its own
+    transaction, and updates the statistics and the version of the data once
+    all of them are loaded. The version trigger is skipped by the copies, since
+    it updates a single row and would make them wait for each other.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [executor.submit(copy_into_database, rows, chunk_size=chunk_size, verbose=False, analyze=False,
+                                   bump_version=False) for rows in shard(rows, connections)]
+        count = sum([future.result() for future in futures])
+
+    bump_version()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+    analyze_database(cur)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return count
+
+
+def rate(rows, seconds):
+    return rows / seconds if seconds > 0 else 0.0
+
+
+def load_archive(pattern, processes=None, connections=4, chunk_size=None, incremental=False):
+    """Parses and loads the workbooks of "pattern", dropping the database first
+    unless "incremental" (then only the new and changed rows are written, as by
+    "upsert_into_database"). Returns the throughput of each step.
+    """
+    paths = find_workbooks(pattern)
+    assert paths, 'No workbook found in "{}".'.format(pattern)
+
+    logging.info('Parsing {} workbooks.'.format(len(paths)))
+    start = time.perf_counter()
+    rows = parse_workbooks(paths, processes)
+    parse_seconds = time.perf_counter() - start
+    logging.info('{} rows merged in {:.2f} s ({:.0f} rows/s).\n'.format(len(rows), parse_seconds,
+                                                                        rate(len(rows), parse_seconds)))
+
+    start = time.perf_counter()
+    if incremental:
+        create_database_if_missing(verbose=False)
+        counts = upsert_into_database(rows, chunk_size=chunk_size or 1000)
+    else:
+        drop_database(verbose=False)
+        create_database(verbose=False)
+        counts = {'inserted': load_rows(rows, connections, chunk_size or 10000)}
+    load_seconds = time.perf_counter() - start
+    logging.info('{} rows loaded in {:.2f} s ({:.0f} rows/s).\n'.format(len(rows), load_seconds,
+                                                                        rate(len(rows), load_seconds)))
+
+    total_seconds = parse_seconds + load_seconds
+    logging.info('Total: {} workbooks, {} rows in {:.2f} s ({:.0f} rows/s).\n'.format(
+        len(paths), len(rows), total_seconds, rate(len(rows), total_seconds)))
+
+    return {
+        'workbooks': len(paths),
+        'rows': len(rows),
+        'counts': counts,
+        'parse_rows_per_second': rate(len(rows), parse_seconds),
+        'load_rows_per_second': rate(len(rows), load_seconds),
+        'rows_per_second': rate(len(rows), total_seconds)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loads every workbook of a directory or glob in parallel.')
+    parser.add_argument('pattern', help='directory of xlsx files, or glob of the files (quoted).')
+    parser.add_argument('--processes', type=int, help='processes parsing the workbooks (default, one per CPU).')
+    parser.add_argument('--connections', type=int, default=4, help='concurrent connections loading the rows.')
+    parser.add_argument('--chunk-size', type=int,
+                        help='rows sent per COPY (default 10000), or per INSERT when incremental (default 1000).')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keeps the database, writing only the new and changed rows.')
+    args = parser.parse_args()
+
+    load_archive(args.pattern, args.processes, args.connections, args.chunk_size, args.incremental)
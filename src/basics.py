@@ -2,8 +2,8 @@
 """
 
 
+import datetime
 import os
-import pendulum
 
 
 PROJECT_ROOT_PATH = os.environ.get('PROJECT_ROOT_PATH')
@@ -21,11 +21,70 @@ DATABASE_PARAMS = {
     'password': DATABASE_PASSWORD
 }
 
+DATABASE_PARTITIONING = os.environ.get('DATABASE_PARTITIONING', '')
+DATABASE_PARTITION_YEARS = int(os.environ.get('DATABASE_PARTITION_YEARS', '10'))
+DATABASE_PARTITION_LAST_YEAR = int(os.environ.get('DATABASE_PARTITION_LAST_YEAR', '2101'))
+
+DATABASE_POOL_MIN_SIZE = int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1'))
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', '10'))
+DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', '10'))
+DATABASE_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DATABASE_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+COLUMNAR_ENGINE = os.environ.get('COLUMNAR_ENGINE', 'false') == 'true'
+COLUMNAR_ENGINE_SYNC_INTERVAL = float(os.environ.get('COLUMNAR_ENGINE_SYNC_INTERVAL', '0'))
+
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'auto')
+
+CURRENCY_CACHE_SIZE = int(os.environ.get('CURRENCY_CACHE_SIZE', '4096'))
+
+HISTORY_FETCH_SIZE = int(os.environ.get('HISTORY_FETCH_SIZE', '500'))
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '16384'))
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')
+
+GUNICORN_BIND = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', '0'))
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '1'))
+GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', '')
+GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD', 'true') == 'true'
+GUNICORN_MAX_REQUESTS = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+GUNICORN_MAX_REQUESTS_JITTER = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+GUNICORN_GRACEFUL_TIMEOUT = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+GUNICORN_KEEPALIVE = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+PROFILING = os.environ.get('PROFILING', 'false') == 'true'
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/easynvest-profiles')
+PROFILING_HEADER = os.environ.get('PROFILING_HEADER', 'X-Profile')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+
 RESOURCES_PATH = '{}/resources'.format(PROJECT_ROOT_PATH)
 SCHEMAS_PATH = '{}/schemas'.format(RESOURCES_PATH)
 TRANSACTIONS_PATH = '{}/transactions'.format(RESOURCES_PATH)
+QUERY_BUNDLE_PATH = os.environ.get('QUERY_BUNDLE_PATH', '{}/transactions.bundle.json'.format(RESOURCES_PATH))
 
 TITULO_TESOURO_CATEGORIES = ['LTN', 'LFT', 'NTN-B', 'NTN-B Principal', 'NTN-C', 'NTN-F']
 TITULO_TESOURO_ACTIONS = ['VENDA', 'RESGATE']
 
-INITIAL_DATE = pendulum.create(2002, 1, 1, 0, 0, 0)
+INITIAL_DATE = datetime.datetime(2002, 1, 1, 0, 0, 0)
+
+
+def to_period(year, month):
+    """Returns the period of a month: the number of months since INITIAL_DATE,
+    the key of the records in "tesouro_direto_series".
+    """
+    return (year - INITIAL_DATE.year) * 12 + month - 1
+
+
+def current_period():
+    """Returns the period of the current month.
+    """
+    today = datetime.date.today()
+    return to_period(today.year, today.month)
+
+
+def from_period(period):
+    """Returns the (year, month) of a period.
+    """
+    return (INITIAL_DATE.year + period // 12, period % 12 + 1)
@@ -0,0 +1,224 @@
+"""In-memory columnar copy of the time series, used to answer the read queries
+without hitting the database.
+"""
+
+
+import threading
+import time
+
+import numpy
+
+from src.basics import TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS, INITIAL_DATE
+
+
+class ColumnarEngine(object):
+    """Keeps "tesouro_direto_series" as dense arrays of shape (categories, actions,
+    months), indexed by the period (months since INITIAL_DATE). Missing amounts are
+    NaN and missing ids are zero. The months axis always holds whole years, so
+    it can be reshaped into (years, 12) to aggregate by year.
+
+    The engine does not access the database: it is loaded with the rows of
+    "load-series" and the data version (version, updated_at) they correspond
+    to, and writes are applied through "apply". A version that does not follow
+    the current one means another process wrote too, and the engine is marked
+    stale.
+    """
+
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+
+        self.version = None
+        self.checked_at = 0.0
+
+        self._lock = threading.RLock()
+        self._amounts = None
+        self._ids = None
+        self._index = dict()
+
+    def _allocate(self, months):
+        shape = (len(TITULO_TESOURO_CATEGORIES), len(TITULO_TESOURO_ACTIONS), months)
+        return (numpy.full(shape, numpy.nan), numpy.zeros(shape, dtype=numpy.int64))
+
+    def _grow(self, period):
+        months = self._amounts.shape[2]
+        if period < months:
+            return
+
+        (amounts, ids) = self._allocate((period // 12 + 1) * 12)
+        amounts[:, :, : months] = self._amounts
+        ids[:, :, : months] = self._ids
+        (self._amounts, self._ids) = (amounts, ids)
+
+    def _put(self, titulo_id, category, action, period, amount):
+        self._grow(period)
+
+        c = TITULO_TESOURO_CATEGORIES.index(category)
+        a = TITULO_TESOURO_ACTIONS.index(action)
+
+        self._amounts[c, a, period] = amount
+        self._ids[c, a, period] = titulo_id
+        self._index[titulo_id] = (c, a, period)
+
+    def _remove(self, titulo_id):
+        position = self._index.pop(titulo_id, None)
+        if position is not None:
+            self._amounts[position] = numpy.nan
+            self._ids[position] = 0
+
+        return position
+
+    def is_loaded(self):
+        return self._amounts is not None
+
+    def needs_check(self, now=None):
+        now = time.time() if now is None else now
+        return (not self.is_loaded()) or (now - self.checked_at >= self.sync_interval)
+
+    def checked(self, now=None):
+        self.checked_at = time.time() if now is None else now
+
+    def load(self, rows, version):
+        """Rebuilds the arrays from rows (id, category, action, period, amount).
+        """
+        rows = list(rows)
+        last_period = max([row[3] for row in rows] + [0])
+
+        with self._lock:
+            (self._amounts, self._ids) = self._allocate((last_period // 12 + 1) * 12)
+            self._index = dict()
+
+            for (titulo_id, category, action, period, amount) in rows:
+                self._put(titulo_id, category, action, period, amount)
+
+            self.version = version
+
+    def apply(self, version, write, *args):
+        """Applies a write committed by this process, "version" being the data
+        version right after it.
+        """
+        with self._lock:
+            if not self.is_loaded():
+                return
+
+            write(*args)
+
+            if self.version is not None and version[0] == self.version[0] + 1:
+                self.version = version
+            else:
+                self.version = None
+                self.checked_at = 0.0
+
+    def insert(self, titulo_id, category, action, period, amount):
+        self._put(titulo_id, category, action, period, amount)
+
+    def insert_many(self, rows):
+        for (titulo_id, category, action, period, amount) in rows:
+            self.insert(titulo_id, category, action, period, amount)
+
+    def delete(self, titulo_id):
+        self._remove(titulo_id)
+
+    def delete_many(self, ids):
+        for titulo_id in ids:
+            self._remove(titulo_id)
+
+    def update(self, titulo_id, action, period, amount):
+        position = self._index.get(titulo_id)
+        if position is None:
+            return
+
+        (c, a, _) = position
+        action = TITULO_TESOURO_ACTIONS[a] if action is None else action
+        amount = self._amounts[position] if amount is None else amount
+
+        self._remove(titulo_id)
+        self._put(titulo_id, TITULO_TESOURO_CATEGORIES[c], action, period, amount)
+
+    def update_many(self, rows):
+        """Replaces the records by rows (id, category, action, period, amount)
+        holding their values after the update. All of them are removed before
+        any is put back, as one may take the month another one left.
+        """
+        for row in rows:
+            self._remove(row[0])
+        self.insert_many(rows)
+
+    def get_category(self, titulo_id):
+        with self._lock:
+            position = self._index.get(titulo_id)
+
+        if position is None:
+            return None
+        return TITULO_TESOURO_CATEGORIES[position[0]]
+
+    def _series(self, category, action, start, end):
+        """Slice of whole years covering the periods [start, end], with the months
+        outside of them masked as NaN. Returns the first period and the slice.
+        """
+        start = max(start, 0)
+
+        with self._lock:
+            c = TITULO_TESOURO_CATEGORIES.index(category)
+            a = TITULO_TESOURO_ACTIONS.index(action)
+
+            first = start - start % 12
+            last = min(end - end % 12 + 12, self._amounts.shape[2])
+            series = self._amounts[c, a, first : last].copy()
+
+        series[: start - first] = numpy.nan
+        if end + 1 - first < len(series):
+            series[end + 1 - first :] = numpy.nan
+
+        return (first, series)
+
+    def _years(self, first, series):
+        by_year = series.reshape(-1, 12)
+        present = ~numpy.isnan(by_year).all(axis=1)
+        sums = numpy.nansum(by_year, axis=1)
+        years = numpy.arange(len(by_year)) + first // 12 + INITIAL_DATE.year
+
+        return (years, present, sums)
+
+    def history(self, category, start, end):
+        """Rows (period, valor_venda, valor_resgate) of the months having both
+        actions, as in "read-history".
+        """
+        (first, venda) = self._series(category, 'VENDA', start, end)
+        (_, resgate) = self._series(category, 'RESGATE', start, end)
+        periods = numpy.arange(first, first + len(venda))
+
+        present = ~(numpy.isnan(venda) | numpy.isnan(resgate))
+
+        return list(zip(periods[present].tolist(), venda[present].tolist(), resgate[present].tolist()))
+
+    def history_grouped(self, category, start, end):
+        """Rows (year, valor_venda, valor_resgate) of the years having both actions,
+        as in "read-history-grouped".
+        """
+        (first, venda) = self._series(category, 'VENDA', start, end)
+        (_, resgate) = self._series(category, 'RESGATE', start, end)
+
+        (years, venda_present, venda_sums) = self._years(first, venda)
+        (_, resgate_present, resgate_sums) = self._years(first, resgate)
+        present = venda_present & resgate_present
+
+        return list(zip(years[present].tolist(), venda_sums[present].tolist(),
+                        resgate_sums[present].tolist()))
+
+    def by_action(self, action, category, start, end):
+        """Rows (period, amount), as in "read-by-action".
+        """
+        (first, series) = self._series(category, action, start, end)
+        periods = numpy.arange(first, first + len(series))
+
+        present = ~numpy.isnan(series)
+
+        return list(zip(periods[present].tolist(), series[present].tolist()))
+
+    def by_action_grouped(self, action, category, start, end):
+        """Rows (year, amount), as in "read-by-action-grouped".
+        """
+        (first, series) = self._series(category, action, start, end)
+        (years, present, sums) = self._years(first, series)
+
+        return list(zip(years[present].tolist(), sums[present].tolist()))
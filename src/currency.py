@@ -0,0 +1,116 @@
+"""Formats amounts in BRL.
+"""
+
+
+import decimal
+import functools
+import logging
+import re
+import threading
+
+from src.basics import CURRENCY_CACHE_SIZE
+
+
+# amounts formatted by babel to find the pattern of the locale
+PROBE = 1234567.89
+PROBE_REGEX = re.compile(r'^(\D*)1(\D*)234(\D*)567(\D*)89(\D*)$')
+
+# amounts that must be formatted exactly as by babel, covering the rounding
+# of halves, the grouping boundaries and negative amounts
+CHECKED_AMOUNTS = [0, 0.004, 0.005, 0.015, 0.025, 2.675, 1, 12.3, 999.995, 1000, 12345.675,
+                   1000000000.125, 123456789012.34, -0.5, -1234.565]
+
+
+class BRLFormatter(object):
+    """Formats amounts as "format_currency(amount, 'BRL')" does for the locale,
+    without parsing the CLDR pattern on every call: the prefix, suffix and
+    separators are taken from babel's own output once, and the amounts are
+    rounded half to even as babel does.
+
+    The last "cache_size" amounts formatted are cached. Locales whose patterns
+    are not supported (e.g. grouping by 2) are formatted by babel itself.
+
+    babel is only imported, and the pattern derived, on the first use, so that
+    importing the service does not pay for it. Without "locale", the locale of
+    LC_NUMERIC is used.
+    """
+
+    def __init__(self, locale=None, cache_size=CURRENCY_CACHE_SIZE):
+        self.locale = locale
+        self.cache_size = cache_size
+
+        self._is_fast = None
+        self._lock = threading.Lock()
+
+    def _setup(self):
+        with self._lock:
+            if self._is_fast is not None:
+                return
+
+            from babel.numbers import format_currency, LC_NUMERIC
+            self._format_currency = format_currency
+            if self.locale is None:
+                self.locale = LC_NUMERIC
+
+            is_fast = self._derive_pattern()
+
+            if is_fast and any([self._format(amount) != self._babel(amount) for amount in CHECKED_AMOUNTS]):
+                is_fast = False
+
+            if not is_fast:
+                logging.warning('BRL pattern of locale "{}" not supported; formatting with babel.'.format(self.locale))
+
+            self._uncached = self._format if is_fast else self._babel
+            self._cached = functools.lru_cache(maxsize=self.cache_size)(self._uncached)
+            self._is_fast = is_fast
+
+            # the next calls skip the setup
+            self.format = self._format_amount
+
+    @property
+    def is_fast(self):
+        self._setup()
+        return self._is_fast
+
+    def format(self, amount):
+        self._setup()
+        return self._format_amount(amount)
+
+    def _format_amount(self, amount):
+        # 0.0 and -0.0 are the same key for the cache, but are formatted differently
+        if amount == 0:
+            return self._uncached(amount)
+        return self._cached(amount)
+
+    def _babel(self, amount):
+        return self._format_currency(amount, 'BRL', locale=self.locale)
+
+    def _derive_pattern(self):
+        positive = PROBE_REGEX.match(self._babel(PROBE))
+        negative = PROBE_REGEX.match(self._babel(-PROBE))
+        if positive is None or negative is None:
+            return False
+
+        (prefix, group, other_group, decimal_symbol, suffix) = positive.groups()
+        if group != other_group or negative.groups()[1 : 4] != positive.groups()[1 : 4]:
+            return False
+
+        self._prefix = (prefix, negative.group(1))
+        self._suffix = (suffix, negative.group(5))
+        self._group = group
+        self._decimal = decimal_symbol
+
+        return True
+
+    def _format(self, amount):
+        number = format(decimal.Decimal(str(amount)), ',.2f')
+
+        is_negative = number.startswith('-')
+        (integer, fraction) = number.lstrip('-').split('.')
+
+        return '{}{}{}{}{}'.format(self._prefix[is_negative], integer.replace(',', self._group),
+                                   self._decimal, fraction, self._suffix[is_negative])
+
+    def cache_info(self):
+        self._setup()
+        return self._cached.cache_info()
@@ -0,0 +1,249 @@
+"""Manages the connections to the database.
+"""
+
+
+import contextlib
+import logging
+import os
+import re
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from src.basics import DATABASE_PARAMS, DATABASE_POOL_MIN_SIZE, DATABASE_POOL_MAX_SIZE
+from src.basics import DATABASE_POOL_TIMEOUT, DATABASE_POOL_HEALTH_CHECK_INTERVAL
+
+
+class PreparedStatementConnection(psycopg2.extensions.connection):
+    """Connection that remembers the statements already prepared on the server,
+    so each query is parsed and planned once per connection and afterwards only
+    executed with its parameters.
+
+    Parameters and result columns of enum types are handled as text inside the
+    queries (e.g. "$1::text::category_type" and "category::text"), so prepared
+    statements keep working when the schema is dropped and created again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PreparedStatementConnection, self).__init__(*args, **kwargs)
+
+        self.prepared = set()
+        self.declarable = dict()
+
+    def prepare(self, cur, name, sql):
+        if name not in self.prepared:
+            cur.execute('PREPARE "{}" AS {}'.format(name, sql.strip().rstrip(';')))
+            self.prepared.add(name)
+
+    def execute_prepared(self, cur, name, sql, params=()):
+        self.prepare(cur, name, sql)
+
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cur.execute('EXECUTE "{}" ({})'.format(name, placeholders), params)
+        else:
+            cur.execute('EXECUTE "{}"'.format(name))
+
+    def declare(self, name, sql, params=()):
+        """Executes the query in a named server-side cursor ("DECLARE ... CURSOR"),
+        returned so its rows are fetched in batches with "fetchmany". A cursor
+        cannot be declared over a prepared statement, so the query is sent with
+        its parameters bound by psycopg2 instead. Must run inside a transaction.
+        """
+        if name not in self.declarable:
+            sql = sql.strip().rstrip(';').replace('%', '%%')
+            self.declarable[name] = re.sub(r'\$(\d+)', lambda match: '%({})s'.format(match.group(1)), sql)
+
+        cur = self.cursor(name=name)
+        cur.execute(self.declarable[name], {str(i + 1): param for (i, param) in enumerate(params)})
+
+        return cur
+
+
+class ConnectionPool(object):
+    """Pool of reusable connections, owned by a single process. The connections
+    are opened lazily, on the first checkout, so each gunicorn worker builds its
+    own pool. If the process forks after that, the child discards (without
+    closing) the inherited connections and starts a new pool.
+
+    Safe to use from multiple threads: at most "max_size" connections are
+    checked out at once and the others wait up to "timeout" seconds.
+    """
+
+    _inherited = list()
+
+    def __init__(self, min_size=DATABASE_POOL_MIN_SIZE, max_size=DATABASE_POOL_MAX_SIZE,
+                 timeout=DATABASE_POOL_TIMEOUT, health_check_interval=DATABASE_POOL_HEALTH_CHECK_INTERVAL):
+        assert 0 <= min_size <= max_size, '"min_size" must be in interval [0, max_size].'
+        assert max_size > 0, '"max_size" must be greater than zero.'
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._last_used = dict()
+        self._counters = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'failed_health_checks': 0,
+            'wait_seconds': 0.0
+        }
+
+    def _after_fork(self):
+        # Closing the inherited connections would terminate the sessions still
+        # used by the parent, so they are only kept referenced and forgotten.
+        if self._pool is not None:
+            ConnectionPool._inherited.append(self._pool)
+            logging.info('Connection pool discarded after fork (pid {}).'.format(os.getpid()))
+
+        self._reset()
+
+    def _get_pool(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.min_size, self.max_size, connection_factory=PreparedStatementConnection,
+                        **DATABASE_PARAMS)
+                    logging.info('Connection pool opened (pid {}, size [{}, {}]).'.format(
+                        self._pid, self.min_size, self.max_size))
+
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.time() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.autocommit = False
+        except psycopg2.Error:
+            return False
+
+        return True
+
+    def open(self):
+        """Opens the pool (and its "min_size" connections) ahead of the first
+        checkout.
+        """
+        self._get_pool()
+
+    def getconn(self):
+        start = time.time()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise psycopg2.pool.PoolError('No database connection available after {} seconds.'.format(self.timeout))
+
+        try:
+            pool = self._get_pool()
+
+            for _ in range(self.max_size + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    break
+
+                with self._lock:
+                    self._counters['failed_health_checks'] += 1
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+            else:
+                raise psycopg2.OperationalError('No healthy database connection available.')
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._counters['checkouts'] += 1
+            self._counters['wait_seconds'] += time.time() - start
+
+        return conn
+
+    def putconn(self, conn):
+        pool = self._pool
+        if pool is None or self._pid != os.getpid():
+            # Connection from a pool discarded by a fork; it belongs to the parent.
+            return
+
+        try:
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+            else:
+                self._last_used[id(conn)] = time.time()
+                pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Checks out a connection, commits when the block succeeds and rolls
+        back otherwise, always returning the connection to the pool.
+        """
+        conn = self.getconn()
+
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        """Closes all connections of this process. Meant for worker shutdown.
+        """
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+                logging.info('Connection pool closed (pid {}).'.format(self._pid))
+            self._pool = None
+            self._last_used = dict()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+
+        pool = self._pool
+        idle = len(pool._pool) if pool is not None else 0
+        in_use = len(pool._used) if pool is not None else 0
+
+        stats.update({
+            'pid': self._pid,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'open': idle + in_use,
+            'idle': idle,
+            'in_use': in_use
+        })
+
+        return stats
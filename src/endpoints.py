@@ -6,6 +6,11 @@ import falcon
 import json
 import logging
 
+from src.basics import STREAM_CHUNK_SIZE, current_period
+
+
+NDJSON = 'application/x-ndjson'
+
 
 class EndpointExpositor(object):
     """Exposes the endpoints, divided in endpoints for data and metadata. The
@@ -13,12 +18,17 @@ class EndpointExpositor(object):
     for metadata are all others.
     """
 
-    def __init__(self, falcon_api, titulo_tesouro_crud):
+    def __init__(self, falcon_api, titulo_tesouro_crud, serializer, metrics=None):
         self.falcon_api = falcon_api
+        self.metrics = metrics
 
-        titulo_tesouro_request_handler = TituloTesouroRequestHandler(titulo_tesouro_crud)
-        titulo_tesouro_compare_request_handler = TituloTesouroCompareRequestHandler(titulo_tesouro_crud)
-        titulo_tesouro_by_action_request_handler = TituloTesouroByActionRequestHandler(titulo_tesouro_crud)
+        if metrics:
+            titulo_tesouro_crud = metrics.instrument_crud(titulo_tesouro_crud)
+            serializer = metrics.instrument_serializer(serializer)
+
+        titulo_tesouro_request_handler = TituloTesouroRequestHandler(titulo_tesouro_crud, serializer)
+        titulo_tesouro_compare_request_handler = TituloTesouroCompareRequestHandler(titulo_tesouro_crud, serializer)
+        titulo_tesouro_by_action_request_handler = TituloTesouroByActionRequestHandler(titulo_tesouro_crud, serializer)
 
         self.endpoint_mapping = {
             '/': None,
@@ -29,8 +39,11 @@ class EndpointExpositor(object):
             '/titulo_tesouro/resgate/{titulo_id}': titulo_tesouro_by_action_request_handler
         }
 
+        if metrics:
+            self.endpoint_mapping['/metrics'] = MetricsRequestHandler(metrics, serializer)
+
         endpoints = list(self.endpoint_mapping.keys())
-        self.endpoint_mapping['/'] = HelpRequestHandler(endpoints)
+        self.endpoint_mapping['/'] = HelpRequestHandler(endpoints, titulo_tesouro_crud, serializer)
 
     def expose(self):
         for (endpoint, handler) in self.endpoint_mapping.items():
@@ -41,53 +54,159 @@ class EndpointExpositor(object):
 
 
 class RequestHandler(object):
-    """Superclass for all request handlers.
+    """Superclass for all request handlers. The response bodies are serialized
+    by "serializer" (see module "serializers") straight into bytes.
     """
 
+    # handlers that also stream NDJSON (see "wants_ndjson"), under the same ETag
+    negotiates_ndjson = False
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
     def on_post(self, req, resp):
-        logging.info('POST request received at endpoint "{}"'.format(req.path))
+        logging.debug('POST request received at endpoint "%s"', req.path)
 
     def on_delete(self, req, resp):
-        logging.info('DELETE request received at endpoint "{}"'.format(req.path))
+        logging.debug('DELETE request received at endpoint "%s"', req.path)
 
     def on_put(self, req, resp):
-        logging.info('PUT request received at endpoint "{}"'.format(req.path))
+        logging.debug('PUT request received at endpoint "%s"', req.path)
 
     def on_get(self, req, resp):
-        logging.info('GET request received at endpoint "{}"'.format(req.path))
+        logging.debug('GET request received at endpoint "%s"', req.path)
 
     def set_response_status_code(self, resp, code):
         resp.status = getattr(falcon, 'HTTP_{}'.format(code))
-        logging.info('Response status code: {}\n'.format(resp.status))
+        logging.debug('Response status code: %s', resp.status)
 
     def err_bad_request(self, resp, message):
-        logging.error(message)
+        # logged with the request, by RequestLoggingMiddleware
+        resp.context['err'] = message
 
-        resp.body = json.dumps({
+        resp.data = self.serializer.dumps({
             'err': message
         })
         self.set_response_status_code(resp, 400)
 
     def err_not_found(self, resp, message):
-        logging.error(message)
+        resp.context['err'] = message
 
-        resp.body = json.dumps({
+        resp.data = self.serializer.dumps({
             'err': message
         })
         self.set_response_status_code(resp, 404)
 
-    def ok(self, resp, message):
-        logging.info(message)
-
-        resp.body = json.dumps({
+    def validators(self, req, version):
+        """Returns the validators ("ETag", "Last-Modified") of the response to "req"
+        at the data version (version, updated_at). The ETag also tells the
+        representation (JSON or NDJSON) and, without "data_fim", the current
+        month ending the interval: the response then changes with the month, not
+        only with the data, so it has no "Last-Modified".
+        """
+        etag = str(version[0])
+        last_modified = version[1]
+
+        if 'data_fim' not in req.params:
+            etag = '{}-{}'.format(etag, current_period())
+            last_modified = None
+        if self.negotiates_ndjson and self.wants_ndjson(req):
+            etag = '{}-ndjson'.format(etag)
+
+        return ('"{}"'.format(etag), last_modified)
+
+    def set_version_headers(self, resp, validators):
+        """Sets "ETag" and "Last-Modified" from the validators, and "Vary" if the
+        representation depends on "Accept".
+        """
+        (etag, last_modified) = validators
+
+        resp.set_header('ETag', etag)
+        if last_modified is not None:
+            resp.set_header('Last-Modified', falcon.util.dt_to_http(last_modified))
+        if self.negotiates_ndjson:
+            resp.vary = ('Accept',)
+
+    def is_fresh(self, req, validators):
+        """Checks if the client already has this response, by "If-None-Match" or,
+        in its absence, by "If-Modified-Since". The request must still be
+        validated, and its resource found, before answering "304 Not Modified".
+        """
+        (etag, last_modified) = validators
+
+        if_none_match = req.get_header('If-None-Match')
+        if if_none_match is not None:
+            etags = [tag.strip() for tag in if_none_match.split(',')]
+            etags = [tag[2 :] if tag.startswith('W/') else tag for tag in etags]
+            return '*' in etags or etag in etags
+
+        if_modified_since = req.get_header('If-Modified-Since')
+        if if_modified_since is not None and last_modified is not None:
+            try:
+                if_modified_since = falcon.util.http_date_to_dt(if_modified_since)
+            except ValueError:
+                return False
+            return last_modified.replace(microsecond=0) <= if_modified_since
+
+        return False
+
+    def not_modified(self, resp, validators):
+        self.set_version_headers(resp, validators)
+        self.set_response_status_code(resp, 304)
+
+    def ok(self, resp, message, validators=None):
+        logging.debug('%s', message)
+
+        resp.data = self.serializer.dumps({
             'success': message
         })
+        if validators is not None:
+            self.set_version_headers(resp, validators)
         self.set_response_status_code(resp, 200)
 
+    def wants_ndjson(self, req):
+        """Checks if the client names NDJSON in "Accept" and does not prefer JSON
+        to it (wildcards such as "*/*" always get JSON).
+        """
+        if NDJSON not in (req.accept or ''):
+            return False
+        return req.client_prefers([falcon.MEDIA_JSON, NDJSON]) == NDJSON
+
+    def stream(self, resp, records, validators):
+        """Streams "records" as NDJSON, one JSON object per line, through
+        "resp.stream" while they are generated.
+        """
+        resp.stream = self._ndjson_chunks(records)
+        resp.content_type = NDJSON
+
+        self.set_version_headers(resp, validators)
+        self.set_response_status_code(resp, 200)
+
+    def _ndjson_chunks(self, records):
+        # lines are sent in chunks of about STREAM_CHUNK_SIZE bytes, not one by one
+        chunk = list()
+        size = 0
+
+        try:
+            for record in records:
+                line = self.serializer.dumps(record) + b'\n'
+                chunk.append(line)
+                size += len(line)
+
+                if size >= STREAM_CHUNK_SIZE:
+                    yield b''.join(chunk)
+                    chunk = list()
+                    size = 0
+
+            if chunk:
+                yield b''.join(chunk)
+        finally:
+            records.close()
+
     def created(self, resp, message):
-        logging.info(message)
+        logging.debug('%s', message)
 
-        resp.body = json.dumps({
+        resp.data = self.serializer.dumps({
             'success': message
         })
         self.set_response_status_code(resp, 201)
@@ -97,25 +216,47 @@ class HelpRequestHandler(RequestHandler):
     """Checks system health and provides instructions.
     """
 
-    def __init__(self, endpoints):
-        super(HelpRequestHandler, self).__init__()
+    def __init__(self, endpoints, titulo_tesouro_crud, serializer):
+        super(HelpRequestHandler, self).__init__(serializer)
 
         self.endpoints = endpoints
+        self.titulo_tesouro_crud = titulo_tesouro_crud
 
     def on_get(self, req, resp):
         super(HelpRequestHandler, self).on_get(req, resp)
 
-        resp.body = 'System healthy.\n\nEndpoints: {}'.format(self.endpoints)
+        resp.body = 'System healthy.\n\nEndpoints: {}\n\nConnection pool: {}'.format(
+            self.endpoints, self.titulo_tesouro_crud.pool.stats())
+
+        self.set_response_status_code(resp, 200)
+
+
+class MetricsRequestHandler(RequestHandler):
+    """Exposes the metrics in the Prometheus text format.
+    """
+
+    def __init__(self, metrics, serializer):
+        super(MetricsRequestHandler, self).__init__(serializer)
+
+        self.metrics = metrics
+
+    def on_get(self, req, resp):
+        super(MetricsRequestHandler, self).on_get(req, resp)
+
+        resp.data = self.metrics.exposition()
+        resp.content_type = self.metrics.content_type
 
         self.set_response_status_code(resp, 200)
 
 
 class TituloTesouroRequestHandler(RequestHandler):
-    """Handler for POST in endpoint "titulo_tesouro".
+    """Handler for endpoints "titulo_tesouro" (batches) and "titulo_tesouro/{titulo_id}".
     """
 
-    def __init__(self, titulo_tesouro_crud):
-        super(TituloTesouroRequestHandler, self).__init__()
+    negotiates_ndjson = True
+
+    def __init__(self, titulo_tesouro_crud, serializer):
+        super(TituloTesouroRequestHandler, self).__init__(serializer)
 
         self.titulo_tesouro_crud = titulo_tesouro_crud
 
@@ -139,6 +280,10 @@ class TituloTesouroRequestHandler(RequestHandler):
         stream = req.bounded_stream.read().decode('utf8')
         body = json.loads(stream)
 
+        if isinstance(body, list):
+            self._create_many(resp, body)
+            return
+
         missing_fields = self._check_missing_fields(body)
         if missing_fields:
             self.err_bad_request(resp, 'Mandatory fields {} missing.'.format(missing_fields))
@@ -152,9 +297,38 @@ class TituloTesouroRequestHandler(RequestHandler):
         except Exception as e:
             self.err_bad_request(resp, str(e))
 
-    def on_delete(self, req, resp, titulo_id):
+    def _create_many(self, resp, records):
+        errors = list()
+        for (i, record) in enumerate(records):
+            if not isinstance(record, dict):
+                errors.append({'índice': i, 'err': 'Record must be an object.'})
+                continue
+
+            missing_fields = self._check_missing_fields(record)
+            if missing_fields:
+                errors.append({'índice': i, 'err': 'Mandatory fields {} missing.'.format(missing_fields)})
+
+        if errors:
+            self.err_bad_request(resp, errors)
+            return
+
+        try:
+            (ret, errors) = self.titulo_tesouro_crud.create_many(records)
+
+            if errors:
+                self.err_bad_request(resp, errors)
+            else:
+                self.created(resp, ret)
+        except Exception as e:
+            self.err_bad_request(resp, str(e))
+
+    def on_delete(self, req, resp, titulo_id=None):
         super(TituloTesouroRequestHandler, self).on_delete(req, resp)
 
+        if titulo_id is None:
+            self._delete_many(req, resp)
+            return
+
         try:
             ret = self.titulo_tesouro_crud.delete(titulo_id)
 
@@ -165,7 +339,22 @@ class TituloTesouroRequestHandler(RequestHandler):
         except Exception as e:
             self.err_bad_request(resp, str(e))
 
-    def on_put(self, req, resp, titulo_id):
+    def _delete_many(self, req, resp):
+        if req.content_length == 0:
+            self.err_bad_request(resp, 'No request body.')
+            return
+
+        stream = req.bounded_stream.read().decode('utf8')
+        body = json.loads(stream)
+
+        try:
+            ret = self.titulo_tesouro_crud.delete_many(body)
+
+            self.ok(resp, {'ids': ret})
+        except Exception as e:
+            self.err_bad_request(resp, str(e))
+
+    def on_put(self, req, resp, titulo_id=None):
         super(TituloTesouroRequestHandler, self).on_put(req, resp)
 
         if req.content_length == 0:
@@ -179,6 +368,10 @@ class TituloTesouroRequestHandler(RequestHandler):
             self.err_bad_request(resp, 'Empty request body.')
             return
 
+        if titulo_id is None:
+            self._update_many(resp, body)
+            return
+
         try:
             ret = self.titulo_tesouro_crud.update(titulo_id, body)
 
@@ -190,16 +383,45 @@ class TituloTesouroRequestHandler(RequestHandler):
         except Exception as e:
             self.err_bad_request(resp, str(e))
 
+    def _update_many(self, resp, records):
+        if not isinstance(records, list):
+            self.err_bad_request(resp, 'Request body must be a list of records.')
+            return
+
+        try:
+            (ret, errors) = self.titulo_tesouro_crud.update_many(records)
+
+            if errors:
+                self.err_bad_request(resp, errors)
+            else:
+                self.ok(resp, {'ids': ret})
+        except Exception as e:
+            self.err_bad_request(resp, str(e))
+
     def on_get(self, req, resp, titulo_id):
         super(TituloTesouroRequestHandler, self).on_get(req, resp)
 
         params = req.params
 
         try:
-            ret = self.titulo_tesouro_crud.read_history(titulo_id, params)
+            # read before the data, so the version is never newer than the response
+            validators = self.validators(req, self.titulo_tesouro_crud.data_version())
+            if self.is_fresh(req, validators):
+                if self.titulo_tesouro_crud.check_read(titulo_id, params):
+                    self.not_modified(resp, validators)
+                else:
+                    self.err_not_found(resp, '"titulo_id" has no register.')
+                return
+
+            if self.wants_ndjson(req):
+                ret = self.titulo_tesouro_crud.stream_history(titulo_id, params)
+                respond = self.stream
+            else:
+                ret = self.titulo_tesouro_crud.read_history(titulo_id, params)
+                respond = self.ok
 
             if ret:
-                self.ok(resp, ret)
+                respond(resp, ret, validators)
             else:
                 self.err_not_found(resp, '"titulo_id" has no register.')
         except Exception as e:
@@ -210,8 +432,8 @@ class TituloTesouroCompareRequestHandler(RequestHandler):
     """Handler for POST in endpoint "titulo_tesouro/comparar".
     """
 
-    def __init__(self, titulo_tesouro_crud):
-        super(TituloTesouroCompareRequestHandler, self).__init__()
+    def __init__(self, titulo_tesouro_crud, serializer):
+        super(TituloTesouroCompareRequestHandler, self).__init__(serializer)
 
         self.titulo_tesouro_crud = titulo_tesouro_crud
 
@@ -221,10 +443,18 @@ class TituloTesouroCompareRequestHandler(RequestHandler):
         params = req.params
 
         try:
+            validators = self.validators(req, self.titulo_tesouro_crud.data_version())
+            if self.is_fresh(req, validators):
+                if self.titulo_tesouro_crud.check_compare(params):
+                    self.not_modified(resp, validators)
+                else:
+                    self.err_not_found(resp, 'One of the ids was not found.')
+                return
+
             ret = self.titulo_tesouro_crud.compare(params)
 
-            if ret:
-                self.ok(resp, ret)
+            if ret is not False:
+                self.ok(resp, ret, validators)
             else:
                 self.err_not_found(resp, 'One of the ids was not found.')
         except Exception as e:
@@ -235,8 +465,10 @@ class TituloTesouroByActionRequestHandler(RequestHandler):
     """Handler for POST in endpoints "titulo_tesouro/venda" and "titulo_tesouro/resgate".
     """
 
-    def __init__(self, titulo_tesouro_crud):
-        super(TituloTesouroByActionRequestHandler, self).__init__()
+    negotiates_ndjson = True
+
+    def __init__(self, titulo_tesouro_crud, serializer):
+        super(TituloTesouroByActionRequestHandler, self).__init__(serializer)
 
         self.titulo_tesouro_crud = titulo_tesouro_crud
 
@@ -247,10 +479,23 @@ class TituloTesouroByActionRequestHandler(RequestHandler):
         params = req.params
 
         try:
-            ret = self.titulo_tesouro_crud.read_by_action(titulo_id, action, params)
+            validators = self.validators(req, self.titulo_tesouro_crud.data_version())
+            if self.is_fresh(req, validators):
+                if self.titulo_tesouro_crud.check_read(titulo_id, params):
+                    self.not_modified(resp, validators)
+                else:
+                    self.err_not_found(resp, '"titulo_id" has no register for action "{}".'.format(action))
+                return
+
+            if self.wants_ndjson(req):
+                ret = self.titulo_tesouro_crud.stream_by_action(titulo_id, action, params)
+                respond = self.stream
+            else:
+                ret = self.titulo_tesouro_crud.read_by_action(titulo_id, action, params)
+                respond = self.ok
 
             if ret:
-                self.ok(resp, ret)
+                respond(resp, ret, validators)
             else:
                 self.err_not_found(resp, '"titulo_id" has no register for action "{}".'.format(action))
         except Exception as e:
@@ -0,0 +1,76 @@
+"""Gunicorn configuration of the web service, used by start-app.sh:
+
+    gunicorn -c src/gunicorn_config.py src.main
+
+The application is loaded once by the master ("preload_app") and forked into
+the workers, so the queries and the columnar engine are read only once. The
+master's connections are closed before forking; each worker opens its own pool
+and prepares the queries before accepting requests, and is recycled after about
+"max_requests" requests.
+
+All settings come from the environment variables "GUNICORN_*" (see module
+"basics"). Without "GUNICORN_WORKERS", there are 2 workers per CPU plus one.
+"""
+
+
+import glob
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.basics import GUNICORN_BIND, GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_WORKER_CLASS
+from src.basics import GUNICORN_PRELOAD, GUNICORN_MAX_REQUESTS, GUNICORN_MAX_REQUESTS_JITTER
+from src.basics import GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE
+
+
+bind = GUNICORN_BIND
+workers = GUNICORN_WORKERS if GUNICORN_WORKERS > 0 else multiprocessing.cpu_count() * 2 + 1
+threads = GUNICORN_THREADS
+worker_class = GUNICORN_WORKER_CLASS if GUNICORN_WORKER_CLASS else ('gthread' if threads > 1 else 'sync')
+
+preload_app = GUNICORN_PRELOAD
+max_requests = GUNICORN_MAX_REQUESTS
+max_requests_jitter = GUNICORN_MAX_REQUESTS_JITTER
+timeout = GUNICORN_TIMEOUT
+graceful_timeout = GUNICORN_GRACEFUL_TIMEOUT
+keepalive = GUNICORN_KEEPALIVE
+
+# the workers share their metrics through this directory (see module "metrics"),
+# which must be set before prometheus_client is imported by the application
+if workers > 1 and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='easynvest-metrics-')
+
+
+def on_starting(server):
+    # samples of a previous run would be added to the new ones
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        for filename in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(filename)
+
+
+def when_ready(server):
+    # the master loaded the application only to fork it, so it does not need the
+    # connections opened by the warmup
+    if server.cfg.preload_app:
+        from src import main
+        main.titulo_tesouro_crud.pool.close()
+
+
+def post_worker_init(worker):
+    from src import main
+    main.titulo_tesouro_crud.warmup()
+
+
+def worker_exit(server, worker):
+    from src import main
+    main.titulo_tesouro_crud.pool.close()
+    main.queue_logging.stop()
+
+
+def child_exit(server, worker):
+    from src.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
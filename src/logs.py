@@ -0,0 +1,138 @@
+"""Configures the logging of the web service: records are handed to a queue and
+written by a background thread, and each request is logged in a single line.
+"""
+
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+from src.basics import LOG_LEVEL, LOG_SAMPLING
+
+
+LOG_FORMAT = '[%(asctime)s] [%(levelname)s] %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S %Z'
+
+# logger of the request lines, the only one sampled
+access_logger = logging.getLogger('access')
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Puts the records in the queue without formatting them, so the message
+    is only built by the listener thread. The arguments of the records must
+    not change after the call (e.g. strings and numbers).
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks keep frames alive, so they are rendered right away
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of the records of each level, as given by
+    "rates" (e.g. {logging.INFO: 0.1}). Levels not in "rates" are all kept.
+    """
+
+    def __init__(self, rates):
+        super(SamplingFilter, self).__init__()
+
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+def parse_sampling(sampling):
+    """Parses rates such as "INFO=0.1,WARNING=0.5" into {logging.INFO: 0.1, ...}.
+    """
+    rates = dict()
+
+    for item in sampling.split(','):
+        if not item.strip():
+            continue
+
+        (level, rate) = item.split('=')
+        level = logging.getLevelName(level.strip().upper())
+        assert isinstance(level, int), 'Unknown level in "LOG_SAMPLING": {}.'.format(item)
+        rate = float(rate)
+        assert 0 <= rate <= 1, 'Rates in "LOG_SAMPLING" must be in interval [0, 1].'
+
+        rates[level] = rate
+
+    return rates
+
+
+class QueueLogging(object):
+    """Routes all records through a queue to a stream handler running in a
+    background thread. If the process forks, the child starts its own queue
+    and thread (threads do not survive a fork).
+    """
+
+    def __init__(self, level=LOG_LEVEL, sampling=LOG_SAMPLING):
+        self.handler = logging.StreamHandler()
+        self.handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+        self.queue_handler = LazyQueueHandler(queue.SimpleQueue())
+        self.listener = None
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(getattr(logging, level))
+
+        access_logger.addFilter(SamplingFilter(parse_sampling(sampling)))
+
+        self.start()
+        atexit.register(self.stop)
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, self.handler)
+        self.listener.start()
+
+    def stop(self):
+        """Writes the records still in the queue and stops the thread.
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _after_fork(self):
+        self.queue_handler.queue = queue.SimpleQueue()
+        self.start()
+
+
+class RequestLoggingMiddleware(object):
+    """Falcon middleware that logs each request in a single line, with its
+    method, path, status and duration, and the error message of 4xx and 5xx
+    responses (stored by the handlers in "resp.context['err']"). Successful
+    requests are logged as INFO, client errors as WARNING and the others as
+    ERROR.
+    """
+
+    def process_request(self, req, resp):
+        req.context['started_at'] = time.perf_counter()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        duration = (time.perf_counter() - req.context.get('started_at', time.perf_counter())) * 1000
+        status = resp.status.split(' ', 1)[0]
+
+        if status < '400':
+            access_logger.info('method=%s path=%s status=%s duration_ms=%.3f',
+                               req.method, req.path, status, duration)
+        else:
+            level = logging.WARNING if status < '500' else logging.ERROR
+            access_logger.log(level, 'method=%s path=%s status=%s duration_ms=%.3f err=%s',
+                              req.method, req.path, status, duration, resp.context.get('err'))
@@ -5,19 +5,34 @@
 import falcon
 import logging
 
+from src.basics import PROFILING
 from src.endpoints import EndpointExpositor
+from src.logs import QueueLogging, RequestLoggingMiddleware
+from src.metrics import Metrics
+from src.serializers import get_serializer
 from src.services import TituloTesouroCRUD
 
 
-logging.basicConfig(format='[%(asctime)s] [%(levelname)s] %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S %Z',
-                    level=getattr(logging, 'INFO', 'DEBUG'))
+queue_logging = QueueLogging()
 
 logging.info('Starting web service.')
 
-falcon_api = application = falcon.API()
+metrics = Metrics()
+middleware = [RequestLoggingMiddleware(), metrics]
 
-endpoint_expositor = EndpointExpositor(falcon_api, TituloTesouroCRUD())
+profiler = None
+if PROFILING:
+    from src.profiling import ProfilingMiddleware
+    profiler = ProfilingMiddleware()
+    middleware.insert(0, profiler)
+    logging.info('Profiling requests into "{}".'.format(profiler.directory))
+
+falcon_api = application = falcon.API(middleware=middleware)
+
+titulo_tesouro_crud = TituloTesouroCRUD(metrics=metrics, profiler=profiler)
+titulo_tesouro_crud.warmup()
+
+endpoint_expositor = EndpointExpositor(falcon_api, titulo_tesouro_crud, get_serializer(), metrics)
 endpoint_expositor.expose()
 
 logging.info('Web service listening.\n')
@@ -0,0 +1,242 @@
+"""Collects metrics of the web service and exposes them in the Prometheus text
+format.
+
+With several Gunicorn workers, the environment variable
+"PROMETHEUS_MULTIPROC_DIR" must point to an empty directory shared by them, so
+each worker writes its samples there and the endpoint "/metrics" aggregates
+all of them, whichever worker answers it.
+"""
+
+
+import contextlib
+import os
+import threading
+import time
+import types
+
+import prometheus_client
+from prometheus_client import multiprocess
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+POOL_COUNTERS = ['checkouts', 'timeouts', 'failed_health_checks']
+
+
+class Metrics(object):
+    """Falcon middleware recording, per route and method, the requests and their
+    latency, and how much of it was spent inside "TituloTesouroCRUD" and
+    serializing the response. Also records the duration and rows fetched of each
+    query and the state of the connection pool.
+
+    The CRUD and the serializer are measured through the wrappers returned by
+    "instrument_crud" and "instrument_serializer", which add their time to the
+    request being handled by the thread. A streamed response is observed when
+    its stream is exhausted or closed, with the time spent producing its chunks.
+    """
+
+    content_type = prometheus_client.CONTENT_TYPE_LATEST
+
+    def __init__(self):
+        self.registry = prometheus_client.CollectorRegistry()
+        self.multiprocess = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+        self._local = threading.local()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_counters = dict()
+
+        self.requests = prometheus_client.Counter(
+            'http_requests_total', 'Requests handled.', ['route', 'method', 'status'], registry=self.registry)
+        self.latency = prometheus_client.Histogram(
+            'http_request_duration_seconds', 'Time to handle a request.', ['route', 'method'],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.crud_latency = prometheus_client.Histogram(
+            'http_request_crud_duration_seconds', 'Time of a request spent inside TituloTesouroCRUD.',
+            ['route', 'method'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.serialization_latency = prometheus_client.Histogram(
+            'http_request_serialization_duration_seconds', 'Time of a request spent serializing the response.',
+            ['route', 'method'], buckets=LATENCY_BUCKETS, registry=self.registry)
+
+        self.query_latency = prometheus_client.Histogram(
+            'db_query_duration_seconds', 'Time to execute a query of TituloTesouroCRUD.queries.', ['query'],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.query_rows = prometheus_client.Counter(
+            'db_query_rows_total', 'Rows returned or affected by a query of TituloTesouroCRUD.queries.', ['query'],
+            registry=self.registry)
+
+        self.pool_connections = prometheus_client.Gauge(
+            'db_pool_connections', 'Connections of the pools, by state.', ['state'],
+            multiprocess_mode='livesum', registry=self.registry)
+        self.pool_events = prometheus_client.Counter(
+            'db_pool_events_total', 'Checkouts, timeouts and failed health checks of the pools.', ['event'],
+            registry=self.registry)
+
+    def _current(self):
+        return getattr(self._local, 'current', None)
+
+    def _add(self, key, seconds):
+        current = self._current()
+        if current is not None:
+            current[key] += seconds
+
+    @contextlib.contextmanager
+    def _timed(self, key):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(key, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def _request(self, current):
+        self._local.current = current
+        try:
+            yield
+        finally:
+            self._local.current = None
+
+    def observe_query(self, name, seconds, rows):
+        self.query_latency.labels(name).observe(seconds)
+        if rows > 0:
+            self.query_rows.labels(name).inc(rows)
+
+    def observe_pool(self, stats):
+        # the pool is per process, so its events are added as deltas of its
+        # counters, which start over in a forked worker
+        if stats['pid'] != self._pool_pid:
+            self._pool_pid = stats['pid']
+            self._pool_counters = dict()
+
+        for state in ['idle', 'in_use']:
+            self.pool_connections.labels(state).set(stats[state])
+
+        for event in POOL_COUNTERS:
+            delta = stats[event] - self._pool_counters.get(event, 0)
+            if delta > 0:
+                self.pool_events.labels(event).inc(delta)
+            self._pool_counters[event] = stats[event]
+
+    def instrument_crud(self, crud):
+        self._pool = crud.pool
+        return InstrumentedCRUD(crud, self)
+
+    def instrument_serializer(self, serializer):
+        return InstrumentedSerializer(serializer, self)
+
+    def process_request(self, req, resp):
+        self._local.current = {'started_at': time.perf_counter(), 'crud': 0.0, 'serialization': 0.0}
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        current = self._current()
+        if current is None:
+            return
+        self._local.current = None
+
+        route = req.uri_template if resource is not None and req.uri_template else 'unrouted'
+        labels = (route, req.method, resp.status.split(' ', 1)[0])
+
+        if resp.stream is not None:
+            resp.stream = self._observed_stream(resp.stream, current, labels)
+        else:
+            self._observe(current, labels)
+
+    def _observe(self, current, labels):
+        (route, method, status) = labels
+
+        self.requests.labels(route, method, status).inc()
+        self.latency.labels(route, method).observe(time.perf_counter() - current['started_at'])
+        self.crud_latency.labels(route, method).observe(current['crud'])
+        self.serialization_latency.labels(route, method).observe(current['serialization'])
+
+        if self._pool is not None:
+            self.observe_pool(self._pool.stats())
+
+    def _observed_stream(self, stream, current, labels):
+        # the chunks are produced by the server after "process_response", so the
+        # request is current again while each one is
+        try:
+            yield from _resumed(stream, lambda: self._request(current))
+        finally:
+            self._observe(current, labels)
+
+    def exposition(self):
+        """Returns the metrics of all workers (or of this process, without
+        "PROMETHEUS_MULTIPROC_DIR") in the Prometheus text format.
+        """
+        if self.multiprocess:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = self.registry
+
+        return prometheus_client.generate_latest(registry)
+
+
+class InstrumentedCRUD(object):
+    """Wraps "TituloTesouroCRUD", adding the time of each public method called
+    to the current request.
+    """
+
+    def __init__(self, crud, metrics):
+        self._crud = crud
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attribute = getattr(self._crud, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def timed(*args, **kwargs):
+            with self._metrics._timed('crud'):
+                ret = attribute(*args, **kwargs)
+
+            # the rows of the "stream_*" methods are fetched as they are consumed
+            if isinstance(ret, types.GeneratorType):
+                ret = _resumed(ret, lambda: self._metrics._timed('crud'))
+
+            return ret
+
+        return timed
+
+
+class InstrumentedSerializer(object):
+    """Wraps a serializer, adding the time of each serialization to the current
+    request.
+    """
+
+    def __init__(self, serializer, metrics):
+        self.name = serializer.name
+        self._serializer = serializer
+        self._metrics = metrics
+
+    def dumps(self, obj):
+        with self._metrics._timed('serialization'):
+            return self._serializer.dumps(obj)
+
+
+def _resumed(iterable, context):
+    """Yields the items of "iterable", producing each one inside a new context
+    manager returned by "context", and closes it when closed.
+    """
+    iterator = iter(iterable)
+    try:
+        while True:
+            with context():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def mark_process_dead(pid):
+    """Removes the live gauges of a worker that exited. Meant for the
+    "child_exit" hook of Gunicorn.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,119 @@
+"""Layout of the table "tesouro_direto_series", optionally partitioned as set by
+DATABASE_PARTITIONING:
+
+- "category": one partition per category;
+- "period": one partition per range of DATABASE_PARTITION_YEARS years, from
+  INITIAL_DATE up to the range holding DATABASE_PARTITION_LAST_YEAR, plus a
+  default partition for the years after it;
+- "category,period": the ranges of years inside each category.
+
+Without it, the table is not partitioned. Every query filtering by category or
+period (all reads do) only scans the partitions that may hold its rows.
+"""
+
+
+import re
+
+try:
+    from basics import SCHEMAS_PATH, TITULO_TESOURO_CATEGORIES, INITIAL_DATE, to_period, from_period
+    from basics import DATABASE_PARTITIONING, DATABASE_PARTITION_YEARS, DATABASE_PARTITION_LAST_YEAR
+except ImportError:
+    from src.basics import SCHEMAS_PATH, TITULO_TESOURO_CATEGORIES, INITIAL_DATE, to_period, from_period
+    from src.basics import DATABASE_PARTITIONING, DATABASE_PARTITION_YEARS, DATABASE_PARTITION_LAST_YEAR
+
+
+TABLE = 'tesouro_direto_series'
+
+
+class PartitionLayout(object):
+    """Builds the DDL of "tesouro_direto_series" and tells the partition of each
+    record, so loads can be sent straight to it.
+
+    The records are unique by (category, action, period), in every layout. The
+    keys of a partitioned table must hold its partition key, so, when it is
+    partitioned, the primary key is the id along with the partition key.
+    """
+
+    def __init__(self, partitioning=DATABASE_PARTITIONING, years=DATABASE_PARTITION_YEARS,
+                 last_year=DATABASE_PARTITION_LAST_YEAR):
+        keys = [key.strip() for key in partitioning.split(',') if key.strip()]
+        assert set(keys) <= set(['category', 'period']), \
+            '"partitioning" must list "category" and/or "period", separated by commas.'
+        assert years > 0, '"years" must be greater than zero.'
+        assert last_year >= INITIAL_DATE.year, \
+            '"last_year" must be greater than or equal to {}.'.format(INITIAL_DATE.year)
+
+        self.by_category = 'category' in keys
+        self.by_period = 'period' in keys
+        self.years = years
+        self.last_year = last_year
+
+    def is_partitioned(self):
+        return self.by_category or self.by_period
+
+    def unique_key(self):
+        return 'category, action, period'
+
+    def _name(self, category):
+        return '{}_{}'.format(TABLE, re.sub(r'\W+', '_', category.lower()))
+
+    def _first_years(self):
+        return range(INITIAL_DATE.year, self.last_year + 1, self.years)
+
+    def _period_partitions(self, parent):
+        for year in self._first_years():
+            bounds = 'FOR VALUES FROM ({}) TO ({})'.format(to_period(year, 1), to_period(year + self.years, 1))
+            yield ('{}_{}'.format(parent, year), parent, bounds, '')
+
+        yield ('{}_default'.format(parent), parent, 'DEFAULT', '')
+
+    def partitions(self):
+        """Yields (name, parent, bounds, partition_by) of every partition, each
+        parent before its partitions.
+        """
+        if self.by_category:
+            for category in TITULO_TESOURO_CATEGORIES:
+                name = self._name(category)
+                partition_by = ' PARTITION BY RANGE (period)' if self.by_period else ''
+                yield (name, TABLE, "FOR VALUES IN ('{}')".format(category), partition_by)
+
+                if self.by_period:
+                    yield from self._period_partitions(name)
+        elif self.by_period:
+            yield from self._period_partitions(TABLE)
+
+    def partition_of(self, category, period):
+        """Returns the table holding the records of (category, period): their
+        (innermost) partition, or the table itself if not partitioned.
+        """
+        name = self._name(category) if self.by_category else TABLE
+
+        if self.by_period:
+            year = from_period(period)[0]
+            first_year = year - (year - INITIAL_DATE.year) % self.years
+            if first_year > self.last_year:
+                return '{}_default'.format(name)
+            return '{}_{}'.format(name, first_year)
+
+        return name
+
+    def schema(self, sql):
+        """Fills the template "create-all.sql" with the keys and partitions of the
+        layout. The unique key also indexes the reads, which filter by
+        (category, action, period).
+        """
+        if not self.is_partitioned():
+            return sql.format(keys='PRIMARY KEY (id),\n    UNIQUE ({})'.format(self.unique_key()),
+                              partition_by='', partitions='')
+
+        columns = ['id'] + (['category'] if self.by_category else []) + (['period'] if self.by_period else [])
+
+        with open('{}/create-partition.sql'.format(SCHEMAS_PATH)) as f:
+            partition_sql = f.read()
+        partitions = [partition_sql.format(name=name, parent=parent, bounds=bounds, partition_by=partition_by)
+                      for (name, parent, bounds, partition_by) in self.partitions()]
+
+        partition_by = ' PARTITION BY LIST (category)' if self.by_category else ' PARTITION BY RANGE (period)'
+
+        return sql.format(keys='PRIMARY KEY ({}),\n    UNIQUE ({})'.format(', '.join(columns), self.unique_key()),
+                          partition_by=partition_by, partitions='\n'.join(partitions))
@@ -0,0 +1,192 @@
+"""Profiles requests on demand and summarizes the profiles captured.
+
+Run as a script to print the hotspots of all profiles in a directory.
+"""
+
+
+import argparse
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import random
+import re
+import reprlib
+import threading
+import time
+
+try:
+    from basics import PROFILING_DIR, PROFILING_HEADER, PROFILING_SAMPLE_RATE
+except ImportError:
+    from src.basics import PROFILING_DIR, PROFILING_HEADER, PROFILING_SAMPLE_RATE
+
+
+class ProfilingMiddleware(object):
+    """Falcon middleware that runs a request under cProfile when it has the
+    header "header" (with any value) or, otherwise, with probability
+    "sample_rate". For each request profiled, writes to "directory" the stats
+    (".prof", readable by pstats) and a ".json" with the request, its duration
+    and the queries executed by "TituloTesouroCRUD" (see "record_query").
+
+    Only one request is profiled at a time per process; the others run as
+    usual while it lasts. A streamed response is profiled, and written, until
+    its stream is exhausted or closed.
+    """
+
+    def __init__(self, directory=PROFILING_DIR, header=PROFILING_HEADER, sample_rate=PROFILING_SAMPLE_RATE):
+        self.directory = directory
+        self.header = header
+        self.sample_rate = sample_rate
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _should_profile(self, req):
+        if req.get_header(self.header) is not None:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record_query(self, name, params, seconds):
+        """Records a query executed while handling the request of this thread,
+        if it is being profiled.
+        """
+        queries = getattr(self._local, 'queries', None)
+        if queries is not None:
+            params = [reprlib.repr(param) for param in params]
+            queries.append({'name': name, 'params': params, 'ms': seconds * 1000})
+
+    def process_request(self, req, resp):
+        self._local.profile = None
+        self._local.queries = None
+
+        if not self._should_profile(req) or not self._lock.acquire(blocking=False):
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in the process (e.g. a debugger)
+            self._lock.release()
+            return
+
+        self._local.profile = profile
+        self._local.queries = list()
+        self._local.started_at = time.perf_counter()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+
+        profile.disable()
+        started_at = self._local.started_at
+        queries = self._local.queries
+        self._local.profile = None
+        self._local.queries = None
+
+        now = time.time()
+        name = '{}{:06d}-{}-{}-{}'.format(time.strftime('%Y%m%d%H%M%S', time.localtime(now)),
+                                          int(now % 1 * 1000000), os.getpid(), req.method,
+                                          re.sub(r'[^A-Za-z0-9]+', '_', req.path).strip('_') or 'root')
+        resp.set_header('{}-File'.format(self.header), '{}.prof'.format(name))
+
+        request = {
+            'method': req.method,
+            'path': req.path,
+            'query_string': req.query_string,
+            'status': resp.status
+        }
+
+        if resp.stream is not None:
+            resp.stream = self._profiled_stream(resp.stream, profile, started_at, queries, name, request)
+        else:
+            self._dump(profile, started_at, queries, name, request)
+
+    def _dump(self, profile, started_at, queries, name, request):
+        request['duration_ms'] = (time.perf_counter() - started_at) * 1000
+        request['queries'] = queries
+        self._lock.release()
+
+        path = os.path.join(self.directory, name)
+        profile.dump_stats('{}.prof'.format(path))
+        with open('{}.json'.format(path), 'w') as f:
+            json.dump(request, f, indent=4)
+
+    def _profiled_stream(self, stream, profile, started_at, queries, name, request):
+        # the chunks are produced by the server after "process_response", so the
+        # profile is resumed while each one is
+        iterator = iter(stream)
+        try:
+            while True:
+                self._local.queries = queries
+                profile.enable()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    profile.disable()
+                    self._local.queries = None
+                yield chunk
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+            self._dump(profile, started_at, queries, name, request)
+
+
+def summarize(directory, top=20, sort='cumulative'):
+    """Returns a report of the "top" functions (by "sort") over all profiles in
+    "directory", and of the queries recorded with them.
+    """
+    filenames = sorted(glob.glob(os.path.join(directory, '*.prof')))
+    if not filenames:
+        return 'No profiles found in "{}".'.format(directory)
+
+    output = io.StringIO()
+
+    stats = pstats.Stats(filenames[0], stream=output)
+    for filename in filenames[1 :]:
+        stats.add(filename)
+
+    output.write('{} profiles in "{}".\n'.format(len(filenames), directory))
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+    queries = dict()
+    durations = list()
+    for filename in filenames:
+        try:
+            with open('{}.json'.format(filename[: -len('.prof')])) as f:
+                request = json.load(f)
+        except (IOError, ValueError):
+            continue
+
+        durations.append(request['duration_ms'])
+        for query in request['queries']:
+            (count, total) = queries.get(query['name'], (0, 0.0))
+            queries[query['name']] = (count + 1, total + query['ms'])
+
+    if durations:
+        output.write('Requests: {}, mean duration {:.3f} ms, max {:.3f} ms.\n\n'.format(
+            len(durations), sum(durations) / len(durations), max(durations)))
+    if queries:
+        output.write('{:<40}{:>10}{:>16}{:>16}\n'.format('query', 'calls', 'total (ms)', 'mean (ms)'))
+        for (name, (count, total)) in sorted(queries.items(), key=lambda item: -item[1][1]):
+            output.write('{:<40}{:>10}{:>16.3f}{:>16.3f}\n'.format(name, count, total, total / count))
+
+    return output.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarizes the hotspots of the profiles captured.')
+    parser.add_argument('--directory', default=PROFILING_DIR, help='directory of the profiles.')
+    parser.add_argument('--top', type=int, default=20, help='number of functions shown.')
+    parser.add_argument('--sort', default='cumulative', help='pstats sort key (e.g., cumulative, tottime).')
+    args = parser.parse_args()
+
+    print(summarize(args.directory, args.top, args.sort))
@@ -0,0 +1,92 @@
+"""Loads the SQL queries of resources/transactions.
+
+All of them are kept in a single bundle (a JSON object from name to query), so
+starting the service reads one file instead of one per query. The bundle is
+built again whenever it is missing or older than any query. Run as a script to
+build it ahead of the first start:
+
+    python src/queries.py
+"""
+
+
+import glob
+import json
+import logging
+import os
+
+try:
+    from basics import TRANSACTIONS_PATH, QUERY_BUNDLE_PATH
+except ImportError:
+    from src.basics import TRANSACTIONS_PATH, QUERY_BUNDLE_PATH
+
+
+def _query_paths():
+    return sorted(glob.glob('{}/*.sql'.format(TRANSACTIONS_PATH)))
+
+
+def _query_name(path):
+    return os.path.basename(path)[: -len('.sql')]
+
+
+def read_queries():
+    queries = dict()
+    for path in _query_paths():
+        with open(path) as f:
+            queries[_query_name(path)] = f.read()
+
+    return queries
+
+
+def build_bundle(bundle_path=QUERY_BUNDLE_PATH):
+    """Writes all queries into the bundle, returning them. The bundle is replaced
+    atomically, so processes starting at the same time never read half of it.
+    """
+    queries = read_queries()
+
+    tmp_path = '{}.{}.tmp'.format(bundle_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(queries, f)
+    os.replace(tmp_path, bundle_path)
+
+    return queries
+
+
+def is_stale(bundle_path=QUERY_BUNDLE_PATH):
+    try:
+        built_at = os.stat(bundle_path).st_mtime
+    except OSError:
+        return True
+
+    return any([os.stat(path).st_mtime > built_at for path in _query_paths()])
+
+
+def load_queries(names, bundle_path=QUERY_BUNDLE_PATH):
+    """Returns the queries "names" by name, from the bundle if it is up to date.
+    Otherwise they are read from their files and the bundle is built again (if
+    its directory is not writable, the files are read on every start).
+    """
+    queries = None
+
+    if not is_stale(bundle_path):
+        try:
+            with open(bundle_path) as f:
+                queries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('Query bundle "{}" not readable: {}'.format(bundle_path, e))
+
+    if queries is None or not set(names) <= set(queries):
+        try:
+            queries = build_bundle(bundle_path)
+        except OSError as e:
+            logging.warning('Query bundle "{}" not written: {}'.format(bundle_path, e))
+            queries = read_queries()
+
+    missing = set(names) - set(queries)
+    assert not missing, 'Queries not found in "{}": {}.'.format(TRANSACTIONS_PATH, sorted(missing))
+
+    return {name: queries[name] for name in names}
+
+
+if __name__ == '__main__':
+    queries = build_bundle()
+    print('{} queries bundled into "{}".'.format(len(queries), QUERY_BUNDLE_PATH))
@@ -0,0 +1,84 @@
+"""Serializes the response bodies to JSON, with the fastest library installed.
+"""
+
+
+import json
+import logging
+
+from src.basics import JSON_SERIALIZER
+
+
+class JsonSerializer(object):
+    """Serializer from the standard library, always available.
+    """
+
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf8')
+
+
+class OrjsonSerializer(object):
+    """Serializer from "orjson", which writes bytes (in UTF-8) by itself.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+
+class UjsonSerializer(object):
+    """Serializer from "ujson".
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+
+    def dumps(self, obj):
+        return self._dumps(obj, ensure_ascii=False).encode('utf8')
+
+
+SERIALIZERS = {
+    'json': JsonSerializer,
+    'orjson': OrjsonSerializer,
+    'ujson': UjsonSerializer
+}
+
+# tried in this order by "auto", as measured by benchmarks/bench_serializers.py
+PREFERENCE = ['orjson', 'ujson', 'json']
+
+
+def available_serializers():
+    """Returns the serializers whose libraries are installed, in order of preference.
+    """
+    serializers = list()
+    for name in PREFERENCE:
+        try:
+            serializers.append(SERIALIZERS[name]())
+        except ImportError:
+            pass
+
+    return serializers
+
+
+def get_serializer(name=JSON_SERIALIZER):
+    """Returns the serializer called "name", or the fastest one installed if
+    "name" is "auto".
+    """
+    if name == 'auto':
+        serializer = available_serializers()[0]
+    else:
+        assert name in SERIALIZERS, '"JSON_SERIALIZER" must be "auto" or one of {}.'.format(list(SERIALIZERS))
+        serializer = SERIALIZERS[name]()
+
+    logging.info('JSON serializer: {}.'.format(serializer.name))
+
+    return serializer
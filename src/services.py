@@ -2,34 +2,165 @@
 """
 
 
-from babel.numbers import format_currency
-import pendulum
+import itertools
+import logging
 import psycopg2
+import time
 
 from src.basics import TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS
-from src.basics import TRANSACTIONS_PATH, DATABASE_PARAMS, INITIAL_DATE
+from src.basics import INITIAL_DATE, to_period, from_period, current_period
+from src.basics import COLUMNAR_ENGINE, COLUMNAR_ENGINE_SYNC_INTERVAL, HISTORY_FETCH_SIZE
+from src.currency import BRLFormatter
+from src.database import ConnectionPool
+from src.queries import load_queries
 
 
 class TituloTesouroCRUD(object):
     """Executes CRUD operations for titulo tesouro.
     """
 
-    def __init__(self):
-        self.queries = {
-            'load-input-data': open('{}/load-input-data.sql'.format(TRANSACTIONS_PATH)).read(),
-            'get-id': open('{}/get-id.sql'.format(TRANSACTIONS_PATH)).read(),
-            'count-tesouro-direto': open('{}/count-tesouro-direto.sql'.format(TRANSACTIONS_PATH)).read(),
-            'delete-tesouro-direto': open('{}/delete-tesouro-direto.sql'.format(TRANSACTIONS_PATH)).read(),
-            'get-expire_at': open('{}/get-expire_at.sql'.format(TRANSACTIONS_PATH)).read(),
-            'update-tesouro-direto': open('{}/update-tesouro-direto.sql'.format(TRANSACTIONS_PATH)).read(),
-            'read-history': open('{}/read-history.sql'.format(TRANSACTIONS_PATH)).read(),
-            'read-history-grouped': open('{}/read-history-grouped.sql'.format(TRANSACTIONS_PATH)).read(),
-            'get-category': open('{}/get-category.sql'.format(TRANSACTIONS_PATH)).read(),
-            'read-by-action': open('{}/read-by-action.sql'.format(TRANSACTIONS_PATH)).read(),
-            'read-by-action-grouped': open('{}/read-by-action-grouped.sql'.format(TRANSACTIONS_PATH)).read(),
-            'get-category-by-id': open('{}/get-category-by-id.sql'.format(TRANSACTIONS_PATH)).read(),
-            'compare': open('{}/compare.sql'.format(TRANSACTIONS_PATH)).read()
-        }
+    def __init__(self, pool=None, columnar_engine=COLUMNAR_ENGINE, metrics=None, profiler=None):
+        self.pool = pool if pool else ConnectionPool()
+        self.metrics = metrics
+        self.profiler = profiler
+        self.currency = BRLFormatter()
+
+        self.columnar = None
+        if columnar_engine:
+            from src.columnar import ColumnarEngine
+            self.columnar = ColumnarEngine(COLUMNAR_ENGINE_SYNC_INTERVAL)
+
+        self.queries = load_queries([
+            'insert-tesouro-direto',
+            'insert-many-tesouro-direto',
+            'delete-tesouro-direto',
+            'delete-many-tesouro-direto',
+            'delete-by-interval-tesouro-direto',
+            'get-period',
+            'update-tesouro-direto',
+            'update-many-tesouro-direto',
+            'read-history',
+            'read-history-grouped',
+            'get-category',
+            'count-registers',
+            'read-by-action',
+            'read-by-action-grouped',
+            'compare',
+            'compare-grouped',
+            'get-version',
+            'load-series'
+        ])
+
+    def _execute(self, cur, name, *params):
+        if self.metrics is None and self.profiler is None:
+            cur.connection.execute_prepared(cur, name, self.queries[name], params)
+            return
+
+        start = time.perf_counter()
+        cur.connection.execute_prepared(cur, name, self.queries[name], params)
+        self._observe(name, params, time.perf_counter() - start, cur.rowcount)
+
+    def _observe(self, name, params, seconds, rows):
+        if self.metrics:
+            self.metrics.observe_query(name, seconds, rows)
+        if self.profiler:
+            self.profiler.record_query(name, params, seconds)
+
+    def _fetch_rows(self, conn, cur, name, max_rows, *params):
+        """Yields the rows of the query "name", known to be at most "max_rows". If
+        they fit in HISTORY_FETCH_SIZE, they are fetched at once by the prepared
+        statement; otherwise from a server-side cursor, HISTORY_FETCH_SIZE at a
+        time, so they are never all in memory at once.
+        """
+        if max_rows <= HISTORY_FETCH_SIZE:
+            self._execute(cur, name, *params)
+            yield from cur.fetchall()
+            return
+
+        seconds = 0.0
+        rows = 0
+
+        start = time.perf_counter()
+        declared = conn.declare(name, self.queries[name], params)
+
+        try:
+            while True:
+                batch = declared.fetchmany(HISTORY_FETCH_SIZE)
+                seconds += time.perf_counter() - start
+                rows += len(batch)
+
+                if not batch:
+                    break
+                yield from batch
+
+                start = time.perf_counter()
+        finally:
+            declared.close()
+            self._observe(name, params, seconds, rows)
+
+    def _read_version(self, cur):
+        # only the columnar engine needs the version right after a write
+        if self.columnar is None:
+            return None
+
+        self._execute(cur, 'get-version')
+        return tuple(cur.fetchall()[0])
+
+    def _columnar_engine(self):
+        """Returns the columnar engine, reloaded if the data version changed since
+        it was loaded, or None when it is disabled.
+        """
+        engine = self.columnar
+        if engine is None or not engine.needs_check():
+            return engine
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'get-version')
+            version = tuple(cur.fetchall()[0])
+
+            if version != engine.version:
+                self._execute(cur, 'load-series')
+                engine.load(cur.fetchall(), version)
+                logging.info('Columnar engine loaded (version {}).'.format(version[0]))
+
+        engine.checked()
+
+        return engine
+
+    def data_version(self):
+        """Returns the version of the data the reads are answered from, as
+        (version, updated_at). Every write changes it.
+        """
+        engine = self._columnar_engine()
+        if engine and engine.version is not None:
+            return engine.version
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'get-version')
+            return tuple(cur.fetchall()[0])
+
+    def warmup(self):
+        """Opens the connection pool, prepares all queries on its first "min_size"
+        connections and loads the columnar engine, so the first requests do not
+        pay for them.
+        """
+        try:
+            self.pool.open()
+
+            conns = [self.pool.getconn() for _ in range(self.pool.min_size)]
+            try:
+                for conn in conns:
+                    with conn.cursor() as cur:
+                        for (name, sql) in self.queries.items():
+                            conn.prepare(cur, name, sql)
+                    conn.commit()
+            finally:
+                for conn in conns:
+                    self.pool.putconn(conn)
+
+            self._columnar_engine()
+        except psycopg2.Error as e:
+            logging.warning('Warmup failed: {}'.format(str(e).strip()))
 
     def _validate_category(self, category):
         assert isinstance(category, str), '"category" must be a string.'
@@ -67,7 +198,12 @@ class TituloTesouroCRUD(object):
         assert month.isdigit(), 'month must be a positive int.'
         self._validate_month(int(month))
 
-    def create(self, category, month, year, action, amount):
+    def _period(self, date):
+        self._validade_date(date)
+        (year, month) = date.split('-')
+        return to_period(int(year), int(month))
+
+    def _create_aux(self, category, month, year, action, amount):
         self._validate_category(category)
         self._validate_month(month)
         self._validate_year(year)
@@ -78,20 +214,22 @@ class TituloTesouroCRUD(object):
             amount = float(amount)
 
         action = action.upper()
-        expire_at = pendulum.create(year, month, 1, 0, 0, 0).strftime('%Y-%m-%d %H:%M:%S')
+        period = to_period(year, month)
         amount = round(amount, 2)
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+        return (category, action, period, amount)
+
+    def create(self, category, month, year, action, amount):
+        (category, action, period, amount) = self._create_aux(category, month, year, action, amount)
 
-        value = "('{}', '{}', '{}', {})".format(category, action, expire_at, amount)
-        cur.execute(self.queries['load-input-data'].format(value))
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'insert-tesouro-direto', category, action, period, amount)
+            _id = cur.fetchall()[0][0]
 
-        cur.execute(self.queries['get-id'].format(category, action, expire_at))
-        _id = cur.fetchall()[0][0]
+            version = self._read_version(cur)
 
-        cur.close()
-        conn.close()
+        if self.columnar:
+            self.columnar.apply(version, self.columnar.insert, _id, category, action, period, amount)
 
         return {
             'id': _id,
@@ -102,69 +240,233 @@ class TituloTesouroCRUD(object):
             'valor': amount
         }
 
+    def create_many(self, records):
+        """Creates all records in a single statement, or none of them. Returns the
+        created records and the errors found, as a list of {"índice", "err"},
+        where "índice" is the position of the record in "records".
+        """
+        assert records, 'Empty list of records.'
+
+        rows = list()
+        positions = dict()
+        errors = list()
+
+        for (i, record) in enumerate(records):
+            try:
+                row = self._create_aux(record['categoria_titulo'], record['mês'], record['ano'],
+                                       record['ação'], record['valor'])
+                key = row[0 : 3]
+                assert key not in positions, 'Same record as in position {}.'.format(positions.get(key))
+
+                positions[key] = i
+                rows.append(row)
+            except AssertionError as e:
+                errors.append({'índice': i, 'err': str(e)})
+
+        if errors:
+            return (None, errors)
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'insert-many-tesouro-direto', *[list(column) for column in zip(*rows)])
+            created = {(category, action, period): _id for (_id, category, action, period) in cur.fetchall()}
+
+            if len(created) < len(rows):
+                conn.rollback()
+                errors = [{'índice': i, 'err': 'Record already registered.'}
+                          for (key, i) in positions.items() if key not in created]
+                return (None, errors)
+
+            version = self._read_version(cur)
+
+        result = list()
+        for (category, action, period, amount) in rows:
+            (year, month) = from_period(period)
+            result.append({
+                'id': created[(category, action, period)],
+                'categoria_titulo': category,
+                'mês': month,
+                'ano': year,
+                'ação': action,
+                'valor': amount
+            })
+
+        if self.columnar:
+            self.columnar.apply(version, self.columnar.insert_many,
+                                [(created[row[0 : 3]],) + row for row in rows])
+
+        return (result, list())
+
     def delete(self, titulo_id):
         self._validate_titulo_id(titulo_id)
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'delete-tesouro-direto', int(titulo_id))
+            deleted = cur.fetchall()
 
-        cur.execute(self.queries['count-tesouro-direto'].format(titulo_id))
-        count = cur.fetchall()[0][0]
+            version = self._read_version(cur)
 
-        if count > 0:
-            cur.execute(self.queries['delete-tesouro-direto'].format(titulo_id))
+        if deleted and self.columnar:
+            self.columnar.apply(version, self.columnar.delete, int(titulo_id))
 
-        cur.close()
-        conn.close()
+        if deleted:
+            return True
+        return False
 
-        if count == 0:
-            return False
-        return True
+    def delete_many(self, params):
+        """Deletes, in a single statement, the records whose ids are listed in
+        "ids" or those of "categoria_titulo" in the interval given by "data_inicio"
+        and "data_fim" (optionally only of "ação"). Returns the deleted ids. The
+        interval has no defaults here, so a whole history is only deleted when
+        asked for explicitly.
+        """
+        assert isinstance(params, dict), 'Request body must be an object.'
+
+        if 'ids' in params:
+            assert isinstance(params['ids'], list), 'Parameter "ids" must be a list.'
+            assert params['ids'], 'Empty list of ids.'
+            for titulo_id in params['ids']:
+                self._validate_titulo_id(str(titulo_id))
+            ids = [int(titulo_id) for titulo_id in params['ids']]
+        else:
+            assert 'categoria_titulo' in params, 'Missing mandatory parameter "ids" or "categoria_titulo".'
+            assert 'data_inicio' in params, 'Missing mandatory parameter "data_inicio".'
+            assert 'data_fim' in params, 'Missing mandatory parameter "data_fim".'
+            self._validate_category(params['categoria_titulo'])
+            action = None
+            if 'ação' in params:
+                self._validate_action(params['ação'])
+                action = params['ação'].upper()
+            (start_period, end_period) = self._interval(params)
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            if 'ids' in params:
+                self._execute(cur, 'delete-many-tesouro-direto', ids)
+            else:
+                self._execute(cur, 'delete-by-interval-tesouro-direto', params['categoria_titulo'],
+                              start_period, end_period, action)
+            deleted = sorted([res[0] for res in cur.fetchall()])
 
-    def update(self, titulo_id, data):
-        self._validate_titulo_id(titulo_id)
+            version = self._read_version(cur)
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+        if deleted and self.columnar:
+            self.columnar.apply(version, self.columnar.delete_many, deleted)
 
-        cur.execute(self.queries['get-expire_at'].format(titulo_id))
-        result = cur.fetchall()
+        return deleted
 
-        if result:
-            year = int(result[0][0])
-            month = int(result[0][1])
+    def _update_aux(self, data):
+        """Validates the fields to update, returning (month, year, action, amount)
+        with None for those not given.
+        """
+        assert 'categoria_titulo' not in data, 'Field "categoria_titulo" cannot be updated'
+
+        (month, year, action, amount) = (None, None, None, None)
+
+        if 'mês' in data:
+            self._validate_month(data['mês'])
+            month = data['mês']
+        if 'ano' in data:
+            self._validate_year(data['ano'])
+            year = data['ano']
+        if 'ação' in data:
+            self._validate_action(data['ação'])
+            action = data['ação'].upper()
+        if 'valor' in data:
+            self._validate_amount(data['valor'])
+            amount = data['valor']
 
-            assert 'categoria_titulo' not in data, 'Field "categoria_titulo" cannot be updated'
+        return (month, year, action, amount)
 
-            fields = list()
+    def update(self, titulo_id, data):
+        self._validate_titulo_id(titulo_id)
 
-            if 'mês' in data:
-                self._validate_month(data['mês'])
-                month = data['mês']
-            if 'ano' in data:
-                self._validate_year(data['ano'])
-                year = data['ano']
-            if 'ação' in data:
-                self._validate_action(data['ação'].upper())
-                fields.append("action = '{}'".format(data['ação'].upper()))
-            if 'valor' in data:
-                self._validate_amount(data['valor'])
-                fields.append("amount = {}".format(data['valor']))
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'get-period', int(titulo_id))
+            result = cur.fetchall()
 
-            expire_at = pendulum.create(year, month, 1, 0, 0, 0).strftime('%Y-%m-%d %H:%M:%S')
-            fields.append("expire_at = '{}'".format(expire_at))
+            if result:
+                (month, year, action, amount) = self._update_aux(data)
+                (current_year, current_month) = from_period(result[0][0])
+                year = current_year if year is None else year
+                month = current_month if month is None else month
+                period = to_period(year, month)
 
-            fields = ', '.join(fields)
+                self._execute(cur, 'update-tesouro-direto', int(titulo_id), action, amount, period)
 
-            cur.execute(self.queries['update-tesouro-direto'].format(fields, titulo_id))
+                version = self._read_version(cur)
 
-        cur.close()
-        conn.close()
+        if result and self.columnar:
+            self.columnar.apply(version, self.columnar.update, int(titulo_id), action, period, amount)
 
         if result:
             return True
         return False
 
+    def update_many(self, records):
+        """Updates all records in a single statement, or none of them. Each record
+        has the "id" and the fields to update. Returns the updated ids and the
+        errors found, as in "create_many".
+        """
+        assert records, 'Empty list of records.'
+
+        rows = list()
+        positions = dict()
+        errors = list()
+
+        for (i, record) in enumerate(records):
+            try:
+                assert isinstance(record, dict), 'Record must be an object.'
+                assert 'id' in record, 'Mandatory field "id" missing.'
+                self._validate_titulo_id(str(record['id']))
+                titulo_id = int(record['id'])
+                assert titulo_id not in positions, 'Same id as in position {}.'.format(positions.get(titulo_id))
+
+                (month, year, action, amount) = self._update_aux(record)
+                positions[titulo_id] = i
+                rows.append((titulo_id, action, amount, year, month))
+            except AssertionError as e:
+                errors.append({'índice': i, 'err': str(e)})
+
+        if errors:
+            return (None, errors)
+
+        # all but the ids go as text, so a column of nulls is still a valid array
+        columns = [[row[0] for row in rows]]
+        columns.extend([[None if value is None else str(value) for value in column]
+                        for column in list(zip(*rows))[1 :]])
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'update-many-tesouro-direto', *columns)
+            updated = cur.fetchall()
+
+            if len(updated) < len(rows):
+                conn.rollback()
+                found = set([res[0] for res in updated])
+                errors = [{'índice': i, 'err': '"titulo_id" has no register.'}
+                          for (titulo_id, i) in positions.items() if titulo_id not in found]
+                return (None, errors)
+
+            version = self._read_version(cur)
+
+        if self.columnar:
+            self.columnar.apply(version, self.columnar.update_many, updated)
+
+        return (sorted([res[0] for res in updated]), list())
+
+    def _interval(self, params):
+        """Returns the periods of "data_inicio" (default INITIAL_DATE) and
+        "data_fim" (default the current month).
+        """
+        start_period = 0
+        if 'data_inicio' in params:
+            start_period = self._period(params['data_inicio'])
+
+        if 'data_fim' in params:
+            end_period = self._period(params['data_fim'])
+        else:
+            end_period = current_period()
+
+        return (start_period, end_period)
+
     def _read_aux(self, titulo_id, params):
         if isinstance(titulo_id, list):
             for titulo_id_elto in titulo_id:
@@ -172,128 +474,369 @@ class TituloTesouroCRUD(object):
         else:
             self._validate_titulo_id(titulo_id)
 
-        start_date = pendulum.create(2002, 1, 1, 0, 0, 0)
-        end_date = pendulum.now()
+        return self._read_params(params)
+
+    def _read_params(self, params):
+        (start_period, end_period) = self._interval(params)
         group_by_year = False
 
-        if 'data_inicio' in params:
-            self._validade_date(params['data_inicio'])
-            start_date = pendulum.strptime('{}-01'.format(params['data_inicio']), '%Y-%m-%d')
-        if 'data_fim' in params:
-            self._validade_date(params['data_fim'])
-            end_date = pendulum.strptime('{}-01'.format(params['data_fim']), '%Y-%m-%d')
         if 'group_by' in params:
             assert params['group_by'] in ('true', 'false'), '"group_by" must be "true" or "false".'
             group_by_year = True if params['group_by'] == 'true' else False
 
-        start_date = start_date.strftime('%Y-%m-%d %H:%M:%S')
-        end_date = end_date.strftime('%Y-%m-%d %H:%M:%S')
-
-        return (start_date, end_date, group_by_year)
+        return (start_period, end_period, group_by_year)
+
+    def _page(self, params, start_period):
+        """Returns the period the page starts at, given by "cursor" (the date of its
+        first row, as "YYYY-mm", returned with the previous page), and the number
+        of rows given by "limit" (None for all).
+        """
+        limit = None
+        if 'limit' in params:
+            assert params['limit'].isdigit(), '"limit" must be a positive int.'
+            limit = int(params['limit'])
+            assert limit > 0, '"limit" must be a positive int.'
+
+        if 'cursor' in params:
+            start_period = max(start_period, self._period(params['cursor']))
+
+        return (start_period, limit)
+
+    def _max_rows(self, start_period, end_period, group_by_year, limit):
+        """Returns the most rows a read can have: one per month (or year) of the
+        interval, up to "limit".
+        """
+        if group_by_year:
+            rows = end_period // 12 - start_period // 12 + 1
+        else:
+            rows = end_period - start_period + 1
+
+        return max(rows, 0) if limit is None else min(max(rows, 0), limit)
+
+    def _paginate(self, rows, limit, shape, key):
+        """Shapes the first "limit" rows (all if None) as they are fetched, and
+        returns them with the cursor of the next page, from the key (year, month)
+        of the row after them, or None if it is the last page.
+        """
+        page = [shape(res) for res in itertools.islice(rows, limit)]
+        if limit is None:
+            return (page, None)
+
+        following = next(rows, None)
+
+        if following is None:
+            return (page, None)
+        return (page, '{}-{:02d}'.format(*key(following)))
+
+    def _amount_format(self, params):
+        """Returns the function applied to the amounts of a response: the BRL
+        formatter or, with "formato=numerico", float.
+        """
+        if 'formato' in params:
+            assert params['formato'] in ('moeda', 'numerico'), '"formato" must be "moeda" or "numerico".'
+            if params['formato'] == 'numerico':
+                return float
+
+        return self.currency.format
+
+    def _registered(self, ids):
+        """Checks if all "ids" have a register.
+        """
+        ids = list(dict.fromkeys([int(_id) for _id in ids]))
+
+        engine = self._columnar_engine()
+        if engine:
+            return all([engine.get_category(titulo_id) is not None for titulo_id in ids])
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'count-registers', ids)
+            return cur.fetchall()[0][0] == len(ids)
+
+    def check_read(self, titulo_id, params):
+        """Validates the parameters of a read of "titulo_id" (history or by
+        action) as the read does, returning whether "titulo_id" has a register,
+        without reading its data. Answers conditional requests.
+        """
+        (start_period, _, _) = self._read_aux(titulo_id, params)
+        self._amount_format(params)
+        self._page(params, start_period)
+
+        return self._registered([titulo_id])
+
+    def check_compare(self, params):
+        """As "check_read", for a comparison: whether all of its ids have a
+        register.
+        """
+        ids = self._compare_ids(params)
+        self._read_params(params)
+        self._amount_format(params)
+
+        return self._registered(ids)
+
+    def _history_rows(self, titulo_id, start_period, end_period, group_by_year, limit=None):
+        """Yields the category of "titulo_id" (None if it has no register) and then
+        at most "limit" of its history rows.
+        """
+        engine = self._columnar_engine()
+
+        if engine:
+            category = engine.get_category(int(titulo_id))
+            yield category
+
+            if category is not None:
+                read = engine.history_grouped if group_by_year else engine.history
+                yield from read(category, start_period, end_period)[: limit]
+            return
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'get-category', int(titulo_id))
+            result_get_category = cur.fetchall()
+            category = result_get_category[0][0] if result_get_category else None
+            yield category
+
+            if category is not None:
+                name = 'read-history-grouped' if group_by_year else 'read-history'
+                max_rows = self._max_rows(start_period, end_period, group_by_year, limit)
+                yield from self._fetch_rows(conn, cur, name, max_rows, category, start_period, end_period, limit)
+
+    def _history_shape(self, group_by_year, amount_format):
+        """Returns the functions that shape a history row into its record and give
+        its key (year, month).
+        """
+        if group_by_year:
+            return (lambda res: {'ano': res[0], 'valor_venda': amount_format(float(res[1])),
+                                 'valor_resgate': amount_format(float(res[2]))},
+                    lambda res: (res[0], 1))
+
+        def shape(res):
+            (year, month) = from_period(res[0])
+            return {'mes': month, 'ano': year, 'valor_venda': amount_format(float(res[1])),
+                    'valor_resgate': amount_format(float(res[2]))}
+
+        return (shape, lambda res: from_period(res[0]))
 
     def read_history(self, titulo_id, params):
-        (start_date, end_date, group_by_year) = self._read_aux(titulo_id, params)
+        (start_period, end_period, group_by_year) = self._read_aux(titulo_id, params)
+        amount_format = self._amount_format(params)
+        (start_period, limit) = self._page(params, start_period)
+
+        rows = self._history_rows(titulo_id, start_period, end_period, group_by_year,
+                                  None if limit is None else limit + 1)
+        try:
+            category = next(rows)
+            if category is None:
+                return False
+
+            (shape, key) = self._history_shape(group_by_year, amount_format)
+            (result_history, next_cursor) = self._paginate(rows, limit, shape, key)
+        finally:
+            rows.close()
+
+        result = {
+            'id': int(titulo_id),
+            'categoria_titulo': category,
+            'historico' : result_history
+        }
+        if limit is not None:
+            result['proximo_cursor'] = next_cursor
+
+        return result
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+    def _stream(self, titulo_id, category, rows, shape):
+        try:
+            for res in rows:
+                record = {'id': titulo_id, 'categoria_titulo': category}
+                record.update(shape(res))
+                yield record
+        finally:
+            rows.close()
+
+    def stream_history(self, titulo_id, params):
+        """As "read_history", but returns a generator of the records of the
+        history, each with "id" and "categoria_titulo", shaped as the rows are
+        fetched (or False if "titulo_id" has no register). The parameters are
+        validated before returning; "cursor" and "limit" bound the rows, with no
+        "proximo_cursor". Holds a database connection until exhausted or closed.
+        """
+        (start_period, end_period, group_by_year) = self._read_aux(titulo_id, params)
+        amount_format = self._amount_format(params)
+        (start_period, limit) = self._page(params, start_period)
+
+        rows = self._history_rows(titulo_id, start_period, end_period, group_by_year, limit)
+        category = next(rows)
+        if category is None:
+            rows.close()
+            return False
 
-        cur.execute(self.queries['get-category'].format(titulo_id))
-        result_get_category = cur.fetchall()
-        category = None
-        result_history = list()
+        (shape, _) = self._history_shape(group_by_year, amount_format)
+        return self._stream(int(titulo_id), category, rows, shape)
 
-        if result_get_category:
-            category = result_get_category[0][0]
+    def _fetch_compare(self, ids, start_period, end_period, group_by_year):
+        """Returns the category of each id found and, for each of these categories,
+        its history rows (as in "_history_rows").
+        """
+        engine = self._columnar_engine()
 
-            if group_by_year:
-                cur.execute(self.queries['read-history-grouped'].format(category, start_date, end_date))
-                result_history = cur.fetchall()
+        if engine:
+            categories = dict()
+            for titulo_id in ids:
+                category = engine.get_category(titulo_id)
+                if category is not None:
+                    categories[titulo_id] = category
+
+            read = engine.history_grouped if group_by_year else engine.history
+            series = {category: read(category, start_period, end_period) for category in set(categories.values())}
 
-                result_history = [{'ano': int(res[0]), 'valor_venda': format_currency(float(res[1]), 'BRL'),
-                                   'valor_resgate': format_currency(float(res[2]), 'BRL')}
-                                   for res in result_history]
+            return (categories, series)
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            if group_by_year:
+                self._execute(cur, 'compare-grouped', ids, start_period, end_period)
             else:
-                cur.execute(self.queries['read-history'].format(category, start_date, end_date))
-                result_history = cur.fetchall()
+                self._execute(cur, 'compare', ids, start_period, end_period)
+            result = cur.fetchall()
 
-                result_history = [{'mes': int(res[0]), 'ano': int(res[1]), 'valor_venda': format_currency(float(res[2]), 'BRL'),
-                                   'valor_resgate': format_currency(float(res[3]), 'BRL')}
-                                   for res in result_history]
+        categories = dict()
+        series = dict()
 
-        cur.close()
-        conn.close()
+        for res in result:
+            category = res[0]
+            if category not in series:
+                series[category] = list()
+                categories.update({titulo_id: category for titulo_id in res[1]})
 
-        if not result_get_category:
-            return False
+            if res[2] is not None:
+                series[category].append(res[2 :])
 
-        return {
-            'id': int(titulo_id),
-            'categoria_titulo': category,
-            'historico' : result_history
-        }
+        return (categories, series)
 
-    def compare(self, params):
+    def _compare_ids(self, params):
+        """Returns the distinct ids of "params", validated, in their order.
+        """
         assert 'ids' in params, 'Missing mandatory parameter "ids".'
         assert isinstance(params['ids'], list), 'Parameter "ids" must be a list.'
-        ids = params['ids']
-        assert len(ids) >= 2, 'Must have at least 2 ids.'
-        (start_date, end_date, group_by_year) = self._read_aux(ids, params)
+        for titulo_id in params['ids']:
+            self._validate_titulo_id(titulo_id)
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+        ids = list(dict.fromkeys([int(_id) for _id in params['ids']]))
+        assert len(ids) >= 2, 'Must have at least 2 ids.'
 
-        cur.execute(self.queries['get-category-by-id'].format(", ".join(ids)))
-        result_get_category_by_id = cur.fetchall()
-        result = list()
+        return ids
 
-        if result_get_category_by_id and len(result_get_category_by_id) == len(ids):
-            cur.execute(self.queries['compare'].format(start_date, end_date, ", ".join(ids)))
-            result = cur.fetchall()
-            # INCOMPLETE
+    def compare(self, params):
+        ids = self._compare_ids(params)
+        (start_period, end_period, group_by_year) = self._read_params(params)
+        amount_format = self._amount_format(params)
 
-        cur.close()
-        conn.close()
+        (categories, series) = self._fetch_compare(ids, start_period, end_period, group_by_year)
 
-        if (not result_get_category_by_id) or len(result_get_category_by_id) < len(ids):
+        if len(categories) < len(ids):
             return False
 
-        return result
-
-    def read_by_action(self, titulo_id, action, params):
-        (start_date, end_date, group_by_year) = self._read_aux(titulo_id, params)
+        # the amounts are formatted once per category, not once per id
+        periods = dict()
+        for (category, result) in series.items():
+            for res in result:
+                key = (res[0],) if group_by_year else from_period(res[0])
+                amounts = res[1 :]
 
-        conn = psycopg2.connect(**DATABASE_PARAMS)
-        cur = conn.cursor()
+                periods.setdefault(key, dict())[category] = (amount_format(float(amounts[0])),
+                                                             amount_format(float(amounts[1])))
 
-        cur.execute(self.queries['get-category'].format(titulo_id))
-        result_get_category = cur.fetchall()
-        category = None
         result = list()
+        for key in sorted(periods):
+            amounts = periods[key]
 
-        if result_get_category:
-            category = result_get_category[0][0]
-
-            if group_by_year:
-                cur.execute(self.queries['read-by-action-grouped'].format(action.upper(), category, start_date, end_date))
-                result = cur.fetchall()
-
-                result = [{'ano': int(res[0]), 'valor': format_currency(float(res[1]), 'BRL')}
-                          for res in result]
-            else:
-                cur.execute(self.queries['read-by-action'].format(action.upper(), category, start_date, end_date))
-                result = cur.fetchall()
+            period = {'ano': key[0]}
+            if not group_by_year:
+                period['mes'] = key[1]
+            period['valores'] = [{'id': titulo_id, 'categoria_titulo': categories[titulo_id],
+                                  'valor_venda': amounts[categories[titulo_id]][0],
+                                  'valor_resgate': amounts[categories[titulo_id]][1]}
+                                 for titulo_id in ids if categories[titulo_id] in amounts]
 
-                result = [{'ano': int(res[0]), 'mes': int(res[1]), 'valor': format_currency(float(res[2]), 'BRL')}
-                          for res in result]
+            result.append(period)
 
-        cur.close()
-        conn.close()
+        return result
 
-        if not result_get_category:
-            return False
+    def _by_action_rows(self, titulo_id, action, start_period, end_period, group_by_year, limit=None):
+        """Yields the category of "titulo_id" (None if it has no register) and then
+        at most "limit" rows of "action".
+        """
+        engine = self._columnar_engine()
+
+        if engine:
+            category = engine.get_category(int(titulo_id))
+            yield category
+
+            if category is not None:
+                read = engine.by_action_grouped if group_by_year else engine.by_action
+                yield from read(action, category, start_period, end_period)[: limit]
+            return
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            self._execute(cur, 'get-category', int(titulo_id))
+            result_get_category = cur.fetchall()
+            category = result_get_category[0][0] if result_get_category else None
+            yield category
+
+            if category is not None:
+                name = 'read-by-action-grouped' if group_by_year else 'read-by-action'
+                max_rows = self._max_rows(start_period, end_period, group_by_year, limit)
+                yield from self._fetch_rows(conn, cur, name, max_rows, action, category, start_period, end_period, limit)
+
+    def _by_action_shape(self, group_by_year, amount_format):
+        """As "_history_shape", for the rows of an action.
+        """
+        if group_by_year:
+            return (lambda res: {'ano': res[0], 'valor': amount_format(float(res[1]))},
+                    lambda res: (res[0], 1))
+
+        def shape(res):
+            (year, month) = from_period(res[0])
+            return {'ano': year, 'mes': month, 'valor': amount_format(float(res[1]))}
+
+        return (shape, lambda res: from_period(res[0]))
 
-        return {
+    def read_by_action(self, titulo_id, action, params):
+        (start_period, end_period, group_by_year) = self._read_aux(titulo_id, params)
+        amount_format = self._amount_format(params)
+        (start_period, limit) = self._page(params, start_period)
+
+        rows = self._by_action_rows(titulo_id, action.upper(), start_period, end_period, group_by_year,
+                                    None if limit is None else limit + 1)
+        try:
+            category = next(rows)
+            if category is None:
+                return False
+
+            (shape, key) = self._by_action_shape(group_by_year, amount_format)
+            (result, next_cursor) = self._paginate(rows, limit, shape, key)
+        finally:
+            rows.close()
+
+        result = {
             'id': int(titulo_id),
             'categoria_titulo': category,
             'valores_{}'.format(action) : result
         }
+        if limit is not None:
+            result['proximo_cursor'] = next_cursor
+
+        return result
+
+    def stream_by_action(self, titulo_id, action, params):
+        """As "read_by_action", streamed as in "stream_history".
+        """
+        (start_period, end_period, group_by_year) = self._read_aux(titulo_id, params)
+        amount_format = self._amount_format(params)
+        (start_period, limit) = self._page(params, start_period)
+
+        rows = self._by_action_rows(titulo_id, action.upper(), start_period, end_period, group_by_year, limit)
+        category = next(rows)
+        if category is None:
+            rows.close()
+            return False
+
+        (shape, _) = self._by_action_shape(group_by_year, amount_format)
+        return self._stream(int(titulo_id), category, rows, shape)
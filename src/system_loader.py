@@ -2,14 +2,24 @@
 """
 
 
+import argparse
+import csv
+import datetime
+import decimal
+import io
 import logging
+import mmap
 import openpyxl
+import os
 import psycopg2
+import sys
 
 try:
-    from basics import SCHEMAS_PATH, DATABASE_PARAMS, RESOURCES_PATH, TRANSACTIONS_PATH
+    from basics import SCHEMAS_PATH, DATABASE_PARAMS, RESOURCES_PATH, TRANSACTIONS_PATH, to_period
+    from partitions import PartitionLayout
 except ImportError:
-    from src.basics import SCHEMAS_PATH, DATABASE_PARAMS, RESOURCES_PATH, TRANSACTIONS_PATH
+    from src.basics import SCHEMAS_PATH, DATABASE_PARAMS, RESOURCES_PATH, TRANSACTIONS_PATH, to_period
+    from src.partitions import PartitionLayout
 
 
 logging.basicConfig(format='[%(asctime)s] [%(levelname)s] %(message)s',
@@ -35,10 +45,15 @@ def drop_database(filename='drop-all.sql', verbose=True):
     conn.close()
 
 
-def create_database(filename='create-all.sql', verbose=True):
+def create_database(filename='create-all.sql', verbose=True, layout=None):
+    """Creates the schemas, with "tesouro_direto_series" partitioned as in
+    "layout" (by default, as set by DATABASE_PARTITIONING).
+    """
+    layout = layout if layout else PartitionLayout()
+
     schemas_filepath = '{}/{}'.format(SCHEMAS_PATH, filename)
     with open(schemas_filepath) as f:
-        sql = f.read()
+        sql = layout.schema(f.read())
 
     conn = psycopg2.connect(**DATABASE_PARAMS)
     cur = conn.cursor()
@@ -53,6 +68,27 @@ def create_database(filename='create-all.sql', verbose=True):
     conn.close()
 
 
+def create_database_if_missing(verbose=True, layout=None):
+    """Creates the schemas only if "tesouro_direto_series" does not exist, so the
+    DDL of create-all.sql (its triggers take an exclusive lock on the table) never
+    runs while the service reads it. Returns whether they were created.
+    """
+    with open('{}/check-schema.sql'.format(TRANSACTIONS_PATH)) as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+    cur.execute(sql)
+    exists = cur.fetchall()[0][0]
+    cur.close()
+    conn.close()
+
+    if not exists:
+        create_database(verbose=verbose, layout=layout)
+
+    return not exists
+
+
 def get_action(raw):
     if raw == 'Vendas':
         return 'VENDA'
@@ -65,39 +101,328 @@ def get_multiplier(raw):
         return 1000*1000
     return 1
 
+def get_series(label, unit):
+    value_splitted = label.split('- Tesouro Direto - ')
+    category = value_splitted[1]
+    action = get_action(value_splitted[0][15 : ].strip())
+
+    value_splitted = unit.split('\xa0')
+    multiplier = get_multiplier(value_splitted[1])
+
+    return (category, action, multiplier)
+
 def read_xlsx(filename, verbose=True):
+    """Returns the rows of the worksheet as SQL values, series by series (column
+    by column), as many as the worksheet holds (see "stream_series").
+    """
     xlsx_filepath = '{}/{}'.format(RESOURCES_PATH, filename)
     if verbose:
         logging.info('Reading data from file "{}".'.format(xlsx_filepath))
-    workbook = openpyxl.load_workbook(xlsx_filepath)
+    workbook = openpyxl.load_workbook(xlsx_filepath, read_only=True)
     worksheet = workbook['Planilha1']
 
-    values = list()
+    columns = dict()
 
     if verbose:
         logging.info('Reading values.')
-    for j in range(ord('C'), ord('O')):
-        column = chr(j)
+    for (category, action, period, amount) in stream_worksheet(worksheet):
+        value = "('{}', '{}', {}, {})".format(category, action, period, amount)
+        columns.setdefault((category, action), list()).append(value)
 
-        value_splitted = worksheet['{}7'.format(column)].value.split('- Tesouro Direto - ')
-        category = value_splitted[1]
-        action = get_action(value_splitted[0][15 : ].strip())
+    workbook.close()
 
-        value_splitted = worksheet['{}10'.format(column)].value.split('\xa0')
-        multiplier = get_multiplier(value_splitted[1])
+    if verbose:
+        logging.info('All values read.\n')
 
-        for i in range(12, 136):
-            date = worksheet['B{}'.format(i)].value
-            amount = worksheet['{}{}'.format(column, i)].value
-            amount = float(amount) * multiplier
+    # the series keep the order of their columns
+    return [value for values in columns.values() for value in values]
 
-            value = "('{}', '{}', '{}', {})".format(category, action, date, amount)
-            values.append(value)
 
+def stream_xlsx(filename, verbose=True):
+    """Yields the rows (category, action, period, amount) of the worksheet,
+    reading it in read-only mode, one spreadsheet row at a time, so memory does
+    not grow with the size of the file. Its ranges are found as by
+    "stream_series".
+    """
+    xlsx_filepath = '{}/{}'.format(RESOURCES_PATH, filename)
     if verbose:
-        logging.info('All values read.\n')
+        logging.info('Streaming data from file "{}".'.format(xlsx_filepath))
+    workbook = openpyxl.load_workbook(xlsx_filepath, read_only=True)
+
+    try:
+        yield from stream_worksheet(workbook['Planilha1'])
+    finally:
+        workbook.close()
+
+    if verbose:
+        logging.info('All values streamed.\n')
+
+
+def stream_series(rows, period_of):
+    """Yields the rows (category, action, period, amount) of a table laid out as
+    the input data, given as its rows of values, finding where its parts are
+    instead of assuming fixed ranges: the series are the columns of the first
+    row with labels "... - Tesouro Direto - <category>", their units are in the
+    first row below it starting by "Unidade", and the data rows are the ones
+    below with a date, in the column of the first date found. "period_of"
+    returns the period of a date value, or None if it is not a date. Empty
+    values are skipped.
+    """
+    columns = None
+    series = None
+    date_column = None
+
+    for row in rows:
+        if columns is None:
+            found = [j for (j, value) in enumerate(row) if isinstance(value, str) and '- Tesouro Direto - ' in value]
+            if found:
+                columns = found
+                labels = [row[j] for j in found]
+        elif series is None:
+            units = [row[j] if j < len(row) else None for j in columns]
+            if all([isinstance(unit, str) and unit.startswith('Unidade') for unit in units]):
+                series = [get_series(label, unit) for (label, unit) in zip(labels, units)]
+        else:
+            if date_column is None:
+                dates = [j for (j, value) in enumerate(row) if period_of(value) is not None]
+                if not dates:
+                    continue
+                date_column = dates[0]
+
+            period = period_of(row[date_column]) if date_column < len(row) else None
+            if period is None:
+                continue
+
+            for ((category, action, multiplier), j) in zip(series, columns):
+                if j < len(row) and row[j] is not None and row[j] != '':
+                    yield (category, action, period, float(row[j]) * multiplier)
+
+
+def datetime_period(value):
+    if isinstance(value, datetime.datetime):
+        return to_period(value.year, value.month)
+    return None
+
+
+def stream_worksheet(worksheet):
+    """Yields the rows (category, action, period, amount) of a worksheet laid out
+    as the input data (see "stream_series").
+    """
+    return stream_series(worksheet.iter_rows(values_only=True), datetime_period)
+
+
+def text_period(value):
+    """Returns the period of a date written as "YYYY-MM[-DD...]", "MM/YYYY" or
+    "DD/MM/YYYY", or None.
+    """
+    value = value.strip()
 
-    return values
+    if len(value) >= 7 and value[4] == '-' and value[: 4].isdigit() and value[5 : 7].isdigit():
+        return to_period(int(value[: 4]), int(value[5 : 7]))
+
+    parts = value.split('/')
+    if len(parts) in (2, 3) and all([part.isdigit() for part in parts]) and len(parts[-1]) == 4:
+        return to_period(int(parts[-1]), int(parts[-2]))
+
+    return None
+
+
+def stream_csv(filename, chunk_size=16 * 1024 * 1024, verbose=True):
+    """Yields the rows (category, action, period, amount) of a CSV file (UTF-8,
+    comma separated, amounts with decimal points) laid out as the input data
+    (see "stream_series"), as the worksheet saved as CSV.
+
+    The file is memory-mapped and parsed in chunks of about "chunk_size" bytes,
+    each one cut at the end of a line, so it is never copied whole into memory.
+    Quoted values must not hold line breaks.
+    """
+    csv_filepath = os.path.join(RESOURCES_PATH, filename)
+    if verbose:
+        logging.info('Streaming data from file "{}".'.format(csv_filepath))
+
+    def lines():
+        with open(csv_filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                while start < len(mm):
+                    end = mm.find(b'\n', min(start + chunk_size, len(mm)))
+                    end = len(mm) if end < 0 else end + 1
+                    yield from mm[start : end].decode('utf-8-sig' if start == 0 else 'utf-8').splitlines()
+                    start = end
+
+    yield from stream_series(csv.reader(lines()), text_period)
+
+    if verbose:
+        logging.info('All values streamed.\n')
+
+
+def stream_input(filename, verbose=True):
+    """Streams the rows of a CSV file ("*.csv") or of a worksheet.
+    """
+    if filename.endswith('.csv'):
+        return stream_csv(filename, verbose=verbose)
+    return stream_xlsx(filename, verbose=verbose)
+
+
+def analyze_database(cur):
+    # without statistics, the planner takes the tables loaded as empty and joins
+    # them by nested loops
+    with open('{}/analyze-input-data.sql'.format(TRANSACTIONS_PATH)) as f:
+        cur.execute(f.read())
+
+
+def copy_into_database(rows, chunk_size=10000, verbose=True, layout=None, analyze=True, bump_version=True):
+    """Loads the rows with "COPY FROM STDIN", sending them in chunks of at most
+    "chunk_size" rows. All chunks are loaded in a single transaction, followed
+    by "ANALYZE" unless "analyze" is false. Unless "bump_version", the version
+    of the data is left as it is (see "bump_version"), so loads running at the
+    same time do not wait on each other to update it.
+
+    If the table is partitioned (as in "layout", by default as set by
+    DATABASE_PARTITIONING), the rows are buffered per partition and copied
+    straight into it, so PostgreSQL does not route them one by one.
+    """
+    layout = layout if layout else PartitionLayout()
+
+    with open('{}/copy-input-data.sql'.format(TRANSACTIONS_PATH)) as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+
+    if verbose:
+        logging.info('Copying rows into database.')
+
+    buffers = dict()
+    counts = dict()
+    count = 0
+
+    def copy(table):
+        buffers[table].seek(0)
+        cur.copy_expert(sql.format(table), buffers[table])
+        buffers[table] = io.StringIO()
+
+    try:
+        if not bump_version:
+            with open('{}/skip-version-bump.sql'.format(TRANSACTIONS_PATH)) as f:
+                cur.execute(f.read())
+
+        for (category, action, period, amount) in rows:
+            table = layout.partition_of(category, period)
+            if table not in buffers:
+                buffers[table] = io.StringIO()
+                counts[table] = 0
+
+            buffers[table].write('{}\t{}\t{}\t{}\n'.format(category, action, period, amount))
+            counts[table] += 1
+            count += 1
+
+            if counts[table] % chunk_size == 0:
+                copy(table)
+
+        for (table, buffer) in buffers.items():
+            if buffer.tell() > 0:
+                copy(table)
+
+        if analyze:
+            analyze_database(cur)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    if verbose:
+        logging.info('{} rows copied into {} table(s).\n'.format(count, len(counts)))
+
+    return count
+
+
+def bump_version():
+    """Moves the version of the data forward, as every write to the series does,
+    after loads that did not.
+    """
+    with open('{}/bump-version.sql'.format(TRANSACTIONS_PATH)) as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+    cur.execute(sql)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def upsert_into_database(rows, chunk_size=1000, verbose=True, layout=None):
+    """Loads the rows incrementally, without dropping the existing ones: they are
+    compared with the records in the database and only the new ones and those
+    whose amount changed are written, with "INSERT ... ON CONFLICT DO UPDATE" in
+    chunks of at most "chunk_size" rows. Records missing from the rows are kept.
+
+    Each chunk is committed on its own, so the row locks it takes (including the
+    one on "tesouro_direto_version", which every write to the series updates)
+    are only held while it is written, and the writes of the service wait at
+    most for one chunk. If the load stops halfway, running it again writes the
+    rest.
+
+    Returns the number of rows inserted, updated and unchanged. If nothing
+    changed, nothing is written, so the version of the data (and the caches
+    based on it) stays the same.
+    """
+    layout = layout if layout else PartitionLayout()
+
+    with open('{}/read-input-data.sql'.format(TRANSACTIONS_PATH)) as f:
+        read_sql = f.read()
+    with open('{}/upsert-input-data.sql'.format(TRANSACTIONS_PATH)) as f:
+        upsert_sql = f.read().format(layout.unique_key())
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+
+    if verbose:
+        logging.info('Comparing rows with database.')
+
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+    def upsert(changes):
+        cur.execute(upsert_sql, [list(column) for column in zip(*changes)])
+        conn.commit()
+
+    try:
+        cur.execute(read_sql)
+        existing = {(category, action, period): amount for (category, action, period, amount) in cur.fetchall()}
+        conn.commit()
+
+        changes = list()
+        for (category, action, period, amount) in rows:
+            # as written by COPY, so amounts loaded from the same file are equal
+            amount = decimal.Decimal('{}'.format(amount))
+            key = (category, action, period)
+            if key not in existing:
+                counts['inserted'] += 1
+            elif existing[key] != amount:
+                counts['updated'] += 1
+            else:
+                counts['unchanged'] += 1
+                continue
+
+            changes.append((category, action, period, amount))
+            if len(changes) == chunk_size:
+                upsert(changes)
+                changes = list()
+
+        if changes:
+            upsert(changes)
+    finally:
+        cur.close()
+        conn.close()
+
+    if verbose:
+        logging.info('{inserted} rows inserted, {updated} updated and {unchanged} unchanged.\n'.format(**counts))
+
+    return counts
 
 
 def populate_database(values, verbose=True):
@@ -112,6 +437,8 @@ def populate_database(values, verbose=True):
     if verbose:
         logging.info('Populating database.')
     cur.execute(sql)
+    analyze_database(cur)
+    conn.commit()
     if verbose:
         logging.info('Database populated.\n')
 
@@ -119,12 +446,90 @@ def populate_database(values, verbose=True):
     conn.close()
 
 
+def rebuild_rollup(verbose=True):
+    """Recomputes the yearly rollup ("tesouro_direto_yearly") from the raw series.
+    """
+    with open('{}/rebuild-yearly.sql'.format(TRANSACTIONS_PATH)) as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+
+    if verbose:
+        logging.info('Rebuilding yearly rollup.')
+    cur.execute(sql)
+    if verbose:
+        logging.info('Yearly rollup rebuilt.\n')
+
+    cur.close()
+    conn.close()
+
+
+def check_rollup(verbose=True):
+    """Compares the yearly rollup against the raw series, returning the rows
+    (category, action, year, raw amount, rollup amount, raw months, rollup
+    months) that differ.
+    """
+    with open('{}/check-yearly.sql'.format(TRANSACTIONS_PATH)) as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(**DATABASE_PARAMS)
+    cur = conn.cursor()
+
+    if verbose:
+        logging.info('Checking yearly rollup.')
+    cur.execute(sql)
+    mismatches = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    if verbose:
+        for mismatch in mismatches:
+            logging.error('Rollup mismatch: {}'.format(mismatch))
+        logging.info('Yearly rollup checked: {} mismatches.\n'.format(len(mismatches)))
+
+    return mismatches
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Creates the database and loads the input data.')
+    parser.add_argument('--filename', default='input-data.xlsx',
+                        help='xlsx or csv file, relative to the resources directory (csv files are always streamed).')
+    parser.add_argument('--streaming', action='store_true',
+                        help='streams the file and loads it with COPY, using constant memory.')
+    parser.add_argument('--chunk-size', type=int,
+                        help='rows sent per COPY when streaming (default 10000), or per INSERT (and transaction) '
+                             'when incremental (default 1000).')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keeps the database, writing only the new and changed rows of the file.')
+    parser.add_argument('--rebuild-rollup', action='store_true',
+                        help='only recomputes the yearly rollup from the existing rows.')
+    parser.add_argument('--check-rollup', action='store_true',
+                        help='only checks the yearly rollup against the existing rows.')
+    args = parser.parse_args()
+
+    if args.rebuild_rollup or args.check_rollup:
+        if args.rebuild_rollup:
+            rebuild_rollup()
+        if args.check_rollup and check_rollup():
+            sys.exit(1)
+        sys.exit(0)
+
     logging.info('Preparing to load system.\n')
 
+    if args.incremental:
+        create_database_if_missing()
+        upsert_into_database(stream_input(args.filename), chunk_size=args.chunk_size or 1000)
+        logging.info('System loaded.\n')
+        sys.exit(0)
+
     drop_database()
     create_database()
-    values = read_xlsx('input-data.xlsx')
-    populate_database(values)
+    if args.streaming or args.filename.endswith('.csv'):
+        copy_into_database(stream_input(args.filename), chunk_size=args.chunk_size or 10000)
+    else:
+        values = read_xlsx(args.filename)
+        populate_database(values)
 
     logging.info('System loaded.\n')
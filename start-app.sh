@@ -5,4 +5,8 @@ export PROJECT_ROOT_PATH="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 cd $PROJECT_ROOT_PATH
 
 
-gunicorn src.main
+# bytecode and query bundle built ahead, so the workers start without them
+python -m compileall -q src
+python src/queries.py
+
+gunicorn -c src/gunicorn_config.py src.main
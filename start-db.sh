@@ -5,4 +5,4 @@ export PROJECT_ROOT_PATH="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 cd $PROJECT_ROOT_PATH
 
 
-python src/system_loader.py
+python src/system_loader.py "$@"
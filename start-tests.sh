@@ -9,3 +9,21 @@ echo "Tests for class TituloTesouroRequestHandler"
 python3 test/test_endpoints.py TestTituloTesouroRequestHandler
 echo "Tests for class TituloTesouroRefinedRequestHandler"
 python3 test/test_endpoints.py TestTituloTesouroRefinedRequestHandler
+echo "Tests for class MetricsRequestHandler"
+python3 test/test_endpoints.py TestMetricsRequestHandler
+echo "Tests for class BRLFormatter"
+python3 test/test_currency.py
+echo "Tests for class ColumnarEngine"
+python3 test/test_columnar.py
+echo "Tests for class ConnectionPool"
+python3 test/test_database.py
+echo "Tests for class PartitionLayout"
+python3 test/test_partitions.py
+echo "Tests for the loaders of system_loader"
+python3 test/test_system_loader.py TestLoaders
+echo "Tests for module archive_loader"
+python3 test/test_archive_loader.py
+echo "Tests for the CSV reader of system_loader"
+python3 test/test_system_loader.py TestStreamCSV
+echo "Tests for class Metrics"
+python3 test/test_metrics.py
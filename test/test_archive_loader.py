@@ -0,0 +1,133 @@
+"""Tests for module archive_loader.
+"""
+
+
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import openpyxl
+import psycopg2
+
+from src.archive_loader import find_workbooks, parse_workbook, parse_workbooks, load_rows
+from src.basics import DATABASE_PARAMS, to_period
+from src.system_loader import drop_database, create_database, copy_into_database
+
+
+def write_workbook(path, first_row, first_column, amounts):
+    """Writes the series of LTN (sales, in millions) and NTN-B (redemptions, in
+    units) from "first_row" and "first_column" on, one row per month of 2010.
+    """
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+
+    def write(row, column, value):
+        worksheet.cell(row=first_row + row, column=first_column + column, value=value)
+
+    write(0, 1, 'Nome da série:\xa0Vendas - Tesouro Direto - LTN')
+    write(0, 2, 'Nome da série:\xa0Resgates - Tesouro Direto - NTN-B')
+    write(1, 1, 'Unidade:\xa0R$ (milhões)')
+    write(1, 2, 'Unidade:\xa0R$')
+    for (i, amount) in enumerate(amounts):
+        write(2 + i, 0, datetime.datetime(2010, i + 1, 1))
+        write(2 + i, 1, amount)
+        write(2 + i, 2, amount)
+    write(2 + len(amounts), 0, 'Fonte: Tesouro Nacional')
+
+    workbook.save(path)
+
+
+class TestArchiveLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def test_parse_workbook_finds_extents(self):
+        write_workbook(self.path('a.xlsx'), 3, 2, [1.5, None, 2])
+
+        self.assertEqual(parse_workbook(self.path('a.xlsx')), [
+            ('LTN', 'VENDA', to_period(2010, 1), 1500000.0),
+            ('NTN-B', 'RESGATE', to_period(2010, 1), 1.5),
+            ('LTN', 'VENDA', to_period(2010, 3), 2000000.0),
+            ('NTN-B', 'RESGATE', to_period(2010, 3), 2.0)
+        ])
+
+    def test_parse_workbooks_keeps_last_value(self):
+        write_workbook(self.path('2010-02.xlsx'), 1, 1, [1, 2])
+        write_workbook(self.path('2010-03.xlsx'), 7, 2, [1, 5, 3])
+
+        paths = find_workbooks(self.directory.name)
+        self.assertEqual(paths, [self.path('2010-02.xlsx'), self.path('2010-03.xlsx')])
+
+        rows = parse_workbooks(paths, processes=2)
+        self.assertEqual(sorted(rows), [
+            ('LTN', 'VENDA', to_period(2010, 1), 1000000.0),
+            ('LTN', 'VENDA', to_period(2010, 2), 5000000.0),
+            ('LTN', 'VENDA', to_period(2010, 3), 3000000.0),
+            ('NTN-B', 'RESGATE', to_period(2010, 1), 1.0),
+            ('NTN-B', 'RESGATE', to_period(2010, 2), 5.0),
+            ('NTN-B', 'RESGATE', to_period(2010, 3), 3.0)
+        ])
+
+
+class TestLoadRows(unittest.TestCase):
+
+    ROWS = [(category, action, to_period(2010, month), 1.0) for category in ['LTN', 'LFT', 'NTN-B']
+            for action in ['VENDA', 'RESGATE'] for month in range(1, 13)]
+
+    def setUp(self):
+        drop_database(verbose=False)
+        create_database(verbose=False)
+
+    def tearDownClass():
+        drop_database(verbose=False)
+
+    def version(self):
+        conn = psycopg2.connect(**DATABASE_PARAMS)
+        cur = conn.cursor()
+        cur.execute('SELECT version FROM tesouro_direto_version')
+        version = cur.fetchall()[0][0]
+        conn.close()
+
+        return version
+
+    def test_loads_do_not_wait_for_version(self):
+        # a load of other series, still running
+        conn = psycopg2.connect(**DATABASE_PARAMS)
+        cur = conn.cursor()
+        cur.execute('SET LOCAL easynvest.skip_version_bump = on')
+        cur.execute("INSERT INTO tesouro_direto_series (category, action, period, amount) "
+                    "VALUES ('NTN-F', 'VENDA', 0, 1)")
+
+        thread = threading.Thread(target=copy_into_database, args=(TestLoadRows.ROWS,),
+                                  kwargs=dict(verbose=False, analyze=False, bump_version=False))
+        thread.start()
+        thread.join(10)
+        finished = not thread.is_alive()
+
+        conn.rollback()
+        conn.close()
+        thread.join()
+
+        self.assertTrue(finished)
+
+    def test_load_rows_bumps_version_once(self):
+        version = self.version()
+
+        self.assertEqual(load_rows(TestLoadRows.ROWS, 3), len(TestLoadRows.ROWS))
+        self.assertEqual(self.version(), version + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Tests for module columnar.
+"""
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.basics import to_period
+from src.columnar import ColumnarEngine
+
+
+class TestColumnarEngine(unittest.TestCase):
+
+    # (id, category, action, period, amount)
+    ROWS = [
+        (1, 'LTN', 'VENDA', to_period(2010, 1), 10.0),
+        (2, 'LTN', 'RESGATE', to_period(2010, 1), 1.0),
+        (3, 'LTN', 'VENDA', to_period(2010, 2), 20.0),
+        (4, 'LTN', 'VENDA', to_period(2011, 12), 30.0),
+        (5, 'LTN', 'RESGATE', to_period(2011, 12), 3.0),
+        (6, 'NTN-B', 'VENDA', to_period(2010, 1), 100.0)
+    ]
+
+    def setUp(self):
+        self.engine = ColumnarEngine(0)
+        self.engine.load(TestColumnarEngine.ROWS, (7, 'updated_at'))
+
+    def test_load(self):
+        self.assertTrue(self.engine.is_loaded())
+        self.assertEqual(self.engine.version, (7, 'updated_at'))
+        self.assertEqual(self.engine.get_category(6), 'NTN-B')
+        self.assertIsNone(self.engine.get_category(7))
+
+        # whole years, up to the last period
+        self.assertEqual(self.engine._amounts.shape[2], to_period(2011, 12) + 1)
+
+        self.assertEqual(self.engine.history('LTN', 0, to_period(2020, 12)), [
+            (to_period(2010, 1), 10.0, 1.0),
+            (to_period(2011, 12), 30.0, 3.0)
+        ])
+        self.assertEqual(self.engine.by_action('VENDA', 'LTN', to_period(2010, 2), to_period(2011, 11)), [
+            (to_period(2010, 2), 20.0)
+        ])
+
+    def test_load_empty(self):
+        engine = ColumnarEngine(0)
+        engine.load([], (1, 'updated_at'))
+
+        self.assertEqual(engine.history('LTN', 0, to_period(2020, 12)), [])
+        self.assertEqual(engine.history_grouped('LTN', 0, to_period(2020, 12)), [])
+
+    def test_apply(self):
+        self.engine.apply((8, 'updated_at'), self.engine.insert, 7, 'LTN', 'RESGATE', to_period(2030, 2), 5.0)
+
+        self.assertEqual(self.engine.version, (8, 'updated_at'))
+        self.assertEqual(self.engine.get_category(7), 'LTN')
+        self.assertEqual(self.engine.by_action('RESGATE', 'LTN', to_period(2030, 1), to_period(2030, 12)), [
+            (to_period(2030, 2), 5.0)
+        ])
+
+        self.engine.apply((9, 'updated_at'), self.engine.delete, 1)
+
+        self.assertEqual(self.engine.version, (9, 'updated_at'))
+        self.assertIsNone(self.engine.get_category(1))
+        self.assertEqual(self.engine.history('LTN', 0, to_period(2010, 12)), [])
+
+    def test_apply_after_another_writer(self):
+        self.engine.checked(now=100.0)
+
+        # the version skipped one: another process wrote in between
+        self.engine.apply((9, 'updated_at'), self.engine.delete, 6)
+
+        self.assertIsNone(self.engine.version)
+        self.assertEqual(self.engine.checked_at, 0.0)
+        self.assertTrue(self.engine.needs_check(now=100.0))
+
+    def test_needs_check(self):
+        engine = ColumnarEngine(10)
+        self.assertTrue(engine.needs_check(now=100.0))
+
+        engine.load(TestColumnarEngine.ROWS, (7, 'updated_at'))
+        engine.checked(now=100.0)
+
+        self.assertFalse(engine.needs_check(now=105.0))
+        self.assertTrue(engine.needs_check(now=110.0))
+
+        # with no interval, every read checks the version
+        self.assertTrue(self.engine.needs_check())
+
+    def test_update(self):
+        self.engine.update(1, 'RESGATE', to_period(2010, 3), None)
+
+        self.assertEqual(self.engine.by_action('RESGATE', 'LTN', to_period(2010, 1), to_period(2010, 12)), [
+            (to_period(2010, 1), 1.0),
+            (to_period(2010, 3), 10.0)
+        ])
+        self.assertEqual(self.engine.by_action('VENDA', 'LTN', to_period(2010, 1), to_period(2010, 12)), [
+            (to_period(2010, 2), 20.0)
+        ])
+
+    def test_update_many(self):
+        # the records swap months: one takes the month the other leaves
+        self.engine.update_many([
+            (1, 'LTN', 'VENDA', to_period(2010, 2), 11.0),
+            (3, 'LTN', 'VENDA', to_period(2010, 1), 21.0)
+        ])
+
+        self.assertEqual(self.engine.by_action('VENDA', 'LTN', to_period(2010, 1), to_period(2010, 2)), [
+            (to_period(2010, 1), 21.0),
+            (to_period(2010, 2), 11.0)
+        ])
+        self.assertEqual(self.engine._index[1][2], to_period(2010, 2))
+        self.assertEqual(self.engine._index[3][2], to_period(2010, 1))
+
+    def test_history_grouped(self):
+        rows = self.engine.history_grouped('LTN', 0, to_period(2020, 12))
+
+        self.assertEqual(rows, [
+            (2010, 30.0, 1.0),
+            (2011, 30.0, 3.0)
+        ])
+
+        # the months outside of the interval are not summed
+        rows = self.engine.history_grouped('LTN', to_period(2010, 2), to_period(2011, 12))
+
+        self.assertEqual(rows, [
+            (2011, 30.0, 3.0)
+        ])
+
+        # a year needs both actions, not necessarily in the same months
+        self.engine.delete(5)
+        self.engine.insert(8, 'LTN', 'RESGATE', to_period(2011, 1), 4.0)
+
+        self.assertEqual(self.engine.history_grouped('LTN', 0, to_period(2020, 12)), [
+            (2010, 30.0, 1.0),
+            (2011, 30.0, 4.0)
+        ])
+        self.assertEqual(self.engine.history('LTN', to_period(2011, 1), to_period(2011, 12)), [])
+        self.assertEqual(self.engine.history_grouped('NTN-B', 0, to_period(2020, 12)), [])
+
+    def test_by_action_grouped(self):
+        rows = self.engine.by_action_grouped('VENDA', 'LTN', 0, to_period(2020, 12))
+
+        self.assertEqual(rows, [
+            (2010, 30.0),
+            (2011, 30.0)
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests for module currency.
+"""
+
+
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from babel.numbers import format_currency
+
+from src.currency import BRLFormatter
+
+
+class TestBRLFormatter(unittest.TestCase):
+
+    LOCALES = ['id_ID', 'pt_BR', 'en_US', 'en_US_POSIX', 'de_CH', 'fr_FR', 'es_ES', 'ar_EG', 'hi_IN']
+
+    def random_amounts(self, count):
+        rand = random.Random(0)
+        return [round(rand.uniform(-1, 1) * 10 ** rand.randint(0, 12), rand.randint(0, 4)) for _ in range(count)]
+
+    def test_format_equals_babel(self):
+        amounts = [0.0, -0.0, 0.005, 0.015, 2.675, 999.995, 1000, 1234567.885, -1234.565] + self.random_amounts(5000)
+
+        for locale in TestBRLFormatter.LOCALES:
+            formatter = BRLFormatter(locale)
+
+            for amount in amounts:
+                self.assertEqual(formatter.format(amount), format_currency(amount, 'BRL', locale=locale),
+                                 'amount {} in locale {}'.format(amount, locale))
+
+    def test_format_supported_locale_without_babel(self):
+        formatter = BRLFormatter('id_ID')
+
+        self.assertTrue(formatter.is_fast)
+        self.assertEqual(formatter.format(202270000.0), 'R$202.270.000,00')
+
+    def test_format_unsupported_locale_with_babel(self):
+        formatter = BRLFormatter('hi_IN')
+
+        self.assertFalse(formatter.is_fast)
+        self.assertEqual(formatter.format(1234567.89), 'R$12,34,567.89')
+
+    def test_cache_is_bounded(self):
+        formatter = BRLFormatter('id_ID', cache_size=10)
+
+        for amount in self.random_amounts(100):
+            formatter.format(amount)
+        formatter.format(1.5)
+        formatter.format(1.5)
+
+        self.assertEqual(formatter.cache_info().currsize, 10)
+        self.assertGreaterEqual(formatter.cache_info().hits, 1)
+
+    def test_babel_imported_on_first_use(self):
+        code = '; '.join([
+            'import sys',
+            'from src.currency import BRLFormatter',
+            'formatter = BRLFormatter("id_ID")',
+            'print("babel.numbers" in sys.modules)',
+            'formatter.format(1.5)',
+            'print("babel.numbers" in sys.modules)'
+        ])
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.environ.get('PROJECT_ROOT_PATH'))
+
+        self.assertEqual(output.decode().split(), ['False', 'True'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+"""Tests for class ConnectionPool of module database.
+"""
+
+
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import psycopg2
+import psycopg2.pool
+
+from src.basics import DATABASE_PARAMS
+from src.database import ConnectionPool
+
+
+def backend_pid(conn):
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_backend_pid()')
+        return cur.fetchall()[0][0]
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = list()
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+
+    def pool(self, **kwargs):
+        pool = ConnectionPool(**kwargs)
+        self.pools.append(pool)
+
+        return pool
+
+    def test_stats(self):
+        pool = self.pool(min_size=1, max_size=3)
+
+        self.assertEqual(pool.stats()['open'], 0)
+
+        conns = [pool.getconn() for _ in range(2)]
+        stats = pool.stats()
+
+        self.assertEqual(stats['pid'], os.getpid())
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual((stats['open'], stats['idle'], stats['in_use']), (2, 0, 2))
+
+        pool.putconn(conns.pop())
+        stats = pool.stats()
+
+        self.assertEqual((stats['open'], stats['idle'], stats['in_use']), (2, 1, 1))
+
+        with pool.connection():
+            self.assertEqual(pool.stats()['in_use'], 2)
+        pool.putconn(conns.pop())
+        stats = pool.stats()
+
+        # only "min_size" idle connections are kept open
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual((stats['open'], stats['idle'], stats['in_use']), (1, 1, 0))
+        self.assertEqual((stats['timeouts'], stats['failed_health_checks']), (0, 0))
+
+    def test_checkout_timeout(self):
+        pool = self.pool(min_size=0, max_size=1, timeout=0.1)
+
+        conn = pool.getconn()
+
+        with self.assertRaises(psycopg2.pool.PoolError):
+            pool.getconn()
+
+        # a waiting checkout gets the connection once it is returned
+        threading.Timer(0.05, pool.putconn, [conn]).start()
+        pool.timeout = 5
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_health_check_replaces_killed_backend(self):
+        pool = self.pool(min_size=1, max_size=2, health_check_interval=0)
+
+        with pool.connection() as conn:
+            killed = backend_pid(conn)
+
+        admin = psycopg2.connect(**DATABASE_PARAMS)
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute('SELECT pg_terminate_backend(%s)', (killed,))
+        admin.close()
+
+        with pool.connection() as conn:
+            self.assertNotEqual(backend_pid(conn), killed)
+
+        stats = pool.stats()
+        self.assertEqual(stats['failed_health_checks'], 1)
+        self.assertEqual(stats['open'], 1)
+
+    def test_health_check_interval(self):
+        pool = self.pool(min_size=1, max_size=1, health_check_interval=60)
+
+        with pool.connection() as conn:
+            killed = backend_pid(conn)
+
+        admin = psycopg2.connect(**DATABASE_PARAMS)
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute('SELECT pg_terminate_backend(%s)', (killed,))
+        admin.close()
+
+        # used less than the interval ago, so it is not checked: the failure
+        # reaches the caller, and the broken connection is not kept
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.connection() as conn:
+                backend_pid(conn)
+
+        with pool.connection() as conn:
+            self.assertNotEqual(backend_pid(conn), killed)
+
+    def test_fork_resets_pool(self):
+        pool = self.pool(min_size=1, max_size=2)
+
+        conn = pool.getconn()
+        parent_backend = backend_pid(conn)
+        pool.putconn(conn)
+
+        (read_fd, write_fd) = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                before = pool.stats()
+                with pool.connection() as conn:
+                    child_backend = backend_pid(conn)
+                after = pool.stats()
+                pool.close()
+
+                result = {'before': before, 'after': after, 'backend': child_backend}
+            except Exception as e:
+                result = {'err': repr(e)}
+
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump(result, f)
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            result = json.load(f)
+        os.waitpid(pid, 0)
+
+        self.assertNotIn('err', result)
+        self.assertEqual(result['before']['pid'], pid)
+        self.assertEqual((result['before']['checkouts'], result['before']['open']), (0, 0))
+        self.assertEqual(result['after']['checkouts'], 1)
+        self.assertNotEqual(result['backend'], parent_backend)
+
+        # the connection of the parent was neither closed nor used by the child
+        with pool.connection() as conn:
+            self.assertEqual(backend_pid(conn), parent_backend)
+
+        stats = pool.stats()
+        self.assertEqual(stats['pid'], os.getpid())
+        self.assertEqual(stats['checkouts'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,8 +10,10 @@ import unittest
 
 sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
 
-from src.basics import DATABASE_PARAMS, TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS
-from src.system_loader import drop_database, create_database, read_xlsx, populate_database
+from src.basics import DATABASE_PARAMS, TITULO_TESOURO_CATEGORIES, TITULO_TESOURO_ACTIONS, to_period
+from src.basics import current_period
+from src.system_loader import drop_database, create_database, read_xlsx, populate_database, stream_xlsx
+from src.system_loader import upsert_into_database
 
 
 class TestRequestHandler(unittest.TestCase):
@@ -252,8 +254,134 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
 
         self.assertEqual(resp.status_code, 400)
         self.assertIn('err', resp.json())
-        self.assertIn('duplicate key value violates unique constraint "tesouro_direto_series_category_action_expire_at_key"',
-            resp.json()['err'])
+        # the constraint is the table's or, when partitioned, the partition's
+        self.assertRegex(resp.json()['err'],
+            'duplicate key value violates unique constraint "tesouro_direto_series(_\\w+)?_category_action_period_key"')
+
+    def test_create_many_with_valid_post_body(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'resgate',
+                'valor': 1234.567
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json(), {
+            'success': [
+                {
+                    'id': 1,
+                    'categoria_titulo': 'NTN-B',
+                    'mês': 4,
+                    'ano': 2017,
+                    'ação': 'VENDA',
+                    'valor': 15000.00
+                },
+                {
+                    'id': 2,
+                    'categoria_titulo': 'NTN-B',
+                    'mês': 4,
+                    'ano': 2017,
+                    'ação': 'RESGATE',
+                    'valor': 1234.57
+                }
+            ]
+        })
+
+    def test_create_many_with_invalid_records(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 13,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {
+            'err': [
+                {
+                    'índice': 1,
+                    'err': '"month" must be in interval [1, 12].'
+                },
+                {
+                    'índice': 2,
+                    'err': 'Same record as in position 0.'
+                }
+            ]
+        })
+
+    def test_create_many_with_already_registered_record(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps({
+            'categoria_titulo': 'NTN-B',
+            'mês': 5,
+            'ano': 2017,
+            'ação': 'venda',
+            'valor': 25000
+        }))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 25000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {
+            'err': [
+                {
+                    'índice': 1,
+                    'err': 'Record already registered.'
+                }
+            ]
+        })
+
+        resp = requests.delete('{}/3'.format(TestRequestHandler.BASE_URL))
+
+        self.assertEqual(resp.status_code, 404)
 
     def test_delete_with_non_integer_id(self):
         resp = requests.delete('{}/three'.format(TestRequestHandler.BASE_URL))
@@ -305,6 +433,116 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
             'success': 'Deleted.'
         })
 
+    def test_delete_many_by_ids(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 666
+            },
+            {
+                'categoria_titulo': 'LTN',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 1000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.delete(TestRequestHandler.BASE_URL,
+            data=json.dumps({
+            'ids': [1, 3, 4]
+        }))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'success': {
+                'ids': [1, 3]
+            }
+        })
+
+        resp = requests.delete('{}/2'.format(TestRequestHandler.BASE_URL))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_delete_many_by_interval(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 666
+            },
+            {
+                'categoria_titulo': 'LTN',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 1000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.delete(TestRequestHandler.BASE_URL,
+            data=json.dumps({
+            'categoria_titulo': 'NTN-B',
+            'data_inicio': '2017-05',
+            'data_fim': '2017-12'
+        }))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'success': {
+                'ids': [2]
+            }
+        })
+
+    def test_delete_many_by_interval_without_dates(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps({
+            'categoria_titulo': 'NTN-B',
+            'mês': 5,
+            'ano': 2017,
+            'ação': 'venda',
+            'valor': 666
+        }))
+
+        self.assertEqual(resp.status_code, 201)
+
+        for (body, missing) in [({'categoria_titulo': 'NTN-B'}, 'data_inicio'),
+                                ({'categoria_titulo': 'NTN-B', 'data_inicio': '2002-01'}, 'data_fim'),
+                                ({'categoria_titulo': 'NTN-B', 'data_fim': '2017-12'}, 'data_inicio')]:
+            resp = requests.delete(TestRequestHandler.BASE_URL, data=json.dumps(body))
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json()['err'], 'Missing mandatory parameter "{}".'.format(missing))
+
+        # nothing was deleted
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL))
+
+        self.assertEqual(resp.status_code, 200)
+
     def test_update_with_no_body(self):
         resp = requests.put('{}/1'.format(TestRequestHandler.BASE_URL))
 
@@ -385,6 +623,40 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
             }
         })
 
+    def test_update_month_keeps_year(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps({
+            'categoria_titulo': 'NTN-B',
+            'mês': 5,
+            'ano': 2017,
+            'ação': 'venda',
+            'valor': 666
+        }))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.put('{}/1'.format(TestRequestHandler.BASE_URL),
+            data=json.dumps({
+            'mês': 11
+        }))
+
+        self.assertEqual(resp.status_code, 200)
+
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2017-01',
+            'data_fim': '2017-12',
+            'formato': 'numerico'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['success']['valores_venda'], [
+            {
+                'ano': 2017,
+                'mes': 11,
+                'valor': 666.0
+            }
+        ])
+
     def test_update_categoria_titulo(self):
         resp = requests.post(TestRequestHandler.BASE_URL,
             data=json.dumps({
@@ -416,6 +688,153 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
         self.assertIn('err', resp.json())
         self.assertEqual(resp.json()['err'], 'Field "categoria_titulo" cannot be updated')
 
+    def test_update_many_with_existing_ids(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 666
+            },
+            {
+                'categoria_titulo': 'LTN',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 1000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.put(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'id': 1,
+                'mês': 6
+            },
+            {
+                'id': 2,
+                'mês': 4,
+                'valor': 777
+            },
+            {
+                'id': 3,
+                'ação': 'resgate'
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'success': {
+                'ids': [1, 2, 3]
+            }
+        })
+
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2017-01',
+            'data_fim': '2017-12'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['success']['valores_venda'], [
+            {
+                'ano': 2017,
+                'mes': 4,
+                'valor': 'R$777,00'
+            },
+            {
+                'ano': 2017,
+                'mes': 6,
+                'valor': 'R$15.000,00'
+            }
+        ])
+
+    def test_update_many_with_non_existing_id(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 4,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 15000
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 666
+            },
+            {
+                'categoria_titulo': 'LTN',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 1000
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.put(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'id': 1,
+                'valor': 1
+            },
+            {
+                'id': 4,
+                'valor': 1
+            },
+            {
+                'id': 1,
+                'categoria_titulo': 'LTN'
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {
+            'err': [
+                {
+                    'índice': 2,
+                    'err': 'Same id as in position 0.'
+                }
+            ]
+        })
+
+        resp = requests.put(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'id': 1,
+                'valor': 1
+            },
+            {
+                'id': 4,
+                'valor': 1
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {
+            'err': [
+                {
+                    'índice': 1,
+                    'err': '"titulo_id" has no register.'
+                }
+            ]
+        })
+
     def test_read_history_with_non_existing_titulo_id(self):
         resp = requests.get('{}/1'.format(TestRequestHandler.BASE_URL), params={
             'data_inicio': '2015-05'
@@ -497,6 +916,208 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
             ]
         })
 
+    def test_read_history_with_if_none_match(self):
+        resp = requests.post(TestRequestHandler.BASE_URL,
+            data=json.dumps([
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'venda',
+                'valor': 666
+            },
+            {
+                'categoria_titulo': 'NTN-B',
+                'mês': 5,
+                'ano': 2017,
+                'ação': 'resgate',
+                'valor': 333
+            }
+        ]))
+
+        self.assertEqual(resp.status_code, 201)
+
+        resp = requests.get('{}/1'.format(TestRequestHandler.BASE_URL))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('ETag', resp.headers)
+        # the interval ends at the current month, which moves
+        self.assertNotIn('Last-Modified', resp.headers)
+        etag = resp.headers['ETag']
+
+        resp = requests.get('{}/1'.format(TestRequestHandler.BASE_URL), headers={
+            'If-None-Match': etag
+        })
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+        self.assertEqual(resp.content, b'')
+
+        resp = requests.put('{}/2'.format(TestRequestHandler.BASE_URL),
+            data=json.dumps({
+            'valor': 444
+        }))
+
+        self.assertEqual(resp.status_code, 200)
+
+        resp = requests.get('{}/1'.format(TestRequestHandler.BASE_URL), headers={
+            'If-None-Match': etag
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(resp.json()['success']['historico'][0]['valor_resgate'], 'R$444,00')
+
+    def test_validators_of_representations_and_intervals(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        url = '{}/1488'.format(TestRequestHandler.BASE_URL)
+        params = {'data_fim': '2015-12'}
+        ndjson = {'Accept': 'application/x-ndjson'}
+
+        resp = requests.get(url, params=params)
+
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+        last_modified = resp.headers['Last-Modified']
+
+        resp = requests.get(url, params=params, headers={'If-Modified-Since': last_modified})
+
+        self.assertEqual(resp.status_code, 304)
+
+        # the NDJSON representation has a tag of its own
+        resp = requests.get(url, params=params, headers=ndjson)
+
+        self.assertEqual(resp.status_code, 200)
+        ndjson_etag = resp.headers['ETag']
+        self.assertEqual(ndjson_etag, etag[: -1] + '-ndjson"')
+
+        resp = requests.get(url, params=params, headers=dict(ndjson, **{'If-None-Match': etag}))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Type'], 'application/x-ndjson')
+
+        resp = requests.get(url, params=params, headers=dict(ndjson, **{'If-None-Match': ndjson_etag}))
+
+        self.assertEqual(resp.status_code, 304)
+
+        resp = requests.get(url, params=params, headers={'If-None-Match': ndjson_etag})
+
+        self.assertEqual(resp.status_code, 200)
+
+        # without "data_fim", the tag holds the current month, so a response
+        # cached in a previous month is not fresh, and dates do not validate it
+        resp = requests.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['ETag'], '{}-{}"'.format(etag[: -1], current_period()))
+        self.assertNotIn('Last-Modified', resp.headers)
+
+        resp = requests.get(url, headers={'If-None-Match': '{}-{}"'.format(etag[: -1], current_period() - 1)})
+
+        self.assertEqual(resp.status_code, 200)
+
+        resp = requests.get(url, headers={'If-Modified-Since': last_modified})
+
+        self.assertEqual(resp.status_code, 200)
+
+        resp = requests.get(url, headers={'If-None-Match': resp.headers['ETag']})
+
+        self.assertEqual(resp.status_code, 304)
+
+    def test_conditional_requests_of_invalid_or_missing_titulos(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL))
+
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+
+        for headers in [{'If-None-Match': etag}, {'If-None-Match': '*'}]:
+            resp = requests.get('{}/abc'.format(TestRequestHandler.BASE_URL), headers=headers)
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json()['err'], '"titulo_id" must be an int.')
+
+            resp = requests.get('{}/9999'.format(TestRequestHandler.BASE_URL), headers=headers)
+
+            self.assertEqual(resp.status_code, 404)
+            self.assertEqual(resp.json()['err'], '"titulo_id" has no register.')
+
+            resp = requests.get('{}/venda/9999'.format(TestRequestHandler.BASE_URL), headers=headers)
+
+            self.assertEqual(resp.status_code, 404)
+
+            resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
+                'ids': [1, 33, 999999]
+            }, headers=headers)
+
+            self.assertEqual(resp.status_code, 404)
+            self.assertEqual(resp.json()['err'], 'One of the ids was not found.')
+
+            resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params={
+                'limit': '0'
+            }, headers=headers)
+
+            self.assertEqual(resp.status_code, 400)
+
+            resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), headers=headers)
+
+            self.assertEqual(resp.status_code, 304)
+
+            resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
+                'ids': [1, 33, 1488]
+            }, headers=headers)
+
+            self.assertEqual(resp.status_code, 304)
+
+    def test_read_history_after_incremental_load(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        params = {
+            'data_inicio': '2014-05',
+            'data_fim': '2014-05'
+        }
+        resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params=params)
+
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+
+        rows = list(stream_xlsx('input-data.xlsx', verbose=False))
+        counts = upsert_into_database(rows, verbose=False)
+
+        self.assertEqual(counts, {'inserted': 0, 'updated': 0, 'unchanged': 1488})
+
+        resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params=params, headers={
+            'If-None-Match': etag
+        })
+
+        self.assertEqual(resp.status_code, 304)
+
+        period = to_period(2014, 5)
+        rows = [row for row in rows if row[0 : 3] != ('NTN-F', 'VENDA', period)]
+        rows.extend([('NTN-F', 'VENDA', period, 17000000.0), ('NTN-F', 'VENDA', to_period(2030, 1), 1.0)])
+        counts = upsert_into_database(rows, verbose=False)
+
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1487})
+
+        resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params=params, headers={
+            'If-None-Match': etag
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['success']['historico'], [
+            {
+                "ano": 2014,
+                "valor_resgate": "R$10.630.000,00",
+                "valor_venda": "R$17.000.000,00",
+                "mes": 5
+            }
+        ])
+
     def test_read_history_with_non_boolean_group_by(self):
         resp = requests.get('{}/1'.format(TestRequestHandler.BASE_URL), params={
             'data_inicio': '2015-05',
@@ -541,6 +1162,56 @@ class TestTituloTesouroRequestHandler(TestRequestHandler):
             ]
         })
 
+    def test_read_history_with_limit_and_cursor(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        params = {
+            'data_inicio': '2014-05',
+            'data_fim': '2014-10',
+            'limit': '3'
+        }
+        months = list()
+
+        while True:
+            resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params=params)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(resp.json()['success']['historico']), 3)
+            months.extend([value['mes'] for value in resp.json()['success']['historico']])
+
+            if resp.json()['success']['proximo_cursor'] is None:
+                break
+            params['cursor'] = resp.json()['success']['proximo_cursor']
+
+        self.assertEqual(months, [5, 6, 7, 8, 9, 10])
+
+    def test_read_history_as_ndjson(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        resp = requests.get('{}/1488'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2014-10'
+        }, headers={'Accept': 'application/x-ndjson'}, stream=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Type'], 'application/x-ndjson')
+        self.assertIn('ETag', resp.headers)
+        self.assertEqual(resp.headers['Vary'], 'Accept')
+
+        records = [json.loads(line) for line in resp.iter_lines() if line]
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0], {
+            "id": 1488,
+            "categoria_titulo": "NTN-F",
+            "ano": 2014,
+            "valor_resgate": "R$10.630.000,00",
+            "valor_venda": "R$16.540.000,00",
+            "mes": 5
+        })
+        self.assertEqual([record['mes'] for record in records], [5, 6, 7, 8, 9, 10])
+
 
 class TestTituloTesouroRefinedRequestHandler(TestRequestHandler):
 
@@ -658,6 +1329,111 @@ class TestTituloTesouroRefinedRequestHandler(TestRequestHandler):
             ]
         })
 
+    def test_get_by_action_with_numeric_format(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2016-10',
+            'group_by': 'true',
+            'formato': 'numerico'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('success', resp.json())
+        self.assertEqual(resp.json()['success']['valores_venda'], [
+            {
+                "ano": 2014,
+                "valor": 669810000.0
+            },
+            {
+                "ano": 2015,
+                "valor": 2325500000.0
+            },
+            {
+                "ano": 2016,
+                "valor": 943830000.0
+            }
+        ])
+
+    def test_get_by_action_with_invalid_format(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'formato': 'texto'
+        })
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('err', resp.json())
+        self.assertEqual(resp.json()['err'], '"formato" must be "moeda" or "numerico".')
+
+    def test_get_by_action_with_limit_and_cursor(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2014-10',
+            'limit': '4'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('success', resp.json())
+        self.assertEqual([(value['ano'], value['mes']) for value in resp.json()['success']['valores_venda']],
+                         [(2014, 5), (2014, 6), (2014, 7), (2014, 8)])
+        self.assertEqual(resp.json()['success']['proximo_cursor'], '2014-09')
+
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2014-10',
+            'limit': '4',
+            'cursor': '2014-09'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['success']['valores_venda'], [
+            {
+                "ano": 2014,
+                "valor": "R$79.920.000,00",
+                "mes": 9
+            },
+            {
+                "ano": 2014,
+                "valor": "R$95.190.000,00",
+                "mes": 10
+            }
+        ])
+        self.assertIsNone(resp.json()['success']['proximo_cursor'])
+
+    def test_get_by_action_grouped_by_year_with_limit(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2016-10',
+            'group_by': 'true',
+            'limit': '2'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([value['ano'] for value in resp.json()['success']['valores_venda']], [2014, 2015])
+        self.assertEqual(resp.json()['success']['proximo_cursor'], '2016-01')
+
+    def test_get_by_action_as_ndjson(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'data_inicio': '2014-05',
+            'data_fim': '2016-10',
+            'group_by': 'true'
+        }, headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in resp.text.splitlines()], [
+            {'id': 1, 'categoria_titulo': 'LTN', 'ano': 2014, 'valor': 'R$669.810.000,00'},
+            {'id': 1, 'categoria_titulo': 'LTN', 'ano': 2015, 'valor': 'R$2.325.500.000,00'},
+            {'id': 1, 'categoria_titulo': 'LTN', 'ano': 2016, 'valor': 'R$943.830.000,00'}
+        ])
+
+    def test_get_by_action_with_invalid_limit(self):
+        resp = requests.get('{}/venda/1'.format(TestRequestHandler.BASE_URL), params={
+            'limit': '0'
+        })
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('err', resp.json())
+        self.assertEqual(resp.json()['err'], '"limit" must be a positive int.')
+
     def test_compare_without_ids(self):
         resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL))
 
@@ -665,6 +1441,16 @@ class TestTituloTesouroRefinedRequestHandler(TestRequestHandler):
         self.assertIn('err', resp.json())
         self.assertEqual(resp.json()['err'], 'Missing mandatory parameter "ids".')
 
+    def test_compare_with_repeated_id(self):
+        for ids in [[1, 1], ['1', '01', '001']]:
+            resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
+                'ids': ids
+            })
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('err', resp.json())
+            self.assertEqual(resp.json()['err'], 'Must have at least 2 ids.')
+
     def test_compare_with_non_list_ids(self):
         resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
             'ids': '[1, 33, 643]'
@@ -701,5 +1487,134 @@ class TestTituloTesouroRefinedRequestHandler(TestRequestHandler):
         self.assertEqual(resp.json()['err'], 'One of the ids was not found.')
 
 
+    def test_compare_with_existing_ids(self):
+        resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
+            'ids': [1, 500],
+            'data_inicio': '2015-01',
+            'data_fim': '2015-02'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'success': [
+                {
+                    'ano': 2015,
+                    'mes': 1,
+                    'valores': [
+                        {
+                            'id': 1,
+                            'categoria_titulo': 'LTN',
+                            'valor_venda': 'R$202.270.000,00',
+                            'valor_resgate': 'R$29.920.000,00'
+                        },
+                        {
+                            'id': 500,
+                            'categoria_titulo': 'NTN-C',
+                            'valor_venda': 'R$0,00',
+                            'valor_resgate': 'R$50.000,00'
+                        }
+                    ]
+                },
+                {
+                    'ano': 2015,
+                    'mes': 2,
+                    'valores': [
+                        {
+                            'id': 1,
+                            'categoria_titulo': 'LTN',
+                            'valor_venda': 'R$103.750.000,00',
+                            'valor_resgate': 'R$29.640.000,00'
+                        },
+                        {
+                            'id': 500,
+                            'categoria_titulo': 'NTN-C',
+                            'valor_venda': 'R$0,00',
+                            'valor_resgate': 'R$110.000,00'
+                        }
+                    ]
+                }
+            ]
+        })
+
+    def test_compare_with_existing_ids_and_grouped_by_year(self):
+        resp = requests.get('{}/comparar'.format(TestRequestHandler.BASE_URL), params={
+            'ids': [500, 1],
+            'data_inicio': '2014-01',
+            'data_fim': '2014-12',
+            'group_by': 'true'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'success': [
+                {
+                    'ano': 2014,
+                    'valores': [
+                        {
+                            'id': 500,
+                            'categoria_titulo': 'NTN-C',
+                            'valor_venda': 'R$0,00',
+                            'valor_resgate': 'R$10.380.000,00'
+                        },
+                        {
+                            'id': 1,
+                            'categoria_titulo': 'LTN',
+                            'valor_venda': 'R$1.232.350.000,00',
+                            'valor_resgate': 'R$655.480.000,00'
+                        }
+                    ]
+                }
+            ]
+        })
+
+
+class TestMetricsRequestHandler(TestRequestHandler):
+
+    METRICS_URL = 'http://localhost:8000/metrics'
+
+    def test_metrics_after_requests(self):
+        resp = requests.delete('{}/1'.format(TestRequestHandler.BASE_URL))
+
+        self.assertEqual(resp.status_code, 404)
+
+        resp = requests.get(TestMetricsRequestHandler.METRICS_URL)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('http_requests_total{method="DELETE",route="/titulo_tesouro/{titulo_id}",status="404"}', resp.text)
+        self.assertIn('http_request_crud_duration_seconds_count{method="DELETE",route="/titulo_tesouro/{titulo_id}"}',
+                      resp.text)
+        self.assertIn('db_query_duration_seconds_count{query="delete-tesouro-direto"}', resp.text)
+
+    def sample(self, name):
+        resp = requests.get(TestMetricsRequestHandler.METRICS_URL)
+        for line in resp.text.splitlines():
+            if line.startswith(name + ' '):
+                return float(line.split(' ')[1])
+
+        return 0.0
+
+    def test_metrics_of_streamed_responses(self):
+        values = read_xlsx('input-data.xlsx', verbose=False)
+        populate_database(values, verbose=False)
+
+        labels = '{method="GET",route="/titulo_tesouro/resgate/{titulo_id}"}'
+        names = ['http_request_serialization_duration_seconds_sum' + labels,
+                 'http_request_serialization_duration_seconds_count' + labels,
+                 'http_request_crud_duration_seconds_sum' + labels]
+        before = [self.sample(name) for name in names]
+
+        resp = requests.get('{}/resgate/1488'.format(TestRequestHandler.BASE_URL),
+                            headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.text.splitlines()), 124)
+
+        after = [self.sample(name) for name in names]
+
+        self.assertGreater(after[0], before[0])
+        self.assertEqual(after[1], before[1] + 1)
+        self.assertGreater(after[2], before[2])
+
 if __name__ == '__main__':
     unittest.main()
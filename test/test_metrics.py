@@ -0,0 +1,52 @@
+"""Tests for class Metrics of module metrics.
+"""
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def stats(self, pid, checkouts):
+        return {
+            'pid': pid,
+            'idle': 1,
+            'in_use': 0,
+            'checkouts': checkouts,
+            'timeouts': 0,
+            'failed_health_checks': 0
+        }
+
+    def checkouts(self, metrics):
+        return metrics.registry.get_sample_value('db_pool_events_total', {'event': 'checkouts'})
+
+    def test_observe_pool(self):
+        metrics = Metrics()
+
+        metrics.observe_pool(self.stats(100, 5))
+        metrics.observe_pool(self.stats(100, 5))
+        metrics.observe_pool(self.stats(100, 8))
+
+        self.assertEqual(self.checkouts(metrics), 8)
+        self.assertEqual(metrics.registry.get_sample_value('db_pool_connections', {'state': 'idle'}), 1)
+
+    def test_observe_pool_after_fork(self):
+        metrics = Metrics()
+
+        metrics.observe_pool(self.stats(100, 50))
+
+        # a forked worker inherits the metrics, but its pool starts over
+        metrics.observe_pool(self.stats(101, 3))
+        metrics.observe_pool(self.stats(101, 4))
+
+        self.assertEqual(self.checkouts(metrics), 54)
+
+
+if __name__ == '__main__':
+    unittest.main()
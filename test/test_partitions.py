@@ -0,0 +1,67 @@
+"""Tests for module partitions.
+"""
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+from src.basics import SCHEMAS_PATH, TITULO_TESOURO_CATEGORIES, to_period
+from src.partitions import PartitionLayout
+
+
+class TestPartitionLayout(unittest.TestCase):
+
+    def test_not_partitioned(self):
+        layout = PartitionLayout('')
+
+        self.assertFalse(layout.is_partitioned())
+        self.assertEqual(list(layout.partitions()), [])
+        self.assertEqual(layout.partition_of('NTN-B', to_period(2010, 6)), 'tesouro_direto_series')
+
+    def test_partition_of(self):
+        layout = PartitionLayout('category,period', years=10, last_year=2030)
+
+        self.assertEqual(layout.partition_of('NTN-B Principal', to_period(2002, 1)),
+                         'tesouro_direto_series_ntn_b_principal_2002')
+        self.assertEqual(layout.partition_of('NTN-B', to_period(2011, 12)), 'tesouro_direto_series_ntn_b_2002')
+        self.assertEqual(layout.partition_of('NTN-B', to_period(2012, 1)), 'tesouro_direto_series_ntn_b_2012')
+        self.assertEqual(layout.partition_of('NTN-B', to_period(2031, 12)), 'tesouro_direto_series_ntn_b_2022')
+        self.assertEqual(layout.partition_of('NTN-B', to_period(2032, 1)), 'tesouro_direto_series_ntn_b_default')
+
+    def test_every_partition_created(self):
+        layout = PartitionLayout('category,period', years=10, last_year=2030)
+        partitions = list(layout.partitions())
+
+        # each category, its 3 ranges of years and its default
+        self.assertEqual(len(partitions), len(TITULO_TESOURO_CATEGORIES) * 5)
+        names = set([name for (name, _, _, _) in partitions])
+        for category in TITULO_TESOURO_CATEGORIES:
+            for year in [2002, 2020, 2035, 2100]:
+                self.assertIn(layout.partition_of(category, to_period(year, 1)), names)
+
+    def test_schema(self):
+        with open('{}/create-all.sql'.format(SCHEMAS_PATH)) as f:
+            sql = f.read()
+
+        schema = PartitionLayout('').schema(sql)
+        self.assertIn('PRIMARY KEY (id),\n    UNIQUE (category, action, period)', schema)
+        self.assertNotIn('PARTITION', schema)
+        self.assertNotIn('CREATE INDEX', schema)
+
+        schema = PartitionLayout('period').schema(sql)
+        self.assertIn('PRIMARY KEY (id, period)', schema)
+        self.assertIn('UNIQUE (category, action, period)', schema)
+        self.assertIn(') PARTITION BY RANGE (period);', schema)
+
+    def test_invalid_partitioning(self):
+        with self.assertRaises(AssertionError):
+            PartitionLayout('action')
+        with self.assertRaises(AssertionError):
+            PartitionLayout('period', years=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
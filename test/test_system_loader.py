@@ -0,0 +1,149 @@
+"""Tests for the readers and loaders of module system_loader.
+"""
+
+
+import csv
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.environ.get('PROJECT_ROOT_PATH'))
+
+import openpyxl
+import psycopg2
+
+from src.basics import DATABASE_PARAMS, RESOURCES_PATH, to_period
+from src.system_loader import drop_database, create_database, read_xlsx, populate_database, stream_xlsx
+from src.system_loader import copy_into_database, create_database_if_missing, upsert_into_database, stream_csv
+from src.system_loader import text_period
+
+
+class TestStreamCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory.name, 'input-data.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+
+        return os.path.relpath(path, RESOURCES_PATH)
+
+    def test_same_rows_as_xlsx(self):
+        workbook = openpyxl.load_workbook('{}/input-data.xlsx'.format(RESOURCES_PATH), read_only=True)
+        rows = [['' if value is None else value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else value
+                 for value in row] for row in workbook['Planilha1'].iter_rows(values_only=True)]
+        workbook.close()
+
+        filename = self.write_csv(rows)
+        expected = list(stream_xlsx('input-data.xlsx', verbose=False))
+
+        # chunks cut in the middle of the rows
+        for chunk_size in [64, 1000, 16 * 1024 * 1024]:
+            self.assertEqual(list(stream_csv(filename, chunk_size, verbose=False)), expected)
+
+    def test_dates_and_empty_values(self):
+        filename = self.write_csv([
+            ['Período', 'Nome da série:\xa0Resgates - Tesouro Direto - LFT'],
+            ['', 'Unidade:\xa0R$'],
+            ['05/2010', '1.5'],
+            ['01/06/2010', ''],
+            ['2010-07', '3'],
+            ['Fonte: Tesouro Nacional', '']
+        ])
+
+        self.assertEqual(list(stream_csv(filename, verbose=False)), [
+            ('LFT', 'RESGATE', to_period(2010, 5), 1.5),
+            ('LFT', 'RESGATE', to_period(2010, 7), 3.0)
+        ])
+
+    def test_text_period(self):
+        self.assertEqual(text_period('2010-07-01 00:00:00'), to_period(2010, 7))
+        self.assertEqual(text_period('31/12/2010'), to_period(2010, 12))
+        self.assertIsNone(text_period('124'))
+        self.assertIsNone(text_period('Período'))
+
+
+class TestLoaders(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        # the input data with 60 months more
+        workbook = openpyxl.load_workbook('{}/input-data.xlsx'.format(RESOURCES_PATH))
+        worksheet = workbook['Planilha1']
+        for i in range(60):
+            worksheet.append([125 + i, datetime.datetime(2016 + (i + 4) // 12, (i + 4) % 12 + 1, 1)] +
+                             [float(i + j) for j in range(12)])
+
+        path = os.path.join(self.directory.name, 'input-data.xlsx')
+        workbook.save(path)
+        self.filename = os.path.relpath(path, RESOURCES_PATH)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def tearDownClass():
+        drop_database(verbose=False)
+
+    def load(self, load):
+        drop_database(verbose=False)
+        create_database(verbose=False)
+        load()
+
+        conn = psycopg2.connect(**DATABASE_PARAMS)
+        cur = conn.cursor()
+        cur.execute('SELECT category::text, action::text, period, amount FROM tesouro_direto_series')
+        rows = sorted(cur.fetchall())
+        cur.close()
+        conn.close()
+
+        return rows
+
+    def test_streaming_loads_same_rows_as_in_memory(self):
+        in_memory = self.load(lambda: populate_database(read_xlsx(self.filename, verbose=False), verbose=False))
+        streaming = self.load(lambda: copy_into_database(stream_xlsx(self.filename, verbose=False), verbose=False))
+
+        self.assertEqual(len(in_memory), 1488 + 60 * 12)
+        self.assertEqual(streaming, in_memory)
+        self.assertEqual(in_memory[-1][2], to_period(2021, 4))
+
+    def test_incremental_load_does_not_block_readers(self):
+        drop_database(verbose=False)
+        self.assertTrue(create_database_if_missing(verbose=False))
+        populate_database(read_xlsx('input-data.xlsx', verbose=False), verbose=False)
+
+        # a reader in the middle of a transaction, as a streamed response
+        reader = psycopg2.connect(**DATABASE_PARAMS)
+        cur = reader.cursor()
+        cur.execute('SELECT count(*) FROM tesouro_direto_series')
+
+        results = list()
+
+        def load():
+            results.append(create_database_if_missing(verbose=False))
+            results.append(upsert_into_database(stream_xlsx(self.filename, verbose=False), chunk_size=100,
+                                                verbose=False))
+
+        thread = threading.Thread(target=load)
+        thread.start()
+        thread.join(10)
+        finished = not thread.is_alive()
+
+        reader.rollback()
+        reader.close()
+        thread.join()
+
+        self.assertTrue(finished)
+        self.assertEqual(results, [False, {'inserted': 720, 'updated': 0, 'unchanged': 1488}])
+
+
+if __name__ == '__main__':
+    unittest.main()